@@ -0,0 +1,46 @@
+"""
+Switch file foreign keys to ON DELETE CASCADE and add the is_deleting flags.
+Run this script once to update existing PostgreSQL databases.
+"""
+import logging
+import app_logging
+from database import engine
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# (table, column, referenced table)
+FOREIGN_KEYS = [
+    ("shipments", "file_id", "uploaded_files"),
+    ("payment_records", "file_id", "payment_files"),
+    ("reconciliation_results", "payment_file_id", "payment_files"),
+    ("client_ledger", "file_id", "payment_files"),
+]
+
+def add_cascade_deletes():
+    with engine.connect() as conn:
+        try:
+            for table, column, referenced in FOREIGN_KEYS:
+                constraint = f"{table}_{column}_fkey"
+                conn.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {constraint}"))
+                conn.execute(text(f"""
+                    ALTER TABLE {table}
+                    ADD CONSTRAINT {constraint} FOREIGN KEY ({column})
+                    REFERENCES {referenced} (id) ON DELETE CASCADE
+                """))
+                logger.info(f"✅ {constraint} now cascades deletes")
+
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_shipments_file_id ON shipments (file_id)"))
+            logger.info("✅ Index on shipments.file_id created")
+
+            for table in ("uploaded_files", "payment_files"):
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS is_deleting BOOLEAN DEFAULT FALSE"))
+                logger.info(f"✅ Column is_deleting added to {table}")
+
+            conn.commit()
+        except Exception as e:
+            logger.exception(f"Error: {e}")
+
+if __name__ == "__main__":
+    app_logging.configure(default_format="text")
+    add_cascade_deletes()
@@ -0,0 +1,26 @@
+"""
+Add the index on payment_records."العميل" used by client settlement statements.
+Run this script once to update existing databases.
+"""
+import logging
+import app_logging
+from database import engine
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+def add_client_name_index():
+    with engine.connect() as conn:
+        try:
+            conn.execute(text("""
+                CREATE INDEX IF NOT EXISTS "ix_payment_records_العميل"
+                ON payment_records ("العميل");
+            """))
+            conn.commit()
+            logger.info("✅ Index on 'العميل' created successfully!")
+        except Exception as e:
+            logger.exception(f"Error: {e}")
+
+if __name__ == "__main__":
+    app_logging.configure(default_format="text")
+    add_client_name_index()
@@ -2,9 +2,13 @@
 Add the 'نوع السعر' column to the shipments table.
 Run this script once to update the database schema.
 """
+import logging
+import app_logging
 from database import engine
 from sqlalchemy import text
 
+logger = logging.getLogger(__name__)
+
 def add_price_type_column():
     with engine.connect() as conn:
         try:
@@ -14,9 +18,10 @@ def add_price_type_column():
                 ADD COLUMN IF NOT EXISTS "نوع السعر" VARCHAR;
             """))
             conn.commit()
-            print("✅ Column 'نوع السعر' added successfully!")
+            logger.info("✅ Column 'نوع السعر' added successfully!")
         except Exception as e:
-            print(f"Error: {e}")
+            logger.exception(f"Error: {e}")
 
 if __name__ == "__main__":
+    app_logging.configure(default_format="text")
     add_price_type_column()
@@ -0,0 +1,43 @@
+"""
+Add payment_daily_rollups.rollup_key with its unique index, which payment uploads
+upsert on. Run this script once to update existing databases.
+
+The rollups are rebuilt from payment_records on the way, which also merges the
+duplicate rows that concurrent uploads could create before.
+"""
+import logging
+import app_logging
+from database import engine, SessionLocal
+from rollups import rebuild_rollups
+from sqlalchemy import inspect, text
+
+logger = logging.getLogger(__name__)
+
+def add_rollup_keys():
+    logger.info("⏳ Connecting to database...")
+    db = SessionLocal()
+    try:
+        columns = {column["name"] for column in inspect(engine).get_columns("payment_daily_rollups")}
+        if "rollup_key" in columns:
+            logger.info("ℹ️ Column 'rollup_key' already exists")
+        else:
+            db.execute(text("ALTER TABLE payment_daily_rollups ADD COLUMN rollup_key VARCHAR"))
+            logger.info("✅ Column 'rollup_key' added")
+
+        groups = rebuild_rollups(db)
+        logger.info(f"✅ Rebuilt {groups} rollup rows")
+        db.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_payment_daily_rollups_rollup_key "
+            "ON payment_daily_rollups (rollup_key)"
+        ))
+        db.commit()
+        logger.info("🎉 SUCCESS: payment rollups have unique keys")
+    except Exception as e:
+        db.rollback()
+        logger.exception(f"❌ FATAL ERROR: {str(e)}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    app_logging.configure(default_format="text")
+    add_rollup_keys()
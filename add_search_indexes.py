@@ -0,0 +1,36 @@
+"""
+Add trigram indexes for the substring searches (?search=) on shipments and payments.
+PostgreSQL only (needs the pg_trgm extension); on the SQLite stand-in this does nothing.
+"""
+import logging
+import app_logging
+from database import engine, Shipment, PaymentRecord
+from dialects import get_ops
+
+logger = logging.getLogger(__name__)
+
+SEARCH_COLUMNS = [
+    Shipment.shipment_code, Shipment.client_name, Shipment.recipient_name,
+    PaymentRecord.code, PaymentRecord.recipient_name, PaymentRecord.sender_name,
+    PaymentRecord.client_name, PaymentRecord.reference_number,
+]
+
+def add_search_indexes():
+    logger.info("⏳ Connecting to database...")
+    try:
+        ops = get_ops(engine)
+        if ops.name != "postgresql":
+            logger.info(f"ℹ️ {ops.name} has no trigram indexes, searches will scan")
+            return
+
+        logger.info("⏳ Creating trigram indexes...")
+        with engine.begin() as conn:
+            ops.ensure_search_indexes(conn, [column.property.columns[0] for column in SEARCH_COLUMNS])
+        logger.info(f"🎉 SUCCESS: {len(SEARCH_COLUMNS)} search indexes in place!")
+
+    except Exception as e:
+        logger.exception(f"❌ FATAL ERROR: {str(e)}")
+
+if __name__ == "__main__":
+    app_logging.configure(default_format="text")
+    add_search_indexes()
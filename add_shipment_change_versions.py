@@ -0,0 +1,37 @@
+"""
+Add shipments.change_version, its index and the tables behind /shipments/changes
+(shipment_tombstones, change_counter). Run this script once to update existing databases.
+
+Existing shipments get version 0, so a client's first sync (since=0) returns them.
+"""
+import logging
+import app_logging
+from database import engine, create_tables
+from sqlalchemy import inspect, text
+
+logger = logging.getLogger(__name__)
+
+def add_shipment_change_versions():
+    logger.info("⏳ Connecting to database...")
+    try:
+        create_tables()  # shipment_tombstones, change_counter
+
+        columns = {column["name"] for column in inspect(engine).get_columns("shipments")}
+        with engine.begin() as conn:
+            if "change_version" in columns:
+                logger.info("ℹ️ Column 'change_version' already exists")
+            else:
+                conn.execute(text("ALTER TABLE shipments ADD COLUMN change_version BIGINT NOT NULL DEFAULT 0"))
+                logger.info("✅ Column 'change_version' added")
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_shipments_change_version ON shipments (change_version, id)"
+            ))
+            logger.info("✅ Index on 'change_version' created")
+
+        logger.info("🎉 SUCCESS: shipments can be synced with /shipments/changes")
+    except Exception as e:
+        logger.exception(f"❌ FATAL ERROR: {str(e)}")
+
+if __name__ == "__main__":
+    app_logging.configure(default_format="text")
+    add_shipment_change_versions()
@@ -0,0 +1,40 @@
+"""
+Make shipments."الكود" unique, which uploads rely on to skip existing codes.
+Run this script once to update existing databases.
+
+Codes that were inserted twice (concurrent uploads of overlapping sheets) keep
+their oldest shipment; the newer copies and their status history are deleted.
+"""
+import logging
+import app_logging
+import http_cache
+from database import engine
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+def add_unique_shipment_codes():
+    logger.info("⏳ Connecting to database...")
+    try:
+        with engine.begin() as conn:
+            duplicates = conn.execute(text("""
+                DELETE FROM shipments
+                WHERE "الكود" IS NOT NULL AND id NOT IN (
+                    SELECT min(id) FROM shipments WHERE "الكود" IS NOT NULL GROUP BY "الكود"
+                )
+            """)).rowcount
+            logger.info(f"✅ Removed {duplicates} duplicate shipments")
+
+            conn.execute(text('DROP INDEX IF EXISTS "ix_shipments_الكود"'))
+            conn.execute(text('CREATE UNIQUE INDEX "ix_shipments_الكود" ON shipments ("الكود")'))
+            logger.info("✅ Unique index on 'الكود' created")
+
+        if duplicates:
+            http_cache.bump(http_cache.SHIPMENTS)
+        logger.info("🎉 SUCCESS: shipment codes are unique")
+    except Exception as e:
+        logger.exception(f"❌ FATAL ERROR: {str(e)}")
+
+if __name__ == "__main__":
+    app_logging.configure(default_format="text")
+    add_unique_shipment_codes()
@@ -0,0 +1,204 @@
+"""
+Columnar copy of the payment records for ad-hoc finance analytics.
+
+Every ingested payment file is also written as one Parquet file to a dataset
+partitioned by upload month:
+
+    ANALYTICS_DIR/payments/upload_month=2026-03/file_42.parquet
+
+Columns are the PaymentRecord attribute names (English), plus file_id. The
+/analytics endpoints run the whitelisted aggregate queries in QUERIES over that
+dataset with DuckDB (vectorized, in-process), so these scans never touch the
+transactional database. Filters are bound parameters; month filters prune
+whole partitions.
+
+Files are written after the upload commits and removed after the payment file
+is deleted; export_payment_analytics.py (re)builds them from the database.
+"""
+import glob
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from sqlalchemy import DateTime, Float, Integer, String
+from constants import YES_VALUES
+from database import PaymentRecord
+import lookups
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_DIR = os.getenv("ANALYTICS_DIR", "analytics")
+PAYMENTS_DATASET = os.path.join(ANALYTICS_DIR, "payments")
+MAX_RESULT_ROWS = 5000
+
+# Stored PaymentRecord columns except the surrogate key, by attribute name
+RECORD_COLUMNS = [attribute for attribute in PaymentRecord.__mapper__.column_attrs if attribute.key != "id"]
+# Dataset columns: the same, with dictionary-encoded ids decoded to their text
+COLUMNS = {
+    attribute.key[:-len("_id")] if attribute.key[:-len("_id")] in lookups.FIELDS else attribute.key:
+        String() if attribute.key[:-len("_id")] in lookups.FIELDS else attribute.columns[0].type
+    for attribute in RECORD_COLUMNS
+}
+
+_YES = ", ".join(f"'{value}'" for value in YES_VALUES)
+
+# name -> (description, SQL over the `payments` view with a {where} placeholder)
+QUERIES = {
+    "fees_by_branch_month": (
+        "Records, package value and fees per branch and record month",
+        """
+        SELECT branch, strftime(date, '%Y-%m') AS month, count(*) AS records,
+               sum(package_value) AS package_value, sum(fees) AS fees,
+               sum(due_fees) AS due_fees, sum(collected_fees) AS collected_fees
+        FROM payments {where}
+        GROUP BY ALL ORDER BY month, branch
+        """,
+    ),
+    "return_rate_by_agent": (
+        "Delivered, returned and cancelled records and the return rate per shipping agent",
+        """
+        SELECT shipping_agent, count(*) AS records,
+               count(*) FILTER (WHERE status = 'تم التسليم') AS delivered,
+               count(*) FILTER (WHERE status = 'مرتجع') AS returned,
+               count(*) FILTER (WHERE status = 'ملغى') AS cancelled,
+               round(count(*) FILTER (WHERE status = 'مرتجع') / count(*), 4) AS return_rate
+        FROM payments {where}
+        GROUP BY ALL ORDER BY records DESC
+        """,
+    ),
+    "collections_by_client": (
+        "Amount due, collected and paid out per client",
+        f"""
+        SELECT client_name, count(*) AS records, sum(amount_due) AS amount_due,
+               sum(amount_due) FILTER (WHERE is_collected IN ({_YES})) AS collected_amount,
+               sum(amount_due) FILTER (WHERE paid_to_client IN ({_YES})) AS paid_amount
+        FROM payments {{where}}
+        GROUP BY ALL ORDER BY amount_due DESC NULLS LAST
+        """,
+    ),
+    "status_by_month": (
+        "Records and value per status and record month",
+        """
+        SELECT strftime(date, '%Y-%m') AS month, status, count(*) AS records,
+               sum(package_value) AS package_value
+        FROM payments {where}
+        GROUP BY ALL ORDER BY month, records DESC
+        """,
+    ),
+}
+
+# filter parameter -> SQL condition on the dataset
+FILTERS = {
+    "from_month": "upload_month >= ?",
+    "to_month": "upload_month <= ?",
+    "branch": "branch = ?",
+    "client": "client_name = ?",
+}
+
+
+def _arrow_type(column_type):
+    import pyarrow as pa
+
+    if isinstance(column_type, DateTime):
+        return pa.timestamp("us")
+    if isinstance(column_type, Float):
+        return pa.float64()
+    if isinstance(column_type, Integer):
+        return pa.int64()
+    return pa.string()
+
+
+def _cell(record, name, column_type):
+    value = record.get(name)
+    if name in lookups.FIELDS and f"{name}_id" in record:
+        value = lookups.decode(record[f"{name}_id"])
+    if value is None:
+        return None
+    if isinstance(column_type, (DateTime, Float, Integer)):
+        return value
+    # Excel gives numbers for codes like postal codes; the dataset keeps text
+    return str(value)
+
+
+def _file_paths(file_id: int):
+    return glob.glob(os.path.join(PAYMENTS_DATASET, "upload_month=*", f"file_{file_id}.parquet"))
+
+
+def write_payment_file(file_id: int, upload_date: datetime, records: list):
+    """
+    Writes one payment file's records to the dataset: dicts keyed by attribute
+    name, with lookups.FIELDS either as text or as encoded `<field>_id`.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(name, _arrow_type(column_type)) for name, column_type in COLUMNS.items()])
+    table = pa.table(
+        {name: [_cell(record, name, column_type) for record in records] for name, column_type in COLUMNS.items()},
+        schema=schema,
+    )
+    directory = os.path.join(PAYMENTS_DATASET, f"upload_month={upload_date:%Y-%m}")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"file_{file_id}.parquet")
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, path)  # queries never see a partial file
+    return path
+
+
+def archive_payment_file(file_id: int, upload_date: datetime, records: list, on_done=None):
+    """write_payment_file() for BackgroundTasks: the upload has committed, so failures are only logged."""
+    try:
+        write_payment_file(file_id, upload_date, records)
+    except Exception:
+        logger.exception("failed to archive payment file", extra={"file_id": file_id})
+        return
+    if on_done:
+        on_done()
+
+
+def remove_payment_file(file_id: int, on_done=None):
+    for path in _file_paths(file_id):
+        os.remove(path)
+    if on_done:
+        on_done()
+
+
+def has_payment_file(file_id: int):
+    return bool(_file_paths(file_id))
+
+
+def run_query(name: str, **filters):
+    """Runs a QUERIES entry with the given FILTERS; returns columns and rows."""
+    import duckdb
+
+    description, sql = QUERIES[name]
+    conditions = [FILTERS[key] for key, value in filters.items() if value is not None]
+    parameters = [value for value in filters.values() if value is not None]
+    started = time.perf_counter()
+
+    if not glob.glob(os.path.join(PAYMENTS_DATASET, "upload_month=*", "*.parquet")):
+        return {"query": name, "description": description, "columns": [], "rows": [], "count": 0, "seconds": 0.0}
+
+    connection = duckdb.connect()
+    try:
+        dataset = os.path.join(PAYMENTS_DATASET, "*", "*.parquet").replace("'", "''")
+        connection.execute(
+            f"CREATE VIEW payments AS SELECT * FROM read_parquet('{dataset}', hive_partitioning = true)"
+        )
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        result = connection.execute(f"{sql.format(where=where)} LIMIT {MAX_RESULT_ROWS}", parameters)
+        columns = [column[0] for column in result.description]
+        rows = [dict(zip(columns, row)) for row in result.fetchall()]
+    finally:
+        connection.close()
+
+    return {
+        "query": name,
+        "description": description,
+        "columns": columns,
+        "rows": rows,
+        "count": len(rows),
+        "seconds": round(time.perf_counter() - started, 4),
+    }
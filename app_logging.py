@@ -0,0 +1,95 @@
+"""
+Structured, non-blocking logging for the API and the maintenance scripts.
+
+`configure()` routes every logger through a QueueHandler: callers only put the
+record on an in-memory queue, and a QueueListener thread formats and writes it.
+Records are one JSON object per line by default (LOG_FORMAT=text for humans),
+and anything passed as `extra={...}` becomes a field of that object:
+
+    logger.info("phase done", extra={"phase": "insert", "file_id": 7, "rows": 5000})
+
+Env: LOG_LEVEL (default INFO), LOG_FORMAT (json | text).
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; everything else on a record came from `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+_listener = None
+
+
+def _extra_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Message followed by its extra fields as key=value."""
+
+    def format(self, record):
+        line = record.getMessage()
+        fields = _extra_fields(record)
+        if fields:
+            line += "  " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def configure(default_format: str = "json"):
+    """Installs the queue handler on the root logger (once per process)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    log_format = os.getenv("LOG_FORMAT", default_format).lower()
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(TextFormatter() if log_format == "text" else JsonFormatter())
+
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(records)]
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+    _listener = QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown)
+
+
+def reconfigure_after_fork():
+    """
+    In a forked child (a gunicorn worker of a preloading master): the parent's
+    writer thread wasn't copied, so records would only pile up in the queue.
+    Starts the child's own.
+    """
+    global _listener
+    _listener = None
+    configure()
+
+
+def shutdown():
+    """Flushes queued records and stops the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,80 @@
+"""
+Async database access for the read endpoints.
+
+Read handlers are `async def` and take an `AsyncSession` (asyncpg driver) via the
+`get_async_db` dependency (aiosqlite on the SQLite stand-in), so they don't compete with uploads for Starlette's
+threadpool. The engine shares the pool settings from database.py.
+"""
+import asyncio
+import logging
+import os
+from contextlib import AsyncExitStack, ExitStack
+from sqlalchemy import select, func, event, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from database import DATABASE_URL, POOL_OPTIONS, IS_SQLITE, set_sqlite_pragmas, engine
+
+logger = logging.getLogger(__name__)
+
+# Connections each engine opens at worker startup (see warm_up_pools)
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", "2"))
+
+
+def _async_url(url: str):
+    """Maps the sync DATABASE_URL onto its async driver."""
+    if url.startswith("sqlite"):
+        return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+
+    for prefix in ("postgresql+psycopg2://", "postgresql://"):
+        if url.startswith(prefix):
+            url = "postgresql+asyncpg://" + url[len(prefix):]
+            break
+    # asyncpg calls libpq's sslmode "ssl"
+    return url.replace("sslmode=", "ssl=")
+
+
+async_engine = create_async_engine(_async_url(DATABASE_URL), **POOL_OPTIONS)
+if IS_SQLITE:
+    event.listen(async_engine.sync_engine, "connect", set_sqlite_pragmas)
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+
+async def get_async_db():
+    """FastAPI dependency: one AsyncSession per request, closed afterwards."""
+    async with AsyncSessionLocal() as session:
+        yield session
+
+
+async def count_rows(db: AsyncSession, statement):
+    """Row count of a select statement (ignoring its ORDER BY / LIMIT)."""
+    subquery = statement.order_by(None).subquery()
+    return (await db.execute(select(func.count()).select_from(subquery))).scalar_one()
+
+
+def _warm_up_sync_pool(connections: int):
+    with ExitStack() as stack:
+        for _ in range(connections):
+            stack.enter_context(engine.connect()).execute(text("SELECT 1"))
+
+
+async def warm_up_pools(connections: int = DB_POOL_WARMUP):
+    """
+    Opens `connections` connections on the async and the sync engine at once and
+    returns them to their pools, so the first requests of a worker don't pay for
+    connecting (TLS, auth, SQLite pragmas). Failures are only logged.
+    """
+    if connections <= 0:
+        return
+    try:
+        async with AsyncExitStack() as stack:
+            for _ in range(connections):
+                connection = await stack.enter_async_context(async_engine.connect())
+                await connection.execute(text("SELECT 1"))
+        await asyncio.to_thread(_warm_up_sync_pool, connections)
+    except Exception:
+        logger.exception("connection pool warm-up failed")
@@ -0,0 +1,46 @@
+"""
+Seed the status history with each shipment's current status.
+Run this script once after deploying shipment_status_events; shipments that
+already have history are skipped.
+"""
+import logging
+import app_logging
+from database import SessionLocal, Shipment, UploadedFile, ShipmentStatusEvent, create_tables
+from constants import STATUS_CODES, UNKNOWN_STATUS_CODE
+from sqlalchemy import select, insert, case, func
+
+logger = logging.getLogger(__name__)
+
+def backfill_status_history():
+    create_tables()
+    db = SessionLocal()
+    try:
+        logger.info("⏳ Backfilling status history...")
+        status_code = case(
+            *[(Shipment.status == status, code) for status, code in STATUS_CODES.items()],
+            else_=UNKNOWN_STATUS_CODE
+        )
+        has_history = select(ShipmentStatusEvent.id)\
+            .where(ShipmentStatusEvent.shipment_id == Shipment.id)\
+            .exists()
+        rows = select(
+            Shipment.id,
+            status_code,
+            func.coalesce(UploadedFile.upload_date, func.current_timestamp())
+        ).join(UploadedFile, UploadedFile.id == Shipment.file_id, isouter=True)\
+            .where(~has_history)
+
+        inserted = db.execute(
+            insert(ShipmentStatusEvent).from_select(["shipment_id", "status_code", "changed_at"], rows)
+        ).rowcount
+        db.commit()
+        logger.info(f"✅ Added {inserted} status events")
+    except Exception as e:
+        db.rollback()
+        logger.exception(f"❌ FATAL ERROR: {str(e)}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    app_logging.configure(default_format="text")
+    backfill_status_history()
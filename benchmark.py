@@ -0,0 +1,221 @@
+"""
+Benchmark harness: ingest throughput, peak memory and read latency on the SQLite stand-in.
+
+Uploads a synthetic shipment workbook and payment workbook (synthetic_data.py)
+into a fresh SQLite database, then calls every read endpoint `--iterations` times
+with the response cache cleared, measuring in-process (no network) latency.
+
+Each run appends one JSON line to BENCH_RESULTS_FILE (bench_results.jsonl) with
+the git commit, the parameters and the results, and prints the change against the
+last run with the same parameters, so results can be tracked across commits.
+
+Usage:
+    python benchmark.py --rows 10000 --iterations 30
+    python benchmark.py --rows 100000 --duplicates 0.01 --nan 0.02 --database-url sqlite:///bench.db
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(REPO_DIR, ".bench_data")  # generated workbooks, reused across runs
+BENCH_RESULTS_FILE = os.path.join(REPO_DIR, "bench_results.jsonl")
+
+# Read endpoints; {placeholders} are filled from the seeded data
+READ_ENDPOINTS = [
+    "/shipments?limit=50",
+    "/shipments?limit=50&search=GR0000",
+    "/shipments/days",
+    "/shipments/by-day?date={day}",
+    "/shipments/search?query={client}",
+    "/shipments/status-aging",
+    "/shipments/{code}/history",
+    "/upload/files",
+    "/shipments/file/{shipment_file}?limit=50",
+    "/payments/files",
+    "/payments/files/{payment_file}/data?limit=50",
+    "/payments/files/{payment_file}/data?limit=50&search={client}",
+    "/payments/summary/month-to-date?month={month}",
+    "/payments/summary/trend?start={first_day}&end={last_day}",
+    "/payments/summary/trend?start={first_day}&end={last_day}&group_by=month",
+    "/clients/settlements",
+    "/clients/settlements/{client}",
+    "/payments/files/{payment_file}/reconciliation",
+    "/reconciliation/missing-payments",
+]
+
+
+def _git(*args):
+    try:
+        return subprocess.run(["git", *args], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _workbook(kind, options):
+    import synthetic_data
+    return synthetic_data.cached_workbook(DATA_DIR, kind, options.rows, options.seed, options.duplicates, options.nan)
+
+
+def _upload(client, route, path):
+    with open(path, "rb") as f:
+        content = f.read()
+    start = time.perf_counter()
+    response = client.post(route, files={"file": (os.path.basename(path), content, "application/octet-stream")})
+    seconds = time.perf_counter() - start
+    body = response.json()
+    if response.status_code != 200 or body.get("status") == "error":
+        raise RuntimeError(f"{route} failed: {body}")
+    rows = body["rows_inserted"]
+    return body, {"rows": rows, "seconds": round(seconds, 3), "rows_per_sec": round(rows / seconds, 1)}
+
+
+def run(options):
+    shipments_path = _workbook("shipments", options)
+    payments_path = _workbook("payments", options)
+
+    # Fresh database and scratch directories, configured before the app is imported
+    workdir = tempfile.mkdtemp(prefix="gold_road_bench_")
+    os.environ["DATABASE_URL"] = options.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ["DATA_VERSION_DIR"] = os.path.join(workdir, "versions")
+    os.environ["MAX_FILE_SIZE_MB"] = "1024"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.chdir(workdir)
+    sys.path.insert(0, REPO_DIR)
+
+    from fastapi.testclient import TestClient
+    from main import app
+    import http_cache
+    import synthetic_data
+
+    results = {"ingest": {}, "reads": {}}
+    with TestClient(app) as client:
+        print("⏳ Ingesting...")
+        shipments, results["ingest"]["shipments"] = _upload(client, "/upload", shipments_path)
+        payments, results["ingest"]["payments"] = _upload(client, "/payments/upload", payments_path)
+        results["peak_rss_mb_after_ingest"] = _peak_rss_mb()
+        client.post(f"/payments/files/{payments['file_id']}/reconcile")
+
+        sample = client.get("/shipments?limit=1").json()["data"][0]
+        first_day = synthetic_data.START_DATE.date()
+        values = {
+            "shipment_file": shipments["file_id"],
+            "payment_file": payments["file_id"],
+            "code": sample["الكود"],
+            "client": sample["العميل"],
+            "day": str(sample["التاريخ"])[:10],
+            "month": first_day.strftime("%Y-%m"),
+            "first_day": first_day,
+            "last_day": (synthetic_data.START_DATE + synthetic_data.pd.Timedelta(days=synthetic_data.DATE_RANGE_DAYS)).date(),
+        }
+
+        print(f"⏳ Timing {len(READ_ENDPOINTS)} read endpoints x {options.iterations}...")
+        for endpoint in READ_ENDPOINTS:
+            url = endpoint.format(**values)
+            timings = []
+            for i in range(options.warmup + options.iterations):
+                http_cache.clear()  # time the handler, not the response cache
+                start = time.perf_counter()
+                response = client.get(url)
+                elapsed = (time.perf_counter() - start) * 1000
+                if response.status_code != 200:
+                    raise RuntimeError(f"GET {url} returned {response.status_code}: {response.text[:200]}")
+                if i >= options.warmup:
+                    timings.append(elapsed)
+            results["reads"][endpoint] = {
+                "p50_ms": round(statistics.median(timings), 2),
+                "p99_ms": round(_percentile(timings, 99), 2),
+                "mean_ms": round(statistics.fmean(timings), 2),
+            }
+    results["peak_rss_mb"] = _peak_rss_mb()
+    return results
+
+
+def _previous(params):
+    if not os.path.exists(BENCH_RESULTS_FILE):
+        return None
+    previous = None
+    with open(BENCH_RESULTS_FILE, encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry["params"] == params:
+                previous = entry
+    return previous
+
+
+def _change(new, old, lower_is_better=True):
+    if not old:
+        return ""
+    percent = (new - old) / old * 100
+    better = percent < 0 if lower_is_better else percent > 0
+    return f" ({percent:+.1f}% {'✅' if better else '⚠️'})" if abs(percent) >= 5 else ""
+
+
+def report(entry, previous):
+    prev = previous["results"] if previous else None
+    if previous:
+        print(f"\n📊 Compared with {previous['commit'][:8]} ({previous['recorded_at']})")
+    results = entry["results"]
+    for kind, ingest in results["ingest"].items():
+        old = prev["ingest"][kind]["rows_per_sec"] if prev else None
+        print(f"  ingest {kind:<10} {ingest['rows']:>8} rows  {ingest['rows_per_sec']:>10.0f} rows/s"
+              f"{_change(ingest['rows_per_sec'], old, lower_is_better=False)}")
+    old = prev["peak_rss_mb"] if prev else None
+    print(f"  peak RSS {results['peak_rss_mb']} MB{_change(results['peak_rss_mb'], old)}")
+    for endpoint, timing in results["reads"].items():
+        old = prev["reads"].get(endpoint, {}).get("p50_ms") if prev else None
+        print(f"  {endpoint:<62} p50 {timing['p50_ms']:>8.2f} ms  p99 {timing['p99_ms']:>8.2f} ms"
+              f"{_change(timing['p50_ms'], old)}")
+
+
+if __name__ == "__main__":
+    arguments = argparse.ArgumentParser(description="Benchmark ingest and read endpoints on SQLite")
+    arguments.add_argument("--rows", type=int, default=10000, help="rows per workbook (1k to 1M)")
+    arguments.add_argument("--seed", type=int, default=42)
+    arguments.add_argument("--duplicates", type=float, default=0.01)
+    arguments.add_argument("--nan", type=float, default=0.02)
+    arguments.add_argument("--iterations", type=int, default=30)
+    arguments.add_argument("--warmup", type=int, default=3)
+    arguments.add_argument("--database-url", help="defaults to a fresh SQLite file")
+    arguments.add_argument("--no-save", action="store_true", help="don't append to bench_results.jsonl")
+    options = arguments.parse_args()
+
+    params = {
+        "rows": options.rows, "seed": options.seed, "duplicates": options.duplicates,
+        "nan": options.nan, "iterations": options.iterations,
+        "database": "sqlite" if not options.database_url else options.database_url.split(":")[0],
+    }
+    previous = _previous(params)
+    entry = {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "recorded_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "params": params,
+        "results": run(options),
+    }
+    report(entry, previous)
+    if not options.no_save:
+        with open(BENCH_RESULTS_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+        print(f"\n✅ Saved to {BENCH_RESULTS_FILE}")
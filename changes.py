@@ -0,0 +1,87 @@
+"""
+Change versions for delta sync of shipments (`/shipments/changes`).
+
+Every transaction that inserts, updates or deletes shipments takes one change
+version (`version(db)`) and stamps it on the rows it writes; deleted shipments
+leave a tombstone with it. A client keeps the `next_since` cursor of its last
+sync and asks only for what changed after it: a range scan of the
+(change_version, id) indexes, so a sync costs what changed, not the table size.
+
+Versions come from the dialect (dialects.py): the transaction id on PostgreSQL,
+a counter row on SQLite. Transactions can commit in a different order than they
+took their versions, so reads stop at the horizon - the version below which
+every transaction has finished - and a change committed late is never skipped.
+"""
+from sqlalchemy import literal, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from database import Shipment, ShipmentTombstone
+from dialects import get_ops
+
+MAX_CHANGES = 5000
+
+
+def version(db: Session):
+    """This transaction's change version. Call once per transaction, inside it."""
+    return db.execute(get_ops(db).change_version()).scalar_one()
+
+
+def record_deletes(db: Session, shipment_ids, change_version: int):
+    """
+    Tombstones for shipments about to be deleted (`shipment_ids`: ids or a
+    select of them), with one INSERT ... SELECT. Runs inside the caller's transaction.
+    """
+    rows = select(Shipment.id, Shipment.shipment_code, literal(change_version))\
+        .where(Shipment.id.in_(shipment_ids))
+    statement = get_ops(db).insert(ShipmentTombstone).from_select(
+        ["shipment_id", "shipment_code", "change_version"], rows
+    )
+    # SQLite can reuse the id of a deleted shipment
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[ShipmentTombstone.shipment_id],
+        set_={"shipment_code": statement.excluded.shipment_code,
+              "change_version": statement.excluded.change_version}
+    ))
+
+
+def parse_cursor(since: str):
+    """`"<version>.<id>"` (or just `"<version>"`) -> (version, id); ValueError if malformed."""
+    version_part, _, id_part = since.partition(".")
+    return int(version_part), int(id_part or 0)
+
+
+async def read_changes(db: AsyncSession, since: str, limit: int):
+    """
+    Shipments changed after the `since` cursor, oldest first, as
+    (upserted shipments and deleted codes merged in version order, next cursor, has_more).
+    """
+    after = tuple_(*parse_cursor(since))
+    horizon = (await db.execute(get_ops(db).change_horizon())).scalar_one()
+
+    upserted = (await db.execute(
+        select(Shipment)
+        .where(tuple_(Shipment.change_version, Shipment.id) > after, Shipment.change_version < horizon)
+        .order_by(Shipment.change_version, Shipment.id)
+        .limit(limit + 1)
+    )).scalars().all()
+    deleted = (await db.execute(
+        select(ShipmentTombstone)
+        .where(tuple_(ShipmentTombstone.change_version, ShipmentTombstone.shipment_id) > after,
+               ShipmentTombstone.change_version < horizon)
+        .order_by(ShipmentTombstone.change_version, ShipmentTombstone.shipment_id)
+        .limit(limit + 1)
+    )).scalars().all()
+
+    merged = sorted(
+        [((s.change_version, s.id), s) for s in upserted] +
+        [((t.change_version, t.shipment_id), t) for t in deleted],
+        key=lambda change: change[0]
+    )
+    has_more = len(merged) > limit
+    merged = merged[:limit]
+    if has_more:
+        next_version, next_id = merged[-1][0]
+    else:
+        # Everything below the horizon has been returned
+        next_version, next_id = horizon, 0
+    return [change for _, change in merged], f"{next_version}.{next_id}", has_more
@@ -2,28 +2,40 @@
 Clear all shipments data and re-upload fresh.
 This allows the نوع السعر column to be populated.
 """
-from database import SessionLocal, Shipment, UploadedFile
+import logging
+import app_logging
+from database import SessionLocal, Shipment, UploadedFile, ShipmentStatusEvent
+import storage
+import changes
+
+logger = logging.getLogger(__name__)
 
 def clear_all_data():
     db = SessionLocal()
     try:
-        # Delete all shipments
+        # Delete status history, then all shipments
+        db.query(ShipmentStatusEvent).delete()
+        # Tombstones, so delta sync clients (/shipments/changes) drop them too
+        changes.record_deletes(db, db.query(Shipment.id), changes.version(db))
         deleted_shipments = db.query(Shipment).delete()
         # Delete all upload records
         deleted_files = db.query(UploadedFile).delete()
+        # Their stored workbooks are now unreferenced, storage gc deletes them later
+        storage.recount(db)
         db.commit()
-        print(f"✅ Deleted {deleted_shipments} shipments")
-        print(f"✅ Deleted {deleted_files} upload records")
-        print("\nNow re-upload your Excel file to populate نوع السعر!")
+        logger.info(f"✅ Deleted {deleted_shipments} shipments")
+        logger.info(f"✅ Deleted {deleted_files} upload records")
+        logger.info("Now re-upload your Excel file to populate نوع السعر!")
     except Exception as e:
         db.rollback()
-        print(f"Error: {e}")
+        logger.exception(f"Error: {e}")
     finally:
         db.close()
 
 if __name__ == "__main__":
+    app_logging.configure(default_format="text")
     confirm = input("This will DELETE ALL data. Type 'yes' to confirm: ")
     if confirm.lower() == 'yes':
         clear_all_data()
     else:
-        print("Cancelled.")
+        logger.info("Cancelled.")
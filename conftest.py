@@ -0,0 +1,34 @@
+"""
+Tests run hermetically against the in-memory SQLite stand-in unless DATABASE_URL
+is already set, with the HTTP cache's data versions and request profiles in
+temporary directories.
+"""
+import os
+import tempfile
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("DATA_VERSION_DIR", tempfile.mkdtemp(prefix="gold_road_versions_"))
+os.environ.setdefault("PROFILING_TOKEN", "test-profile-token")
+os.environ.setdefault("PROFILE_DIR", tempfile.mkdtemp(prefix="gold_road_profiles_"))
+os.environ.setdefault("STORAGE_DIR", tempfile.mkdtemp(prefix="gold_road_storage_"))
+os.environ.setdefault("ANALYTICS_DIR", tempfile.mkdtemp(prefix="gold_road_analytics_"))
+# TestClient returns a response only once it has ended, so /events streams must end
+os.environ.setdefault("EVENTS_STREAM_SECONDS", "0.5")
+
+import pytest
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database_schema():
+    from database import create_tables
+    from query_budget import install_row_counting, default_engines
+    # Before the first connection is opened, so every SQLite connection counts fetched rows
+    install_row_counting(*default_engines())
+    create_tables()
+
+
+@pytest.fixture
+def query_budget():
+    """`with query_budget(max_queries=2, max_rows=100): client.get(...)`"""
+    from query_budget import QueryBudget
+    return QueryBudget
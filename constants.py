@@ -22,6 +22,12 @@ ALL_STATUSES = CHANGEABLE_STATUSES + TARGET_STATUSES + [
     "قيد التوصيل"
 ]
 
+# Compact integer codes for the status history table (see status_history.py).
+# Derived from the order of ALL_STATUSES, so only ever append new statuses to it.
+UNKNOWN_STATUS_CODE = 0
+STATUS_CODES = {status: code for code, status in enumerate(ALL_STATUSES, start=1)}
+STATUS_NAMES = {code: status for status, code in STATUS_CODES.items()}
+
 # Status display colors (for frontend reference)
 STATUS_COLORS = {
     "تم التسليم": "success",
@@ -32,3 +38,19 @@ STATUS_COLORS = {
     "ملغى": "error",
     "قيد التوصيل": "info"
 }
+
+# Shipment-to-payment reconciliation outcomes (see reconciliation.py)
+RECONCILIATION_MATCHED = "matched"
+RECONCILIATION_AMOUNT_MISMATCH = "amount_mismatch"
+RECONCILIATION_MISSING_PAYMENT = "missing_payment"
+RECONCILIATION_ORPHAN_PAYMENT = "orphan_payment"
+
+RECONCILIATION_CATEGORIES = [
+    RECONCILIATION_MATCHED,
+    RECONCILIATION_AMOUNT_MISMATCH,
+    RECONCILIATION_MISSING_PAYMENT,
+    RECONCILIATION_ORPHAN_PAYMENT
+]
+
+# Values of yes/no payment columns ("تم التحصيل", "تم السداد للعميل") that mean "yes"
+YES_VALUES = ["نعم", "تم", "yes", "Yes", "YES", "true", "True", "1"]
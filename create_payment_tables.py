@@ -2,46 +2,52 @@
 Recreate payment tables with all 48 columns.
 This will DROP and recreate the payment tables (data will be lost).
 """
+import logging
+import app_logging
 from database import engine, PaymentFile, PaymentRecord
+from partitions import ensure_default_partition
+from dialects import get_ops
 from sqlalchemy import text
 
+logger = logging.getLogger(__name__)
+
 def recreate_payment_tables():
-    print("⏳ Connecting to database...")
+    logger.info("⏳ Connecting to database...")
     try:
         with engine.connect() as conn:
             conn.execute(text("SELECT 1"))
-        print("✅ Connected!")
+        logger.info("✅ Connected!")
 
         # Drop payment tables
-        print("⏳ Dropping payment tables...")
+        logger.info("⏳ Dropping payment tables...")
         with engine.connect() as conn:
-            conn.execute(text("DROP TABLE IF EXISTS payment_records CASCADE"))
-            conn.execute(text("DROP TABLE IF EXISTS payment_files CASCADE"))
+            ops = get_ops(conn)
+            ops.drop_table(conn, "payment_records")
+            ops.drop_table(conn, "payment_files")
             conn.commit()
-        print("✅ Tables dropped!")
+        logger.info("✅ Tables dropped!")
 
         # Create payment tables with new schema
-        print("⏳ Creating payment tables with all 48 columns...")
+        logger.info("⏳ Creating payment tables with all 48 columns...")
         PaymentFile.__table__.create(bind=engine)
         PaymentRecord.__table__.create(bind=engine)
-        print("✅ Tables created!")
+        ensure_default_partition(engine)
+        logger.info("✅ Tables created!")
         
         # Verify
-        print("⏳ Verifying...")
+        logger.info("⏳ Verifying...")
         with engine.connect() as conn:
-            result = conn.execute(text("SELECT table_name FROM information_schema.tables WHERE table_schema='public'"))
-            tables = [row[0] for row in result]
-            print(f"📊 Current Tables in DB: {tables}")
+            tables = get_ops(conn).list_tables(conn)
+            logger.info(f"📊 Current Tables in DB: {tables}")
             
             if "payment_files" in tables and "payment_records" in tables:
-                print("🎉 SUCCESS: Payment tables exist with new schema!")
+                logger.info("🎉 SUCCESS: Payment tables exist with new schema!")
             else:
-                print("❌ ERROR: Payment tables are missing!")
+                logger.error("❌ ERROR: Payment tables are missing!")
 
     except Exception as e:
-        print(f"❌ FATAL ERROR: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"❌ FATAL ERROR: {str(e)}")
 
 if __name__ == "__main__":
+    app_logging.configure(default_format="text")
     recreate_payment_tables()
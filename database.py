@@ -1,12 +1,18 @@
 import os
+import logging
 from datetime import datetime
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Float, ForeignKey, Text, text
+from sqlalchemy import create_engine, Column, Integer, BigInteger, SmallInteger, String, DateTime, Date, Float, Boolean, ForeignKey, Text, Index, PrimaryKeyConstraint, UniqueConstraint, text, event, func
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.pool import StaticPool
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Get the Database URL from env
 DATABASE_URL = os.getenv("DATABASE_URL")
 
@@ -14,11 +20,13 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
     DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 
-# Validate database configuration on startup
+# Validate database configuration on startup. SQLite (local use) is opted into
+# explicitly with DATABASE_URL=sqlite:///..., never a silent fallback
 if not DATABASE_URL:
     raise RuntimeError(
         "❌ DATABASE_URL is not set! "
-        "Please create a .env file with DATABASE_URL=your_connection_string"
+        "Please create a .env file with DATABASE_URL=your_connection_string "
+        "(or DATABASE_URL=sqlite:///./gold_road.db for local use)"
     )
 
 # Create the engine and session
@@ -31,31 +39,105 @@ if not DATABASE_URL:
 # except Exception as e:
 #     raise RuntimeError(f"❌ Failed to connect to database: {str(e)}")
 
-engine = create_engine(DATABASE_URL)
+# Connection pool tuning (shared by the sync engine and the async engine in async_database.py)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds; drop connections before server-side timeouts
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+
+# SQLite stand-in (local development, tests, benchmarks): DATABASE_URL=sqlite:///./gold_road.db
+# or sqlite:// for a throwaway in-memory database. The in-memory database is a named
+# shared-cache one so the sync and async engines see the same data.
+SQLITE_MEMORY_URL = "sqlite:///file:gold_road_memdb?mode=memory&cache=shared&uri=true"
+IS_SQLITE_MEMORY = DATABASE_URL in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in DATABASE_URL
+if DATABASE_URL in ("sqlite://", "sqlite:///:memory:"):
+    DATABASE_URL = SQLITE_MEMORY_URL
+
+SQLITE_PRAGMAS = {
+    "foreign_keys": "ON",           # enforce the ON DELETE CASCADE foreign keys like PostgreSQL does
+    "synchronous": "NORMAL",        # safe with WAL, avoids an fsync per commit
+    "busy_timeout": "5000",         # wait for the writer instead of failing with "database is locked"
+    "cache_size": "-65536",         # 64 MB page cache
+    "temp_store": "MEMORY",
+    "mmap_size": str(256 * 1024 * 1024),
+}
+
+if not IS_SQLITE:
+    POOL_OPTIONS = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+elif IS_SQLITE_MEMORY:
+    # One connection for everyone keeps the in-memory database alive
+    POOL_OPTIONS = {"poolclass": StaticPool, "connect_args": {"check_same_thread": False}}
+else:
+    POOL_OPTIONS = {"connect_args": {"check_same_thread": False}}
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Applied to every new SQLite connection (sync and async engines)."""
+    cursor = dbapi_connection.cursor()
+    if not IS_SQLITE_MEMORY:
+        # Readers don't block the writer and vice versa
+        cursor.execute("PRAGMA journal_mode=WAL")
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+engine = create_engine(DATABASE_URL, **POOL_OPTIONS)
+if IS_SQLITE:
+    event.listen(engine, "connect", set_sqlite_pragmas)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+class StoredBlob(Base):
+    """An uploaded workbook in content-addressed storage (storage.py)"""
+    __tablename__ = "stored_blobs"
+
+    hash = Column(String(64), primary_key=True)  # sha256 hex of the content
+    size = Column(BigInteger)
+    stored_size = Column(BigInteger)
+    # None until the blob is cold; then "gzip", or "none" when gzip didn't make it smaller
+    compression = Column(String(10))
+    # UploadedFile / PaymentFile rows pointing at the blob
+    ref_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # When ref_count last dropped to 0; the blob is deleted STORAGE_RETENTION_DAYS later
+    released_at = Column(DateTime, index=True)
+
 class UploadedFile(Base):
     __tablename__ = "uploaded_files"
 
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, index=True)
     upload_date = Column(DateTime, default=datetime.utcnow)
+    # Set while a large file's shipments are purged in the background (hidden from the API)
+    is_deleting = Column(Boolean, default=False)
+    # The uploaded workbook in storage.py (sha256 of its content)
+    blob_hash = Column(String(64), ForeignKey("stored_blobs.hash"), index=True)
     
-    # Relationship to shipments
-    shipments = relationship("Shipment", back_populates="source_file", cascade="all, delete-orphan")
+    # Relationship to shipments (the DB cascades deletes, children are never loaded for it)
+    shipments = relationship("Shipment", back_populates="source_file", cascade="all, delete-orphan", passive_deletes=True)
 
 class Shipment(Base):
     __tablename__ = "shipments"
 
     id = Column(Integer, primary_key=True, index=True)
-    file_id = Column(Integer, ForeignKey("uploaded_files.id"))
+    file_id = Column(Integer, ForeignKey("uploaded_files.id", ondelete="CASCADE"), index=True)
     
     # Core Fields (Mapped to Arabic DB Columns)
     # syntax: Column("DB_COLUMN_NAME", Type, ...)
-    shipment_code = Column("الكود", String, index=True)
+    # Unique: concurrent uploads rely on it to skip codes that already exist (crud.save_upload)
+    shipment_code = Column("الكود", String, index=True, unique=True)
     date = Column("التاريخ", DateTime)
     client_name = Column("العميل", String, index=True)
     branch_name = Column("الفرع", String)
@@ -86,9 +168,54 @@ class Shipment(Base):
     description = Column("الوصف", Text)
     notes = Column("ملاحظات", Text)
     
+    # Version of the transaction that last inserted or updated it (changes.py)
+    change_version = Column(BigInteger, nullable=False, default=0, server_default="0")
+
     # Relationship
     source_file = relationship("UploadedFile", back_populates="shipments")
 
+    __table_args__ = (
+        # /shipments/changes reads a range of it
+        Index("ix_shipments_change_version", "change_version", "id"),
+    )
+
+
+class ShipmentTombstone(Base):
+    """Deleted shipments, so delta sync clients drop them too (see changes.py)"""
+    __tablename__ = "shipment_tombstones"
+
+    shipment_id = Column(Integer, primary_key=True)  # no foreign key: the shipment is gone
+    shipment_code = Column(String)
+    change_version = Column(BigInteger, nullable=False)
+    deleted_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        Index("ix_shipment_tombstones_change_version", "change_version", "shipment_id"),
+    )
+
+
+class ChangeCounter(Base):
+    """Last change version handed out on SQLite (dialects.SQLiteOps.change_version); one row"""
+    __tablename__ = "change_counter"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(BigInteger, nullable=False)
+
+
+class ShipmentStatusEvent(Base):
+    """Append-only history of shipment statuses (see status_history.py)"""
+    __tablename__ = "shipment_status_events"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    shipment_id = Column(Integer, ForeignKey("shipments.id", ondelete="CASCADE"), nullable=False)
+    # constants.STATUS_CODES value (0 = status not in ALL_STATUSES)
+    status_code = Column(SmallInteger, nullable=False)
+    changed_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index("ix_shipment_status_events_shipment_time", "shipment_id", "changed_at"),
+    )
+
 
 class PaymentFile(Base):
     """Tracks uploaded payment Excel files"""
@@ -98,30 +225,61 @@ class PaymentFile(Base):
     filename = Column(String, index=True)
     upload_date = Column(DateTime, default=datetime.utcnow)
     record_count = Column(Integer, default=0)
+    # Set while a large file's records are purged in the background (hidden from the API)
+    is_deleting = Column(Boolean, default=False)
+    # The uploaded workbook in storage.py (sha256 of its content)
+    blob_hash = Column(String(64), ForeignKey("stored_blobs.hash"), index=True)
     
-    # Relationship to payment records
-    records = relationship("PaymentRecord", back_populates="source_file", cascade="all, delete-orphan")
+    # Relationship to payment records (the DB cascades deletes, children are never loaded for it)
+    records = relationship("PaymentRecord", back_populates="source_file", cascade="all, delete-orphan", passive_deletes=True)
+
+
+class PaymentLookup(Base):
+    """Distinct values of the dictionary-encoded payment columns (see lookups.py)"""
+    __tablename__ = "payment_lookups"
+    # AUTOINCREMENT on SQLite: ids of rolled-back values are never reused
+    __table_args__ = (UniqueConstraint("field", "value"), {"sqlite_autoincrement": True})
+
+    id = Column(Integer, primary_key=True)
+    field = Column(String(30), nullable=False)  # PaymentRecord attribute, e.g. "branch"
+    value = Column(String, nullable=False)
+
+
+def _lookup_id(index=False):
+    return Column(Integer, ForeignKey("payment_lookups.id"), index=index)
+
+
+def _decoded(field):
+    """Read-only attribute with the value behind `<field>_id`."""
+    def get(record):
+        import lookups
+        return lookups.decode(getattr(record, f"{field}_id"))
+    return property(get)
 
 
 class PaymentRecord(Base):
-    """Stores parsed payment data from Excel files - ALL 48 columns"""
+    """Stores parsed payment data from Excel files - ALL 48 columns
+    (12 low-cardinality ones as payment_lookups ids, see lookups.py)"""
     __tablename__ = "payment_records"
+    # One partition per payment file on PostgreSQL (see partitions.py).
+    # The partition key has to be part of the primary key there.
+    __table_args__ = {"postgresql_partition_by": "LIST (file_id)"}
 
-    id = Column(Integer, primary_key=True, index=True)
-    file_id = Column(Integer, ForeignKey("payment_files.id"), index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    file_id = Column(Integer, ForeignKey("payment_files.id", ondelete="CASCADE"), primary_key=True, index=True)
     
     # Core Fields
     amount_due = Column("المستحق", Float)
     code = Column("الكود", String, index=True)
     date = Column("التاريخ", DateTime)
-    status = Column("الحالة", String, index=True)
-    branch = Column("الفرع", String)
-    origin_branch = Column("فرع المنشأ", String)
-    service = Column("الخدمة", String)
+    status_id = _lookup_id(index=True)
+    branch_id = _lookup_id()
+    origin_branch_id = _lookup_id()
+    service_id = _lookup_id()
     
     # Sender Info
     sender_name = Column("اسم الراسل", String)
-    sender_city = Column("مدينة الراسل", String)
+    sender_city_id = _lookup_id()
     sender_area = Column("منطقة الراسل", String)
     sender_postal_code = Column("الرمز البريدي للراسل", String)
     
@@ -130,7 +288,7 @@ class PaymentRecord(Base):
     
     # Recipient Info
     recipient_name = Column("المستلم", String)
-    recipient_city = Column("مدينة المستلم", String)
+    recipient_city_id = _lookup_id()
     recipient_area = Column("منطقة المستلم", String)
     recipient_address = Column("عنوان المستلم", Text)
     recipient_postal_code = Column("الرمز البريدي للمستلم", String)
@@ -152,22 +310,22 @@ class PaymentRecord(Base):
     due_fees = Column("الرسوم المستحقة", Float)
     
     # Type Info
-    payment_type = Column("نوع الدفع", String)
-    price_type = Column("نوع السعر", String)
-    delivery_type = Column("نوع التسليم", String)
-    return_type = Column("نوع المرتجع للراسل", String)
+    payment_type_id = _lookup_id()
+    price_type_id = _lookup_id()
+    delivery_type_id = _lookup_id()
+    return_type_id = _lookup_id()
     
     # Agent
-    shipping_agent = Column("مندوب الشحن", String)
+    shipping_agent_id = _lookup_id()
     
     # === NEW COLUMNS (14 additional) ===
     is_collected = Column("تم التحصيل", String)
     paid_to_client = Column("تم السداد للعميل", String)
     notes = Column("ملاحظات", Text)
     can_open_package = Column("امكانية فتح الطرد", String)
-    client_name = Column("العميل", String)
+    client_name = Column("العميل", String, index=True)
     return_reason = Column("سبب الإرجاع", String)
-    order_type = Column("نوع الطلب", String)
+    order_type_id = _lookup_id()
     delivery_cancel_date = Column("تاريخ التسليم/الإلغاء", DateTime)
     return_value = Column("قيمة المرتجع", Float)
     attempts_count = Column("عدد المحاولات", Integer)
@@ -176,13 +334,130 @@ class PaymentRecord(Base):
     last_movement_date = Column("تاريخ أخر حركة", DateTime)
     client_dues_payment = Column("سداد مستحقات العملاء", String)
     
+    # Dictionary-encoded columns, decoded (lookups.FIELDS)
+    status = _decoded("status")
+    branch = _decoded("branch")
+    origin_branch = _decoded("origin_branch")
+    service = _decoded("service")
+    sender_city = _decoded("sender_city")
+    recipient_city = _decoded("recipient_city")
+    payment_type = _decoded("payment_type")
+    price_type = _decoded("price_type")
+    delivery_type = _decoded("delivery_type")
+    return_type = _decoded("return_type")
+    shipping_agent = _decoded("shipping_agent")
+    order_type = _decoded("order_type")
+    
     # Relationship
     source_file = relationship("PaymentFile", back_populates="records")
 
 
+class PaymentDailyRollup(Base):
+    """Pre-aggregated payment totals per (day, branch, client, status).
+
+    Maintained incrementally by payment uploads/deletes (see rollups.py), so
+    dashboards never have to scan the wide payment_records table.
+    """
+    __tablename__ = "payment_daily_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+
+    # Rollup key
+    day = Column(Date, index=True)
+    branch = Column(String)
+    client_name = Column(String)
+    status = Column(String)
+    # The four key fields as one never-NULL string (rollups.rollup_key). Unique, so
+    # concurrent uploads upsert into one row; a unique constraint on the fields
+    # themselves would let rows with a NULL field duplicate
+    rollup_key = Column(String, nullable=False, unique=True)
+
+    # Measures
+    record_count = Column(Integer, default=0)
+    package_value = Column(Float, default=0.0)
+    net_package_price = Column(Float, default=0.0)
+    delivery_value = Column(Float, default=0.0)
+    due_fees = Column(Float, default=0.0)
+    collected_fees = Column(Float, default=0.0)
+    return_value = Column(Float, default=0.0)
+    amount_due = Column(Float, default=0.0)
+
+    __table_args__ = (
+        Index("ix_payment_daily_rollups_key", "day", "branch", "client_name", "status"),
+    )
+
+
+class ReconciliationResult(Base):
+    """Per-code outcome of reconciling a payment file against shipments (see reconciliation.py)"""
+    __tablename__ = "reconciliation_results"
+
+    id = Column(Integer, primary_key=True, index=True)
+    payment_file_id = Column(Integer, ForeignKey("payment_files.id", ondelete="CASCADE"), index=True)
+    code = Column(String)
+    category = Column(String, index=True)
+    payment_amount = Column(Float)
+    shipment_amount = Column(Float)
+    # Fingerprint of the inputs, so re-checks only rewrite rows whose inputs changed
+    input_hash = Column(String(32))
+    checked_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_reconciliation_results_file_code", "payment_file_id", "code"),
+    )
+
+
+class ClientLedger(Base):
+    """Cached per-client settlement totals of one payment file (see settlements.py)"""
+    __tablename__ = "client_ledger"
+
+    id = Column(Integer, primary_key=True, index=True)
+    client_name = Column(String, index=True)
+    file_id = Column(Integer, ForeignKey("payment_files.id", ondelete="CASCADE"), index=True)
+
+    record_count = Column(Integer, default=0)
+    amount_due = Column(Float, default=0.0)
+    due_fees = Column(Float, default=0.0)
+    collected_amount = Column(Float, default=0.0)
+    uncollected_amount = Column(Float, default=0.0)
+    paid_amount = Column(Float, default=0.0)
+    unpaid_amount = Column(Float, default=0.0)
+
+
+# SQLite only generates ids for a single INTEGER PRIMARY KEY, so composite keys that
+# exist for PostgreSQL partitioning are reduced to their autoincrement column there.
+def _sqlite_rowid_column(table):
+    autoincrement = table.autoincrement_column
+    if autoincrement is not None and len(table.primary_key.columns) > 1:
+        return autoincrement
+    return None
+
+
+@compiles(CreateColumn, "sqlite")
+def _sqlite_create_column(element, compiler, **kw):
+    column = element.element
+    if column is _sqlite_rowid_column(column.table):
+        return f"{compiler.preparer.format_column(column)} INTEGER NOT NULL"
+    return compiler.visit_create_column(element, **kw)
+
+
+@compiles(PrimaryKeyConstraint, "sqlite")
+def _sqlite_primary_key(constraint, compiler, **kw):
+    rowid_column = _sqlite_rowid_column(constraint.table)
+    if rowid_column is not None:
+        return f"PRIMARY KEY ({compiler.preparer.format_column(rowid_column)})"
+    return compiler.visit_primary_key_constraint(constraint, **kw)
+
+
+# Set once create_tables() has run in this process; workers forked from a
+# gunicorn master that already ran it (gunicorn.conf.py) inherit it and skip it
+tables_created = False
+
+
 def create_tables():
-    if engine is None:
-        print("ERROR: DATABASE_URL is missing in .env file!")
-        return
+    global tables_created
     Base.metadata.create_all(bind=engine)
-    print("Tables created successfully!")
+
+    from partitions import ensure_default_partition
+    ensure_default_partition(engine)
+    tables_created = True
+    logger.info("Tables created successfully!")
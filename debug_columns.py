@@ -2,25 +2,30 @@
 Debug script to show all column names from an Excel file.
 """
 import pandas as pd
+import io
 import os
 import sys
+import storage
 
 # Fix encoding for Windows console
 sys.stdout.reconfigure(encoding='utf-8')
 
-UPLOAD_DIR = "uploads"
-files = os.listdir(UPLOAD_DIR)
-excel_files = [f for f in files if f.endswith('.xlsx')]
+# Newest upload in content-addressed storage (storage.py)
+STORAGE_DIR = storage.STORAGE_DIR
+blob_files = [
+    os.path.join(directory, name)
+    for directory, _, names in os.walk(STORAGE_DIR) if directory != STORAGE_DIR
+    for name in names if not name.endswith(".tmp")
+]
 
-if not excel_files:
+if not blob_files:
     print("No Excel files found!")
 else:
-    latest_file = max(excel_files, key=lambda f: os.path.getctime(os.path.join(UPLOAD_DIR, f)))
-    file_path = os.path.join(UPLOAD_DIR, latest_file)
+    file_path = max(blob_files, key=os.path.getctime)
     
     print(f"File: {file_path}\n")
     
-    df = pd.read_excel(file_path)
+    df = pd.read_excel(io.BytesIO(storage.read(os.path.basename(file_path)[:64])))
     
     # Write to a file instead of console
     with open("columns_list.txt", "w", encoding="utf-8") as f:
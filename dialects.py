@@ -0,0 +1,155 @@
+"""
+Dialect-specific operations behind one small interface.
+
+PostgreSQL is the production database; SQLite is the local stand-in used for
+development, tests and benchmarks. Code that needs something the two don't
+share (interval arithmetic, table listing/dropping, bulk loading, upserts, search
+indexes, partitioning, change versions, advisory locks) asks `get_ops(bind)`
+instead of checking dialect names.
+"""
+import csv
+import io
+from datetime import date, datetime
+from sqlalchemy import func, inspect, insert, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+
+class PostgresOps:
+    name = "postgresql"
+    supports_partitioning = True
+
+    def seconds_between(self, start, end):
+        return func.extract("epoch", end - start)
+
+    def insert(self, model):
+        """INSERT with on_conflict_do_nothing() / on_conflict_do_update()."""
+        return postgresql.insert(model)
+
+    def list_tables(self, bind):
+        return inspect(bind).get_table_names()
+
+    def drop_table(self, conn, table_name: str):
+        conn.execute(text(f'DROP TABLE IF EXISTS "{table_name}" CASCADE'))
+
+    def bulk_insert(self, db, model, rows):
+        """
+        Streams rows (dicts keyed by attribute name) through COPY ... FROM STDIN,
+        inside the session's transaction.
+        """
+        if not rows:
+            return 0
+        attributes = list(rows[0].keys())
+        columns = [model.__mapper__.columns[attribute].name for attribute in attributes]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([_copy_value(row[attribute]) for attribute in attributes])
+        buffer.seek(0)
+
+        column_list = ", ".join(f'"{column}"' for column in columns)
+        dbapi_connection = db.connection().connection.dbapi_connection
+        with dbapi_connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY "{model.__tablename__}" ({column_list}) FROM STDIN WITH (FORMAT csv)', buffer
+            )
+        return len(rows)
+
+    def change_version(self):
+        """
+        The current transaction's id (PostgreSQL 13+): concurrent writers don't
+        wait on each other for a version; change_horizon() accounts for the
+        ones that commit out of order.
+        """
+        return text("SELECT CAST(CAST(pg_current_xact_id() AS text) AS bigint)")
+
+    def change_horizon(self):
+        """Oldest transaction id still running: every version below it is final."""
+        return text("SELECT CAST(CAST(pg_snapshot_xmin(pg_current_snapshot()) AS text) AS bigint)")
+
+    def lock_keys(self, db, namespace: int, keys):
+        """
+        Transaction-level advisory locks on (namespace, key) for each integer key,
+        taken in ascending key order so writers locking overlapping keys never deadlock.
+        """
+        db.execute(
+            text(
+                "SELECT pg_advisory_xact_lock(:namespace, key) "
+                "FROM unnest(CAST(:keys AS integer[])) WITH ORDINALITY AS k(key, n) ORDER BY n"
+            ),
+            {"namespace": namespace, "keys": sorted(set(keys))}
+        )
+
+    def ensure_search_indexes(self, conn, columns):
+        """Trigram GIN indexes so ILIKE '%term%' searches don't scan the table."""
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for column in columns:
+            conn.execute(text(
+                f'CREATE INDEX IF NOT EXISTS "ix_{column.table.name}_{column.name}_trgm" '
+                f'ON "{column.table.name}" USING gin ("{column.name}" gin_trgm_ops)'
+            ))
+
+
+class SQLiteOps:
+    name = "sqlite"
+    supports_partitioning = False
+
+    def seconds_between(self, start, end):
+        return (func.julianday(end) - func.julianday(start)) * 86400.0
+
+    def insert(self, model):
+        """INSERT with on_conflict_do_nothing() / on_conflict_do_update()."""
+        return sqlite.insert(model)
+
+    def list_tables(self, bind):
+        return inspect(bind).get_table_names()
+
+    def drop_table(self, conn, table_name: str):
+        conn.execute(text(f'DROP TABLE IF EXISTS "{table_name}"'))
+
+    def bulk_insert(self, db, model, rows):
+        """One executemany INSERT (rows keyed by attribute name) inside the session's transaction."""
+        if rows:
+            # Send None as NULL; otherwise the ORM splits the batch by which values are None
+            db.execute(insert(model), rows, execution_options={"render_nulls": True})
+        return len(rows)
+
+    def change_version(self):
+        """
+        Next value of the change_counter row. SQLite runs one write transaction
+        at a time, so versions commit in the order they are handed out.
+        """
+        return text(
+            "INSERT INTO change_counter (id, version) VALUES (1, 1) "
+            "ON CONFLICT (id) DO UPDATE SET version = change_counter.version + 1 RETURNING version"
+        )
+
+    def change_horizon(self):
+        """One past the last committed version: every version below it is final."""
+        return text("SELECT coalesce(max(version), 0) + 1 FROM change_counter")
+
+    def lock_keys(self, db, namespace: int, keys):
+        # One write transaction at a time already
+        pass
+
+    def ensure_search_indexes(self, conn, columns):
+        # LIKE '%term%' can't use an index on SQLite; the stand-in scans
+        pass
+
+
+def _copy_value(value):
+    """CSV cell for COPY: empty (NULL) for None, ISO text for dates."""
+    if value is None:
+        return None
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+_OPS = {"postgresql": PostgresOps(), "sqlite": SQLiteOps()}
+
+
+def get_ops(bind):
+    """Operations for an engine, connection or session's dialect."""
+    if hasattr(bind, "get_bind"):
+        bind = bind.get_bind()
+    return _OPS[bind.dialect.name]
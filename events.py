@@ -0,0 +1,330 @@
+"""
+Change notifications for the frontend, streamed as server-sent events on /events.
+
+Writers call `publish()` after committing (next to `http_cache.bump`), and every
+worker's listener thread hands the event to the /events streams it serves, so
+clients refetch a list only when something in it changed instead of polling:
+
+    upload_completed  {"kind": "shipments" | "payments", "file_id", "rows"}
+    status_changed    {"status", "count", "codes"}   (codes is null above EVENTS_MAX_CODES)
+    shipment_deleted  {"code"}
+    file_deleted      {"kind", "file_id"}
+    resync            {}   events may have been missed: refetch everything
+
+Events cross workers through PostgreSQL LISTEN/NOTIFY, or on SQLite through an
+append-only file under DATA_VERSION_DIR that each listener tails. Each worker
+keeps the last EVENTS_REPLAY events, so a client reconnecting with Last-Event-ID
+gets what it missed (or `resync` when that's no longer known).
+"""
+import asyncio
+import json
+import logging
+import os
+import select
+import threading
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from sqlalchemy import text
+import http_cache
+import metrics
+from database import engine
+from dialects import get_ops
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "gold_road_events"
+EVENTS_MAX_CODES = 100  # keeps NOTIFY payloads well under PostgreSQL's 8000 bytes
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+EVENTS_REPLAY = int(os.getenv("EVENTS_REPLAY", "500"))
+EVENTS_KEEPALIVE = float(os.getenv("EVENTS_KEEPALIVE", "15"))  # seconds
+EVENTS_STREAM_SECONDS = float(os.getenv("EVENTS_STREAM_SECONDS", "300"))
+EVENTS_POLL_INTERVAL = 0.5  # seconds
+EVENTS_LOG_MAX_BYTES = 1024 * 1024
+RETRY_MS = 3000  # EventSource reconnect delay
+
+EVENT_LOG_PATH = os.path.join(http_cache.DATA_VERSION_DIR, "events")
+EVENT_LOG_LOCK_PATH = EVENT_LOG_PATH + ".lock"
+
+_subscribers = set()
+_recent = deque(maxlen=EVENTS_REPLAY)
+_origin = None  # stands in for "before the first event" as an event id, per listener
+_dropped_recent = False
+_lock = threading.Lock()
+_listener = None
+_stop = threading.Event()
+_append_lock = threading.Lock()
+
+EVENTS_SUBSCRIBERS = metrics.Gauge(
+    "events_subscribers", "Open /events streams in this worker", collect=lambda: {(): len(_subscribers)}
+)
+EVENTS_PUBLISHED = metrics.Counter("events_published_total", "Change events published", labels=("type",))
+
+
+class _Event:
+    def __init__(self, event_id: str, event_type: str, data: dict):
+        self.id = event_id
+        self.type = event_type
+        self.data = data
+
+    def encode(self):
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data, ensure_ascii=False)}\n\n"
+
+
+def _resync(after_id: str):
+    # Carries the id to resume from, so the client's next reconnect doesn't resync again
+    return _Event(after_id, "resync", {})
+
+
+def _is_postgres():
+    return get_ops(engine).name == "postgresql"
+
+
+def publish(event_type: str, **data):
+    """Notifies every worker's /events clients. Call after the write has been committed; never raises."""
+    if event_type == "status_changed":
+        codes = data.get("codes") or []
+        data["count"] = len(codes)
+        data["codes"] = codes if len(codes) <= EVENTS_MAX_CODES else None
+    payload = json.dumps({"id": uuid.uuid4().hex[:16], "type": event_type, "data": data}, ensure_ascii=False)
+    try:
+        if _is_postgres():
+            with engine.begin() as conn:
+                conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": payload})
+        else:
+            _append_to_log(payload)
+        EVENTS_PUBLISHED.inc(type=event_type)
+    except Exception:
+        logger.exception("failed to publish event", extra={"event": event_type})
+
+
+@contextmanager
+def _log_locked():
+    """Held while appending to (and rotating) the event log, across workers where possible."""
+    try:
+        import fcntl
+    except ImportError:
+        # Windows: no gunicorn there, so the one uvicorn process only has to agree with itself
+        with _append_lock:
+            yield
+        return
+    with _append_lock, open(EVENT_LOG_LOCK_PATH, "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def _append_to_log(payload: str):
+    # Writers take turns: otherwise one could rotate the log while another is
+    # appending to it, or two could rotate it back to back and lose a file
+    with _log_locked():
+        try:
+            if os.path.getsize(EVENT_LOG_PATH) > EVENTS_LOG_MAX_BYTES:
+                # Listeners finish reading the old file through their open handle
+                os.replace(EVENT_LOG_PATH, EVENT_LOG_PATH + ".1")
+        except FileNotFoundError:
+            pass
+        with open(EVENT_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(payload + "\n")
+
+
+# ========== LISTENER ==========
+
+def _dispatch(payload: str):
+    """Hands a published event to this worker's streams (listener thread)."""
+    try:
+        message = json.loads(payload)
+        event = _Event(message["id"], message["type"], message["data"])
+    except (ValueError, KeyError, TypeError):
+        logger.warning("ignoring malformed event", extra={"payload": payload[:200]})
+        return
+    global _dropped_recent
+    with _lock:
+        _dropped_recent = _dropped_recent or len(_recent) == _recent.maxlen
+        _recent.append(event)
+        subscribers = list(_subscribers)
+    for subscriber in subscribers:
+        subscriber.offer(event)
+
+
+def _resync_all():
+    """Events may have been lost (listener reconnected): every stream gets `resync`."""
+    global _dropped_recent
+    with _lock:
+        _recent.clear()
+        _dropped_recent = True
+        subscribers = list(_subscribers)
+    for subscriber in subscribers:
+        subscriber.offer(_resync(_origin))
+
+
+def _listen_postgres():
+    connection = engine.raw_connection()
+    connection.detach()  # held for as long as we listen, not a pool slot
+    try:
+        dbapi_connection = connection.dbapi_connection
+        dbapi_connection.autocommit = True
+        with dbapi_connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANNEL}")
+        while not _stop.is_set():
+            if select.select([dbapi_connection], [], [], EVENTS_POLL_INTERVAL) == ([], [], []):
+                continue
+            dbapi_connection.poll()
+            while dbapi_connection.notifies:
+                _dispatch(dbapi_connection.notifies.pop(0).payload)
+    finally:
+        connection.close()
+
+
+def _tail_log():
+    log = None
+    try:
+        while not _stop.is_set():
+            if log is None:
+                try:
+                    log = open(EVENT_LOG_PATH, "r", encoding="utf-8")
+                    log.seek(0, os.SEEK_END)  # only events from now on
+                except FileNotFoundError:
+                    open(EVENT_LOG_PATH, "a").close()
+                    continue
+            _read_new_lines(log)
+            try:
+                rotated = os.stat(EVENT_LOG_PATH).st_ino != os.fstat(log.fileno()).st_ino
+            except FileNotFoundError:
+                rotated = False
+            if rotated:
+                _read_new_lines(log)
+                if not _is_previous_log(log):
+                    # Rotated again before we got here: a whole file went unread
+                    _resync_all()
+                log.close()
+                log = open(EVENT_LOG_PATH, "r", encoding="utf-8")
+                continue
+            _stop.wait(EVENTS_POLL_INTERVAL)
+    finally:
+        if log is not None:
+            log.close()
+
+
+def _is_previous_log(log):
+    try:
+        return os.stat(EVENT_LOG_PATH + ".1").st_ino == os.fstat(log.fileno()).st_ino
+    except FileNotFoundError:
+        return False
+
+
+def _read_new_lines(log):
+    while True:
+        position = log.tell()
+        line = log.readline()
+        if not line.endswith("\n"):
+            log.seek(position)  # nothing new, or a line still being written
+            return
+        _dispatch(line)
+
+
+def _listen():
+    listen = _listen_postgres if _is_postgres() else _tail_log
+    while not _stop.is_set():
+        try:
+            listen()
+        except Exception:
+            logger.exception("event listener failed, reconnecting")
+            _resync_all()
+            _stop.wait(RETRY_MS / 1000)
+
+
+def _ensure_listener():
+    global _listener, _origin, _dropped_recent
+    with _lock:
+        if _listener is None or not _listener.is_alive():
+            # Not at import: a preloading gunicorn master would give every worker the same one
+            _origin = uuid.uuid4().hex[:16]
+            _recent.clear()
+            _dropped_recent = False
+            _stop.clear()
+            _listener = threading.Thread(target=_listen, name="events-listener", daemon=True)
+            _listener.start()
+
+
+def stop():
+    """Stops the listener and ends open streams (API shutdown)."""
+    global _listener
+    _stop.set()
+    with _lock:
+        listener, _listener = _listener, None
+        subscribers = list(_subscribers)
+    for subscriber in subscribers:
+        subscriber.offer(None)
+    if listener is not None:
+        listener.join(timeout=5)
+
+
+# ========== STREAMS ==========
+
+class _Subscriber:
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(EVENTS_QUEUE_SIZE)
+
+    def offer(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:  # the stream's event loop is gone
+            with _lock:
+                _subscribers.discard(self)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A client this far behind refetches everything instead
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(_resync(event.id))
+
+
+def _subscribe(last_event_id: str = None):
+    """Registers a stream; returns it with the id it starts from and the events it missed."""
+    _ensure_listener()
+    subscriber = _Subscriber()
+    with _lock:
+        _subscribers.add(subscriber)
+        start_id = _recent[-1].id if _recent else _origin
+        if not last_event_id:
+            return subscriber, start_id, []
+        if last_event_id == _origin and not _dropped_recent:
+            return subscriber, start_id, list(_recent)
+        ids = [event.id for event in _recent]
+        if last_event_id in ids:
+            return subscriber, start_id, list(_recent)[ids.index(last_event_id) + 1:]
+        return subscriber, start_id, [_resync(start_id)]
+
+
+async def stream(last_event_id: str = None):
+    """
+    The /events response body. Ends after EVENTS_STREAM_SECONDS (EventSource
+    reconnects with Last-Event-ID and loses nothing) so no connection lives forever.
+    """
+    subscriber, start_id, missed = _subscribe(last_event_id)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + EVENTS_STREAM_SECONDS
+    try:
+        # An id without data: where a reconnect resumes if no event arrives first
+        yield f"retry: {RETRY_MS}\nid: {start_id}\n\n"
+        for event in missed:
+            yield event.encode()
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), min(EVENTS_KEEPALIVE, remaining))
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event is None:
+                return
+            yield event.encode()
+    finally:
+        with _lock:
+            _subscribers.discard(subscriber)
@@ -0,0 +1,45 @@
+"""
+Write payment files to the Parquet analytics dataset (analytics.py).
+Run this script once after enabling analytics to archive the files uploaded
+before it, or with --all to rebuild every file.
+"""
+import sys
+import logging
+from sqlalchemy import select
+import app_logging
+import http_cache
+from database import SessionLocal, PaymentFile, PaymentRecord
+import analytics
+
+logger = logging.getLogger(__name__)
+
+
+def export_payment_files(rebuild=False):
+    db = SessionLocal()
+    try:
+        files = db.query(PaymentFile).filter(PaymentFile.is_deleting.isnot(True)).order_by(PaymentFile.id).all()
+        columns = [attribute.class_attribute for attribute in analytics.RECORD_COLUMNS]
+        exported = 0
+        for file in files:
+            if not rebuild and analytics.has_payment_file(file.id):
+                continue
+            records = [
+                dict(row) for row in db.execute(
+                    select(*columns).where(PaymentRecord.file_id == file.id)
+                ).mappings()
+            ]
+            analytics.write_payment_file(file.id, file.upload_date, records)
+            exported += 1
+            logger.info(f"✅ {file.filename}: {len(records)} records")
+
+        http_cache.bump(http_cache.PAYMENTS)
+        logger.info(f"🎉 SUCCESS: {exported} payment files exported to {analytics.PAYMENTS_DATASET}")
+    except Exception as e:
+        logger.exception(f"❌ FATAL ERROR: {str(e)}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    app_logging.configure(default_format="text")
+    export_payment_files(rebuild="--all" in sys.argv)
@@ -0,0 +1,45 @@
+"""
+Gunicorn settings for production (the Dockerfile runs `gunicorn -c gunicorn.conf.py main:app`).
+
+The app is imported once in the master (preload_app) and the workers are forked
+from it, so they share the imported modules copy-on-write and boot in
+milliseconds. Before forking, the master creates the tables once (instead of
+every worker racing to) and imports pandas/openpyxl for the upload path, which
+each worker would otherwise load on its first upload. Database connections
+are never shared across the fork: the master closes its own, and each worker
+drops the pools it inherited and warms up fresh ones on startup
+(DB_POOL_WARMUP).
+
+Env: PORT (8000), WEB_CONCURRENCY (4 workers), GUNICORN_TIMEOUT (120 s).
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))  # large uploads parse for a while
+
+
+def on_starting(server):
+    import app_logging
+    import database
+    import ingest
+
+    app_logging.configure()
+    database.create_tables()
+    ingest.preload()
+    # Workers open their own connections
+    database.engine.dispose()
+
+
+def post_fork(server, worker):
+    import app_logging
+    import database
+    from async_database import async_engine
+
+    app_logging.reconfigure_after_fork()
+    # Forget the pooled connections inherited from the master without closing
+    # them (they aren't ours to close); new ones are opened in this process
+    database.engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
@@ -0,0 +1,119 @@
+"""
+Version-based HTTP caching for read endpoints.
+
+Each table family ("shipments", "payments") has a data version that writers bump
+after committing (uploads, deletes, status updates). Read endpoints derive an
+ETag from the versions of the families they read plus the request path and query,
+answer `304 Not Modified` when the client already has it, and serve repeat
+identical queries from an in-process response cache - both without touching the
+database.
+
+Versions live in small files under DATA_VERSION_DIR so that all gunicorn workers
+on the machine see each other's bumps.
+"""
+import os
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+
+SHIPMENTS = "shipments"
+PAYMENTS = "payments"
+
+DATA_VERSION_DIR = os.getenv("DATA_VERSION_DIR", ".data_versions")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "256"))
+
+os.makedirs(DATA_VERSION_DIR, exist_ok=True)
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _version_path(family: str):
+    return os.path.join(DATA_VERSION_DIR, family)
+
+
+def current_version(family: str):
+    try:
+        with open(_version_path(family), "r") as f:
+            return f.read().strip() or "0"
+    except FileNotFoundError:
+        return "0"
+
+
+def bump(*families: str):
+    """Marks the given families as changed. Call after the write has been committed."""
+    for family in families:
+        tmp_path = f"{_version_path(family)}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(tmp_path, _version_path(family))  # atomic, readers never see a partial file
+
+
+def _etag(request: Request, families):
+    versions = ",".join(f"{family}={current_version(family)}" for family in families)
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    raw = f"{versions}|{request.url.path}|{query}"
+    return '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest() + '"'
+
+
+def _client_has(request: Request, etag: str):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
+
+
+class CachedRead:
+    """Result of `lookup`: either a ready `response`, or `store()` to build one."""
+
+    def __init__(self, etag: str, response: Response = None):
+        self.etag = etag
+        self.response = response
+
+    def store(self, body):
+        response = JSONResponse(content=body, headers=_headers(self.etag))
+        with _cache_lock:
+            _cache[self.etag] = response.body
+            _cache.move_to_end(self.etag)
+            while len(_cache) > RESPONSE_CACHE_SIZE:
+                _cache.popitem(last=False)
+        return response
+
+
+def _headers(etag: str):
+    # no-cache: clients may keep the body but must revalidate with If-None-Match
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+def lookup(request: Request, *families: str):
+    """
+    Call at the top of a read handler, before opening a DB session:
+
+        cached = http_cache.lookup(request, http_cache.SHIPMENTS)
+        if cached.response:
+            return cached.response
+        ...
+        return cached.store(body)
+    """
+    etag = _etag(request, families)
+    if _client_has(request, etag):
+        return CachedRead(etag, Response(status_code=304, headers=_headers(etag)))
+
+    with _cache_lock:
+        body = _cache.get(etag)
+        if body is not None:
+            _cache.move_to_end(etag)
+    if body is not None:
+        return CachedRead(etag, Response(content=body, media_type="application/json", headers=_headers(etag)))
+
+    return CachedRead(etag)
+
+
+def clear():
+    """Drops every cached response of this process."""
+    with _cache_lock:
+        _cache.clear()
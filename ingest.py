@@ -0,0 +1,99 @@
+"""
+Admission control and a dedicated thread pool for uploads.
+
+Parsing a workbook and loading it are blocking (pandas, openpyxl, SQLAlchemy),
+so the upload handlers hand that work to `run()` instead of doing it on the
+event loop, where one large upload would stall every other request of the
+worker.
+
+Each worker runs at most INGEST_CONCURRENCY uploads at once, in its own pool
+(not the shared threadpool that serves the sync endpoints), and lets up to
+INGEST_QUEUE_SIZE more wait for a slot. Beyond that an upload is refused right
+away with 429 and a Retry-After header, before any parsing, so an upload storm
+can't starve reads of CPU and connections.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+import metrics
+
+logger = logging.getLogger(__name__)
+
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "2"))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "4"))
+INGEST_RETRY_AFTER = int(os.getenv("INGEST_RETRY_AFTER", "10"))  # seconds
+
+_executor = None
+_admitted = threading.BoundedSemaphore(INGEST_CONCURRENCY + INGEST_QUEUE_SIZE)
+_pending = 0
+_lock = threading.Lock()
+
+INGEST_PENDING = metrics.Gauge(
+    "ingest_pending", "Uploads running or waiting in this worker's ingest pool",
+    collect=lambda: {(): _pending}
+)
+INGEST_REJECTED = metrics.Counter("ingest_rejected_total", "Uploads refused with 429 (queue full)", labels=("kind",))
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=INGEST_CONCURRENCY, thread_name_prefix="ingest")
+        return _executor
+
+
+def _release(_future):
+    global _pending
+    with _lock:
+        _pending -= 1
+    _admitted.release()
+
+
+async def run(kind: str, func, *args):
+    """
+    Runs `func(*args)` in the ingest pool and returns its result, or raises
+    429 straight away when INGEST_CONCURRENCY + INGEST_QUEUE_SIZE uploads are
+    already admitted. The request's context (metrics, profiling) goes along.
+    """
+    global _pending
+    if not _admitted.acquire(blocking=False):
+        INGEST_REJECTED.inc(kind=kind)
+        logger.warning("upload rejected: ingest queue full", extra={"kind": kind, "pending": _pending})
+        raise HTTPException(
+            status_code=429,
+            detail="Too many uploads in progress, try again shortly.",
+            headers={"Retry-After": str(INGEST_RETRY_AFTER)},
+        )
+    with _lock:
+        _pending += 1
+    # The slot is freed when the work ends, not when the request does (a client
+    # that disconnects doesn't stop the thread)
+    future = _get_executor().submit(contextvars.copy_context().run, func, *args)
+    future.add_done_callback(_release)
+    return await asyncio.wrap_future(future)
+
+
+def preload():
+    """Imports the upload path (pandas, openpyxl); a no-op once done."""
+    import parser  # noqa: F401
+    import schema  # noqa: F401
+
+
+def start():
+    # pandas/openpyxl take a while to import; pay that once per worker, off the
+    # loop (already done when a preloading gunicorn master imported them)
+    _get_executor().submit(preload)
+
+
+def shutdown():
+    """Lets running and queued uploads finish."""
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
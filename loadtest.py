@@ -0,0 +1,336 @@
+"""
+Load test: latency of the busiest read endpoints under concurrency, checked against a baseline.
+
+Starts uvicorn on a fresh SQLite database (or a local PostgreSQL with
+--database-url), seeds it with synthetic workbooks, then runs `--concurrency`
+virtual users for `--duration` seconds. Each user repeatedly picks a scenario
+from SCENARIOS:
+
+- search:        keystroke burst, /shipments?search= for each prefix of a client name
+- by_day:        /shipments/by-day for a random shipping day
+- deep_page:     /shipments with a random (mostly deep) offset
+- upload_files:  /upload/files
+- payment_data:  /payments/files/{id}/data at a random offset
+- upload:        a small payment workbook posted to /payments/upload
+
+It reports requests/sec and p50/p95/p99 per route. With --save-baseline the
+results are written to BASELINE_FILE; otherwise they are compared with it and
+the script exits with status 1 when a route's p95/p99 grew by more than
+--tolerance (and at least MIN_REGRESSION_MS) or requests failed. Routes with
+fewer than MIN_SAMPLES requests are not compared; raise --duration for them.
+
+Usage:
+    python loadtest.py --concurrency 20 --duration 30 --save-baseline
+    python loadtest.py --concurrency 20 --duration 30
+    python loadtest.py --url http://localhost:8000   # existing server and data
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(REPO_DIR, ".bench_data")
+BASELINE_FILE = os.path.join(REPO_DIR, "loadtest_baseline.json")
+
+# Relative weight of each scenario in the mix
+SCENARIOS = {
+    "search": 3,
+    "by_day": 2,
+    "deep_page": 2,
+    "upload_files": 2,
+    "payment_data": 2,
+    "upload": 1,
+}
+# Smaller latency differences, or routes with fewer requests, are noise
+MIN_REGRESSION_MS = 5.0
+MIN_SAMPLES = 20
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+# ========== SERVER ==========
+
+def start_server(options):
+    """Starts uvicorn on a scratch database; returns (process, base_url)."""
+    workdir = tempfile.mkdtemp(prefix="gold_road_load_")
+    env = dict(
+        os.environ,
+        DATABASE_URL=options.database_url or f"sqlite:///{os.path.join(workdir, 'load.db')}",
+        DATA_VERSION_DIR=os.path.join(workdir, "versions"),
+        MAX_FILE_SIZE_MB="1024",
+        LOG_LEVEL=os.getenv("LOG_LEVEL", "WARNING"),
+    )
+    if options.no_cache:
+        env["RESPONSE_CACHE_SIZE"] = "0"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", REPO_DIR,
+         "--port", str(options.port), "--workers", str(options.workers), "--log-level", "warning"],
+        cwd=workdir, env=env,
+    )
+    return process, f"http://127.0.0.1:{options.port}"
+
+
+async def wait_until_ready(client, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with status {process.returncode}")
+        try:
+            if (await client.get("/health")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Server did not become ready")
+
+
+async def _post_workbook(client, route, path):
+    with open(path, "rb") as f:
+        files = {"file": (os.path.basename(path), f.read(), "application/octet-stream")}
+    response = await client.post(route, files=files)
+    body = response.json()
+    if response.status_code != 200 or body.get("status") == "error":
+        raise RuntimeError(f"{route} failed: {body}")
+    return body
+
+
+async def seed(client, options):
+    import synthetic_data
+
+    print(f"⏳ Seeding {options.rows} shipments and payments...")
+    for kind, route in (("shipments", "/upload"), ("payments", "/payments/upload")):
+        path = synthetic_data.cached_workbook(DATA_DIR, kind, options.rows, options.seed, 0.01, 0.02)
+        await _post_workbook(client, route, path)
+
+
+async def discover(client):
+    """Clients, days, totals and payment files the scenarios draw from."""
+    shipments = (await client.get("/shipments", params={"limit": 200})).json()
+    payment_files = (await client.get("/payments/files")).json()["files"]
+    days = (await client.get("/shipments/days")).json()["days"]
+    clients = sorted({row["العميل"] for row in shipments["data"] if row["العميل"]})
+    if not clients or not days or not payment_files:
+        raise RuntimeError("No data to load test; run without --url or upload some workbooks first")
+    return {
+        "clients": clients,
+        "days": days,
+        "shipment_total": shipments["total"],
+        "payment_files": [(f["id"], f["record_count"]) for f in payment_files],
+    }
+
+
+# ========== SCENARIOS ==========
+
+class Recorder:
+    def __init__(self):
+        self.timings = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.rejected = defaultdict(int)  # 429: shed by upload admission control, not a failure
+
+    async def request(self, client, route, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+            if response.status_code == 429:
+                self.rejected[route] += 1
+                return
+            ok = response.status_code < 400 and not (
+                method == "POST" and response.json().get("status") == "error"
+            )
+        except Exception:
+            ok = False
+        elapsed = (time.perf_counter() - start) * 1000
+        if ok:
+            self.timings[route].append(elapsed)
+        else:
+            self.errors[route] += 1
+
+
+async def search(client, recorder, rng, data, upload):
+    # Typing a client name: one request per keystroke from the second character on
+    name = rng.choice(data["clients"])
+    for length in range(2, len(name) + 1):
+        await recorder.request(client, "GET /shipments?search", "GET", "/shipments",
+                               params={"search": name[:length], "limit": 50})
+
+
+async def by_day(client, recorder, rng, data, upload):
+    await recorder.request(client, "GET /shipments/by-day", "GET", "/shipments/by-day",
+                           params={"date": rng.choice(data["days"])})
+
+
+async def deep_page(client, recorder, rng, data, upload):
+    # Square of a uniform draw skews towards the end of the list
+    offset = int(data["shipment_total"] * (1 - rng.random() ** 2)) // 50 * 50
+    await recorder.request(client, "GET /shipments?offset", "GET", "/shipments",
+                           params={"limit": 50, "offset": offset})
+
+
+async def upload_files(client, recorder, rng, data, upload):
+    await recorder.request(client, "GET /upload/files", "GET", "/upload/files")
+
+
+async def payment_data(client, recorder, rng, data, upload):
+    file_id, count = rng.choice(data["payment_files"])
+    await recorder.request(client, "GET /payments/files/{id}/data", "GET", f"/payments/files/{file_id}/data",
+                           params={"limit": 50, "offset": rng.randrange(0, max(count, 1), 50)})
+
+
+async def upload_payments(client, recorder, rng, data, upload):
+    files = {"file": (f"load_{rng.randrange(10 ** 6)}.xlsx", upload, "application/octet-stream")}
+    await recorder.request(client, "POST /payments/upload", "POST", "/payments/upload", files=files)
+
+
+SCENARIO_FUNCTIONS = {
+    "search": search,
+    "by_day": by_day,
+    "deep_page": deep_page,
+    "upload_files": upload_files,
+    "payment_data": payment_data,
+    "upload": upload_payments,
+}
+
+
+async def virtual_user(client, recorder, rng, data, upload, deadline, mix):
+    names, weights = zip(*mix.items())
+    while time.monotonic() < deadline:
+        scenario = rng.choices(names, weights)[0]
+        await SCENARIO_FUNCTIONS[scenario](client, recorder, rng, data, upload)
+
+
+async def run(options):
+    import httpx
+    import synthetic_data
+
+    process = None
+    base_url = options.url
+    if not base_url:
+        process, base_url = start_server(options)
+    try:
+        limits = httpx.Limits(max_connections=options.concurrency + 1)
+        async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+            await wait_until_ready(client, process)
+            if process is not None:
+                await seed(client, options)
+            data = await discover(client)
+            upload_path = synthetic_data.cached_workbook(DATA_DIR, "payments", options.upload_rows, options.seed + 1)
+            with open(upload_path, "rb") as f:
+                upload = f.read()
+
+            mix = {name: weight for name, weight in SCENARIOS.items() if name not in options.skip}
+            recorder = Recorder()
+            print(f"⏳ {options.concurrency} users for {options.duration}s against {base_url}...")
+            started = time.monotonic()
+            deadline = started + options.duration
+            await asyncio.gather(*(
+                virtual_user(client, recorder, random.Random(options.seed + i), data, upload, deadline, mix)
+                for i in range(options.concurrency)
+            ))
+            elapsed = time.monotonic() - started
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    results = {}
+    for route in sorted(set(recorder.timings) | set(recorder.errors) | set(recorder.rejected)):
+        timings = recorder.timings[route]
+        results[route] = {
+            "requests": len(timings),
+            "errors": recorder.errors[route],
+            "rejected": recorder.rejected[route],
+            "rps": round(len(timings) / elapsed, 1),
+            "p50_ms": round(_percentile(timings, 50), 2) if timings else None,
+            "p95_ms": round(_percentile(timings, 95), 2) if timings else None,
+            "p99_ms": round(_percentile(timings, 99), 2) if timings else None,
+        }
+    return results
+
+
+# ========== REPORT ==========
+
+def regressions(results, baseline, tolerance):
+    """Human-readable list of routes slower than the baseline, or failing."""
+    problems = []
+    for route, result in results.items():
+        if result["errors"]:
+            problems.append(f"{route}: {result['errors']} failed requests")
+        old = baseline.get(route)
+        if not old or result["requests"] < MIN_SAMPLES:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if old[key] and result[key] > old[key] * (1 + tolerance) and result[key] - old[key] >= MIN_REGRESSION_MS:
+                problems.append(f"{route}: {key[:3]} {old[key]:.1f} -> {result[key]:.1f} ms")
+    return problems
+
+
+def report(results):
+    print(f"  {'route':<32} {'reqs':>7} {'err':>5} {'429':>5} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for route, r in results.items():
+        latencies = "".join(f"{r[key]:>9.1f}" if r[key] is not None else f"{'-':>9}"
+                            for key in ("p50_ms", "p95_ms", "p99_ms"))
+        print(f"  {route:<32} {r['requests']:>7} {r['errors']:>5} {r['rejected']:>5} {r['rps']:>8.1f}{latencies}")
+    print(f"  {'total':<32} {sum(r['requests'] for r in results.values()):>7} "
+          f"{sum(r['errors'] for r in results.values()):>5} {sum(r['rejected'] for r in results.values()):>5} "
+          f"{sum(r['rps'] for r in results.values()):>8.1f}")
+
+
+if __name__ == "__main__":
+    arguments = argparse.ArgumentParser(description="Load test the read endpoints against a latency baseline")
+    arguments.add_argument("--concurrency", type=int, default=20, help="virtual users")
+    arguments.add_argument("--duration", type=float, default=30, help="seconds")
+    arguments.add_argument("--rows", type=int, default=10000, help="rows per seeded workbook")
+    arguments.add_argument("--upload-rows", type=int, default=200, help="rows per workbook in the upload scenario")
+    arguments.add_argument("--seed", type=int, default=42)
+    arguments.add_argument("--skip", nargs="*", default=[], choices=sorted(SCENARIOS), help="scenarios to leave out")
+    arguments.add_argument("--url", help="test a running server and its data instead of starting one")
+    arguments.add_argument("--database-url", help="database for the started server (default: fresh SQLite file)")
+    arguments.add_argument("--port", type=int, default=8765)
+    arguments.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    arguments.add_argument("--no-cache", action="store_true", help="disable the in-process response cache")
+    arguments.add_argument("--baseline", default=BASELINE_FILE)
+    arguments.add_argument("--save-baseline", action="store_true", help="store these results as the baseline")
+    arguments.add_argument("--tolerance", type=float, default=0.25, help="allowed p95/p99 growth (0.25 = 25%%)")
+    options = arguments.parse_args()
+
+    params = {
+        "concurrency": options.concurrency, "duration": options.duration, "rows": options.rows,
+        "skip": sorted(options.skip), "workers": options.workers, "no_cache": options.no_cache,
+        "database": "sqlite" if not options.database_url else options.database_url.split(":")[0],
+    }
+    results = asyncio.run(run(options))
+    report(results)
+
+    if options.save_baseline:
+        with open(options.baseline, "w", encoding="utf-8") as f:
+            json.dump({"recorded_at": datetime.now().isoformat(timespec="seconds"),
+                       "params": params, "results": results}, f, indent=2, ensure_ascii=False)
+        print(f"\n✅ Baseline saved to {options.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(options.baseline):
+        print(f"\n⚠️  No baseline at {options.baseline}; run with --save-baseline first")
+        sys.exit(0)
+    with open(options.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline["params"] != params:
+        print(f"\n⚠️  Baseline was recorded with different parameters: {baseline['params']}")
+    problems = regressions(results, baseline["results"], options.tolerance)
+    if problems:
+        print(f"\n❌ Regressed against the baseline from {baseline['recorded_at']}:")
+        for problem in problems:
+            print(f"  - {problem}")
+        sys.exit(1)
+    print(f"\n✅ Within {options.tolerance:.0%} of the baseline from {baseline['recorded_at']}")
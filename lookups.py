@@ -0,0 +1,98 @@
+"""
+Dictionary encoding of the low-cardinality payment columns.
+
+The FIELDS of PaymentRecord (branch, status, agent, ...) have only a few hundred
+distinct values between them, so payment rows store `<field>_id` integers
+pointing at `payment_lookups` (field, value) instead of repeating the strings.
+PaymentRecord.<field> decodes them again, so API output is unchanged.
+
+Ids are never reused or changed, so every process keeps the table in memory:
+encoding at ingest and decoding for the API are dict lookups, and the database
+is only asked about values this process hasn't seen yet. Async handlers call
+`await db.run_sync(lookups.refresh)` when `known(ids)` is false; elsewhere a
+decode miss reloads the table.
+"""
+import threading
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+from database import SessionLocal, PaymentLookup
+from dialects import get_ops
+
+FIELDS = (
+    "branch", "origin_branch", "service", "sender_city", "recipient_city", "payment_type",
+    "price_type", "delivery_type", "return_type", "shipping_agent", "status", "order_type",
+)
+
+_ids = {}  # (field, value) -> id, committed rows only
+_values = {}  # id -> value
+_lock = threading.Lock()
+
+
+def _remember(rows, encode: bool = True):
+    with _lock:
+        for lookup_id, field, value in rows:
+            _values[lookup_id] = value
+            if encode:
+                _ids[(field, value)] = lookup_id
+
+
+def refresh(db: Session):
+    """Loads the whole lookup table."""
+    _remember(db.execute(select(PaymentLookup.id, PaymentLookup.field, PaymentLookup.value)).all())
+
+
+def known(ids):
+    return all(lookup_id is None or lookup_id in _values for lookup_id in ids)
+
+
+def decode(lookup_id: int):
+    if lookup_id is None:
+        return None
+    if lookup_id not in _values:
+        db = SessionLocal()
+        try:
+            refresh(db)
+        finally:
+            db.close()
+    return _values[lookup_id]
+
+
+def encode_records(db: Session, records: list):
+    """
+    Replaces each FIELDS value in records (dicts keyed by attribute name) with
+    `<field>_id`, adding unseen values to the lookup table in the caller's transaction.
+    """
+    missing = {
+        (field, str(record[field]))
+        for record in records for field in FIELDS
+        if record.get(field) is not None and (field, str(record[field])) not in _ids
+    }
+    batch = {}
+    if missing:
+        # New values come back from RETURNING; they aren't committed yet, so they
+        # are only remembered for decoding (their ids are never handed out again)
+        inserted = db.execute(
+            get_ops(db).insert(PaymentLookup)
+            .on_conflict_do_nothing(index_elements=["field", "value"])
+            .returning(PaymentLookup.id, PaymentLookup.field, PaymentLookup.value),
+            [{"field": field, "value": value} for field, value in missing],
+        ).all()
+        _remember(inserted, encode=False)
+        batch.update({(field, value): lookup_id for lookup_id, field, value in inserted})
+
+        existing = missing - set(batch)
+        if existing:
+            rows = db.execute(
+                select(PaymentLookup.id, PaymentLookup.field, PaymentLookup.value)
+                .where(tuple_(PaymentLookup.field, PaymentLookup.value).in_(existing))
+            ).all()
+            _remember(rows)
+            batch.update({(field, value): lookup_id for lookup_id, field, value in rows})
+
+    for record in records:
+        for field in FIELDS:
+            if field in record:
+                value = record.pop(field)
+                key = (field, str(value))
+                record[f"{field}_id"] = None if value is None else (_ids.get(key) or batch[key])
+    return records
@@ -1,16 +1,66 @@
 import shutil
 import os
-import uuid
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import io
+import logging
+from typing import List
+from pydantic import BaseModel
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Response, Depends, BackgroundTasks
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from constants import CHANGEABLE_STATUSES, TARGET_STATUSES, ALL_STATUSES, STATUS_COLORS
+from constants import (
+    CHANGEABLE_STATUSES, TARGET_STATUSES, ALL_STATUSES, STATUS_COLORS,
+    RECONCILIATION_CATEGORIES, RECONCILIATION_MISSING_PAYMENT
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+import http_cache
+import status_history
+import metrics
+import app_logging
+import profiling
+import storage
+import ingest
+import events
+from async_database import get_async_db, count_rows, async_engine
 
 app = FastAPI(title="Gold Road API")
+logger = logging.getLogger(__name__)
 
 @app.on_event("startup")
 def on_startup():
-    from database import create_tables
-    create_tables()
+    # Per worker process: the queue listener thread doesn't survive a fork
+    app_logging.configure()
+    import database
+    if not database.tables_created:  # a preloading gunicorn master already did it
+        database.create_tables()
+
+@app.on_event("startup")
+async def warm_up_connection_pools():
+    # Connect before the first requests instead of during them
+    from async_database import warm_up_pools
+    await warm_up_pools()
+
+@app.on_event("startup")
+async def start_storage_collector():
+    # Deletes unreferenced uploads and compresses old ones every STORAGE_GC_INTERVAL
+    storage.start_collector()
+
+@app.on_event("shutdown")
+async def stop_storage_collector():
+    storage.stop_collector()
+
+@app.on_event("startup")
+def start_ingest_pool():
+    # Imports pandas in the upload pool so the first upload doesn't pay for it
+    ingest.start()
+
+@app.on_event("shutdown")
+def stop_ingest_pool():
+    # Lets running and queued uploads finish
+    ingest.shutdown()
+
+@app.on_event("shutdown")
+def stop_event_streams():
+    events.stop()
 
 # CORS Configuration - allows frontend to communicate with backend
 app.add_middleware(
@@ -21,18 +71,37 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Create 'uploads' folder if it doesn't exist
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Request latency and per-request DB work, exposed on /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
+def _instrument_engines():
+    from database import engine
+    metrics.instrument_engine(engine, "sync")
+    metrics.instrument_engine(async_engine.sync_engine, "async")
+
+_instrument_engines()
+
+# Per-request profiling for admins (X-Profile-Token), only when PROFILING_TOKEN is set
+if profiling.ENABLED:
+    from database import engine
+    app.add_middleware(profiling.ProfilingMiddleware)
+    profiling.capture_sql(engine, async_engine.sync_engine)
 
 # Configuration
-MAX_FILE_SIZE_MB = 10
+MAX_FILE_SIZE_MB = int(os.getenv("MAX_FILE_SIZE_MB", "10"))
 ALLOWED_EXTENSIONS = [".xlsx"]
+MAX_BULK_STATUS_CODES = 5000
+PROGRESS_LOG_EVERY = 1000  # rows between debug-level progress records during uploads
 
 @app.get("/health")
 def read_health():
     return {"status": "ok"}
 
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus scrape endpoint (this worker's metrics)"""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/statuses")
 def get_statuses():
     """Returns all status constants for frontend use - single source of truth"""
@@ -44,70 +113,63 @@ def get_statuses():
     }
 
 @app.get("/shipments")
-def get_shipments(
+async def get_shipments(
+    request: Request,
     limit: int = 20,
     offset: int = 0,
     search: str = None,
-    status: str = None
+    status: str = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    from database import SessionLocal, Shipment
-    from sqlalchemy import or_
+    from database import Shipment
+    from sqlalchemy import select, or_
+    import schema
     
-    db = SessionLocal()
-    try:
-        # Base query
-        query = db.query(Shipment)
-        
-        # Apply search filter (searches code, client, recipient)
-        if search:
-            search_term = f"%{search}%"
-            query = query.filter(
-                or_(
-                    Shipment.shipment_code.ilike(search_term),
-                    Shipment.client_name.ilike(search_term),
-                    Shipment.recipient_name.ilike(search_term)
-                )
+    cached = http_cache.lookup(request, http_cache.SHIPMENTS)
+    if cached.response:
+        return cached.response
+
+    # Base query
+    query = select(Shipment)
+    
+    # Apply search filter (searches code, client, recipient)
+    if search:
+        search_term = f"%{search}%"
+        query = query.filter(
+            or_(
+                Shipment.shipment_code.ilike(search_term),
+                Shipment.client_name.ilike(search_term),
+                Shipment.recipient_name.ilike(search_term)
             )
-        
-        # Apply status filter
-        if status:
-            query = query.filter(Shipment.status == status)
-        
-        # Get total count before pagination
-        total_count = query.count()
-        
-        # Apply pagination
-        shipments = query.order_by(Shipment.id.desc()).offset(offset).limit(limit).all()
-        
-        result = []
-        for s in shipments:
-            result.append({
-                "الكود": s.shipment_code,
-                "التاريخ": str(s.date) if s.date else None,
-                "العميل": s.client_name,
-                "الوصف": s.description,
-                "الحالة": s.status,
-                "المستلم": s.recipient_name,
-                "مدينة المستلم": s.recipient_city,
-                "قيمة الطرد": s.amount,
-                "نوع السعر": s.price_type,
-                "الوزن": s.weight
-            })
-        
-        return {
-            "data": result,
-            "count": len(result),
-            "total": total_count,
-            "limit": limit,
-            "offset": offset
-        }
-    finally:
-        db.close()
+        )
+    
+    # Apply status filter
+    if status:
+        query = query.filter(Shipment.status == status)
+    
+    # Get total count before pagination
+    total_count = await count_rows(db, query)
+    
+    # Apply pagination
+    shipments = (await db.execute(
+        query.order_by(Shipment.id.desc()).offset(offset).limit(limit)
+    )).scalars().all()
+    
+    result = [schema.shipment_row(s) for s in shipments]
+    
+    return cached.store({
+        "data": result,
+        "count": len(result),
+        "total": total_count,
+        "limit": limit,
+        "offset": offset
+    })
 
 @app.delete("/shipments/{shipment_code}")
 def delete_shipment(shipment_code: str):
     """Delete a specific shipment by its code."""
-    from database import SessionLocal, Shipment
+    from database import SessionLocal, Shipment, ShipmentStatusEvent
+    import changes
     
     db = SessionLocal()
     try:
@@ -115,8 +177,14 @@ def delete_shipment(shipment_code: str):
         if not shipment:
             raise HTTPException(status_code=404, detail="Shipment not found")
         
+        db.query(ShipmentStatusEvent)\
+            .filter(ShipmentStatusEvent.shipment_id == shipment.id)\
+            .delete(synchronize_session=False)
+        changes.record_deletes(db, [shipment.id], changes.version(db))
         db.delete(shipment)
         db.commit()
+        http_cache.bump(http_cache.SHIPMENTS)
+        events.publish("shipment_deleted", code=shipment_code)
         return {"message": "Shipment deleted successfully", "deleted_code": shipment_code}
     except HTTPException:
         raise
@@ -127,111 +195,173 @@ def delete_shipment(shipment_code: str):
         db.close()
 
 @app.get("/shipments/days")
-def get_shipping_days():
+async def get_shipping_days(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Returns list of unique shipping dates (most recent first)"""
-    from database import SessionLocal, Shipment
-    from sqlalchemy import func
+    from database import Shipment
+    from sqlalchemy import select, func
     
-    db = SessionLocal()
-    try:
-        dates = db.query(func.distinct(func.date(Shipment.date)))\
-            .filter(Shipment.date.isnot(None))\
-            .order_by(func.date(Shipment.date).desc())\
-            .limit(30)\
-            .all()
-        
-        return {"days": [str(d[0]) for d in dates if d[0]]}
-    finally:
-        db.close()
+    cached = http_cache.lookup(request, http_cache.SHIPMENTS)
+    if cached.response:
+        return cached.response
+
+    dates = (await db.execute(
+        select(func.distinct(func.date(Shipment.date)))
+        .filter(Shipment.date.isnot(None))
+        .order_by(func.date(Shipment.date).desc())
+        .limit(30)
+    )).all()
+    
+    return cached.store({"days": [str(d[0]) for d in dates if d[0]]})
 
 @app.get("/shipments/by-day")
-def get_shipments_by_day(date: str):
+async def get_shipments_by_day(request: Request, date: str, db: AsyncSession = Depends(get_async_db)):
     """Returns all orders for a specific date (YYYY-MM-DD format)"""
-    from database import SessionLocal, Shipment
-    from sqlalchemy import func
+    from database import Shipment
+    from sqlalchemy import select, func
     from datetime import datetime
+    import schema
     
-    db = SessionLocal()
+    cached = http_cache.lookup(request, http_cache.SHIPMENTS)
+    if cached.response:
+        return cached.response
+
+    # Parse the date
     try:
-        # Parse the date
-        try:
-            target_date = datetime.strptime(date, "%Y-%m-%d").date()
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
-        
-        # Query shipments for that date
-        shipments = db.query(Shipment)\
-            .filter(func.date(Shipment.date) == target_date)\
-            .order_by(Shipment.id.desc())\
-            .all()
-        
-        result = []
-        for s in shipments:
-            result.append({
-                "الكود": s.shipment_code,
-                "التاريخ": str(s.date) if s.date else None,
-                "العميل": s.client_name,
-                "الوصف": s.description,
-                "الحالة": s.status,
-                "المستلم": s.recipient_name,
-                "مدينة المستلم": s.recipient_city,
-                "قيمة الطرد": s.amount,
-                "نوع السعر": s.price_type,
-                "الوزن": s.weight
-            })
-        
-        return {
-            "date": date,
-            "count": len(result),
-            "data": result
-        }
-    finally:
-        db.close()
+        target_date = datetime.strptime(date, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    
+    # Query shipments for that date
+    shipments = (await db.execute(
+        select(Shipment)
+        .filter(func.date(Shipment.date) == target_date)
+        .order_by(Shipment.id.desc())
+    )).scalars().all()
+    
+    result = [schema.shipment_row(s) for s in shipments]
+    
+    return cached.store({
+        "date": date,
+        "count": len(result),
+        "data": result
+    })
 
 @app.get("/shipments/search")
-def search_shipments_global(query: str, limit: int = 50):
+async def search_shipments_global(
+    request: Request,
+    query: str,
+    limit: int = 50,
+    db: AsyncSession = Depends(get_async_db)
+):
     """Search shipments across all days by code, client, recipient, or description"""
-    from database import SessionLocal, Shipment
-    from sqlalchemy import or_
+    from database import Shipment
+    from sqlalchemy import select, or_
+    import schema
     
     if not query or len(query) < 2:
         raise HTTPException(status_code=400, detail="Search query must be at least 2 characters")
     
+    cached = http_cache.lookup(request, http_cache.SHIPMENTS)
+    if cached.response:
+        return cached.response
+
+    search_term = f"%{query}%"
+    shipments = (await db.execute(
+        select(Shipment)
+        .filter(
+            or_(
+                Shipment.shipment_code.ilike(search_term),
+                Shipment.client_name.ilike(search_term),
+                Shipment.recipient_name.ilike(search_term),
+                Shipment.description.ilike(search_term)
+            )
+        )
+        .order_by(Shipment.date.desc())
+        .limit(limit)
+    )).scalars().all()
+    
+    result = [schema.shipment_row(s) for s in shipments]
+    
+    return cached.store({
+        "query": query,
+        "count": len(result),
+        "data": result
+    })
+
+@app.get("/shipments/changes")
+async def get_shipment_changes(
+    since: str = "0",
+    limit: int = 1000,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Shipments inserted, updated or deleted after the `since` cursor, for clients
+    that keep a local copy. Start with since=0, then pass `next_since` back;
+    call again straight away while `has_more` is true.
+
+    Not cached: what a cursor returns depends on the change horizon, which
+    transactions that don't touch shipments (and so don't bump the cache) move.
+    """
+    from database import ShipmentTombstone
+    import changes
+    import schema
+
+    try:
+        changes.parse_cursor(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid since cursor, use the next_since of the last response")
+    limit = max(1, min(limit, changes.MAX_CHANGES))
+
+    rows, next_since, has_more = await changes.read_changes(db, since, limit)
+    result = [
+        # Same key as in the rows, so clients drop the shipment they keep under it
+        {"op": "delete", "shipment": {"الكود": row.shipment_code}}
+        if isinstance(row, ShipmentTombstone) else
+        {"op": "upsert", "shipment": schema.shipment_row(row)}
+        for row in rows
+    ]
+    return {
+        "changes": result,
+        "count": len(result),
+        "next_since": next_since,
+        "has_more": has_more
+    }
+
+@app.get("/shipments/status-aging")
+def get_status_aging(status: str = None, since: str = None):
+    """How long shipments stay in each status, from the status history (since = YYYY-MM-DD)"""
+    from database import SessionLocal
+    from datetime import datetime
+
+    try:
+        since_date = datetime.strptime(since, "%Y-%m-%d") if since else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+
     db = SessionLocal()
     try:
-        search_term = f"%{query}%"
-        shipments = db.query(Shipment)\
-            .filter(
-                or_(
-                    Shipment.shipment_code.ilike(search_term),
-                    Shipment.client_name.ilike(search_term),
-                    Shipment.recipient_name.ilike(search_term),
-                    Shipment.description.ilike(search_term)
-                )
-            )\
-            .order_by(Shipment.date.desc())\
-            .limit(limit)\
-            .all()
-        
-        result = []
-        for s in shipments:
-            result.append({
-                "الكود": s.shipment_code,
-                "التاريخ": str(s.date) if s.date else None,
-                "العميل": s.client_name,
-                "الوصف": s.description,
-                "الحالة": s.status,
-                "المستلم": s.recipient_name,
-                "مدينة المستلم": s.recipient_city,
-                "قيمة الطرد": s.amount,
-                "نوع السعر": s.price_type,
-                "الوزن": s.weight
-            })
-        
         return {
-            "query": query,
-            "count": len(result),
-            "data": result
+            "status": status,
+            "since": since,
+            "data": status_history.dwell_times(db, status, since_date)
+        }
+    finally:
+        db.close()
+
+@app.get("/shipments/{shipment_code}/history")
+def get_shipment_history(shipment_code: str):
+    """Status history of a shipment, oldest first"""
+    from database import SessionLocal, Shipment
+
+    db = SessionLocal()
+    try:
+        shipment = db.query(Shipment).filter(Shipment.shipment_code == shipment_code).first()
+        if not shipment:
+            raise HTTPException(status_code=404, detail="Shipment not found")
+        return {
+            "shipment_code": shipment_code,
+            "status": shipment.status,
+            "history": status_history.history(db, shipment.id)
         }
     finally:
         db.close()
@@ -240,6 +370,7 @@ def search_shipments_global(query: str, limit: int = 50):
 def update_shipment_status(shipment_code: str, new_status: str):
     """Update the status of a shipment. Only allows specific status transitions."""
     from database import SessionLocal, Shipment
+    import changes
     
     # Use centralized constants
     if new_status not in TARGET_STATUSES:
@@ -266,7 +397,11 @@ def update_shipment_status(shipment_code: str, new_status: str):
         # Update the status
         old_status = shipment.status
         shipment.status = new_status
+        shipment.change_version = changes.version(db)
+        status_history.record(db, [(shipment.id, new_status)])
         db.commit()
+        http_cache.bump(http_cache.SHIPMENTS)
+        events.publish("status_changed", codes=[shipment_code], status=new_status)
         
         return {
             "success": True,
@@ -282,6 +417,89 @@ def update_shipment_status(shipment_code: str, new_status: str):
     finally:
         db.close()
 
+class BulkStatusUpdate(BaseModel):
+    codes: List[str]
+    new_status: str
+
+
+@app.patch("/shipments/status")
+def bulk_update_shipment_status(payload: BulkStatusUpdate):
+    """Update the status of many shipments at once. Returns an outcome per code."""
+    from database import SessionLocal, Shipment
+    from sqlalchemy import update
+    import changes
+    
+    if payload.new_status not in TARGET_STATUSES:
+        raise HTTPException(
+            status_code=400, 
+            detail=f"Invalid target status. Allowed: {', '.join(TARGET_STATUSES)}"
+        )
+    
+    # De-duplicate while keeping the caller's order
+    codes = list(dict.fromkeys(code for code in payload.codes if code))
+    if not codes:
+        raise HTTPException(status_code=400, detail="No shipment codes given")
+    if len(codes) > MAX_BULK_STATUS_CODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many shipment codes. Maximum is {MAX_BULK_STATUS_CODES} per request."
+        )
+    
+    db = SessionLocal()
+    try:
+        # 1. Current statuses of all requested codes in one query
+        current = dict(
+            db.query(Shipment.shipment_code, Shipment.status)
+            .filter(Shipment.shipment_code.in_(codes))
+            .all()
+        )
+        changeable = [code for code, status in current.items() if status in CHANGEABLE_STATUSES]
+        
+        # 2. One set-based UPDATE; the status guard is repeated so concurrent changes are respected
+        updated_rows = []
+        if changeable:
+            updated_rows = db.execute(
+                update(Shipment)
+                .where(
+                    Shipment.shipment_code.in_(changeable),
+                    Shipment.status.in_(CHANGEABLE_STATUSES)
+                )
+                .values(status=payload.new_status, change_version=changes.version(db))
+                .returning(Shipment.id, Shipment.shipment_code)
+                .execution_options(synchronize_session=False)
+            ).all()
+            status_history.record(db, [(row.id, payload.new_status) for row in updated_rows])
+        updated = {row.shipment_code for row in updated_rows}
+        db.commit()
+        if updated:
+            http_cache.bump(http_cache.SHIPMENTS)
+            events.publish("status_changed", codes=[code for code in codes if code in updated], status=payload.new_status)
+        
+        results = []
+        for code in codes:
+            if code in updated:
+                outcome = "updated"
+            elif code in current:
+                outcome = "not_changeable"
+            else:
+                outcome = "not_found"
+            results.append({"shipment_code": code, "outcome": outcome, "old_status": current.get(code)})
+        
+        return {
+            "new_status": payload.new_status,
+            "updated": len(updated),
+            "not_found": sum(1 for r in results if r["outcome"] == "not_found"),
+            "not_changeable": sum(1 for r in results if r["outcome"] == "not_changeable"),
+            "results": results
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to update statuses: {str(e)}")
+    finally:
+        db.close()
+
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
     # 1. Validate file extension
@@ -295,33 +513,34 @@ async def upload_file(file: UploadFile = File(...)):
     if file_size_mb > MAX_FILE_SIZE_MB:
         raise HTTPException(status_code=400, detail=f"File too large. Maximum size is {MAX_FILE_SIZE_MB}MB.")
     
-    # 3. Generate unique filename to avoid overwrites
-    unique_id = str(uuid.uuid4())[:8]
-    safe_filename = f"{unique_id}_{file.filename}"
-    file_path = os.path.join(UPLOAD_DIR, safe_filename)
-    
-    # 4. Save the file to disk
-    with open(file_path, "wb") as buffer:
-        buffer.write(contents)
-        
-    # Parse the file
+    # Parse and load off the event loop, in the bounded ingest pool
+    return await ingest.run("shipments", _ingest_shipment_file, file.filename, contents, file_size_mb)
+
+def _ingest_shipment_file(filename: str, contents: bytes, file_size_mb: float):
+    """Parses a shipments workbook and saves it (runs in the ingest pool)."""
     try:
-        from parser import parse_excel
+        from parser import read_workbook
         from database import SessionLocal
         import crud
+        import schema
         
         # 1. Parsing
-        result = parse_excel(file_path)
-        parsed_data = result["preview_data"] 
+        timer = metrics.PhaseTimer("shipments", source=filename)
+        df = read_workbook(io.BytesIO(contents))
+        timer.done("parse", rows=len(df), size_mb=round(file_size_mb, 2))
+        records = schema.SHIPMENTS.ingest(df)
         
         # A) Get DB Session
         db = SessionLocal()
         try:
-            # B) Save to DB
-            result = crud.save_upload(db, file.filename, parsed_data)
+            # B) Keep the workbook (once per content) and save to DB
+            blob_hash = storage.store(db, contents)
+            result = crud.save_upload(db, filename, records, timer=timer, blob_hash=blob_hash)
+            http_cache.bump(http_cache.SHIPMENTS)
+            events.publish("upload_completed", kind="shipments", file_id=result["file_id"], rows=result["inserted"])
             return {
                 "file_id": result["file_id"],
-                "filename": file.filename,
+                "filename": filename,
                 "status": "success", 
                 "message": "File uploaded and data inserted successfully!",
                 "rows_inserted": result["inserted"],
@@ -331,54 +550,86 @@ async def upload_file(file: UploadFile = File(...)):
             db.close()
 
     except Exception as e:
-        return {"filename": file.filename, "status": "error", "message": f"Error processing file: {str(e)}"}
+        logger.exception("shipment upload failed", extra={"kind": "shipments", "source": filename})
+        return {"filename": filename, "status": "error", "message": f"Error processing file: {str(e)}"}
 
 
 
 # ========== SHIPMENT FILES ENDPOINTS ==========
 
 @app.get("/upload/files")
-def get_uploaded_files():
+async def get_uploaded_files(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Returns list of uploaded shipment files with record counts"""
-    from database import SessionLocal, UploadedFile, Shipment
-    from sqlalchemy import func
+    from database import UploadedFile, Shipment
+    from sqlalchemy import select, func
     
-    db = SessionLocal()
-    try:
-        # distinct count of shipments per file
-        # Using a subquery or join to get counts
-        files = db.query(UploadedFile).order_by(UploadedFile.upload_date.desc()).all()
+    cached = http_cache.lookup(request, http_cache.SHIPMENTS)
+    if cached.response:
+        return cached.response
+
+    # Shipment counts for all files in one grouped subquery (not one count per file)
+    counts = select(Shipment.file_id, func.count(Shipment.id).label("record_count"))\
+        .group_by(Shipment.file_id)\
+        .subquery()
+    rows = (await db.execute(
+        select(UploadedFile, counts.c.record_count)
+        .outerjoin(counts, counts.c.file_id == UploadedFile.id)
+        .filter(UploadedFile.is_deleting.isnot(True))
+        .order_by(UploadedFile.upload_date.desc())
+    )).all()
+    
+    result = []
+    for f, count in rows:
+        result.append({
+            "id": f.id,
+            "filename": f.filename,
+            "upload_date": str(f.upload_date) if f.upload_date else None,
+            "record_count": count or 0
+        })
         
-        result = []
-        for f in files:
-            count = db.query(func.count(Shipment.id)).filter(Shipment.file_id == f.id).scalar()
-            result.append({
-                "id": f.id,
-                "filename": f.filename,
-                "upload_date": str(f.upload_date) if f.upload_date else None,
-                "record_count": count or 0
-            })
-            
-        return {"files": result}
-    finally:
-        db.close()
+    return cached.store({"files": result})
 
 @app.delete("/upload/files/{file_id}")
-def delete_uploaded_file(file_id: int):
-    """Delete an uploaded file and all its shipments (cascading)"""
-    from database import SessionLocal, UploadedFile
+def delete_uploaded_file(file_id: int, background_tasks: BackgroundTasks, response: Response):
+    """Delete an uploaded file and all its shipments (large files are purged in the background)"""
+    from database import SessionLocal, UploadedFile, Shipment
+    from sqlalchemy import func
+    import purge
     
     db = SessionLocal()
     try:
         file = db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
-        if not file:
+        if not file or file.is_deleting:
             raise HTTPException(status_code=404, detail="File not found")
             
         filename = file.filename
-        db.delete(file) # Cascades to shipments due to relationship
+        shipment_count = db.query(func.count(Shipment.id)).filter(Shipment.file_id == file_id).scalar()
+
+        if shipment_count > purge.BACKGROUND_PURGE_THRESHOLD:
+            # Hide the file now, delete its shipments in batches after responding
+            file.is_deleting = True
+            db.commit()
+            http_cache.bump(http_cache.SHIPMENTS)
+            events.publish("file_deleted", kind="shipments", file_id=file_id)
+            background_tasks.add_task(
+                purge.purge_file, UploadedFile, Shipment, file_id,
+                on_done=lambda: http_cache.bump(http_cache.SHIPMENTS)
+            )
+            response.status_code = 202
+            return {
+                "message": f"Deleting file {filename} and its {shipment_count} shipments in the background",
+                "file_id": file_id,
+                "status": "deleting"
+            }
+
+        purge.delete_file_rows(db, UploadedFile, Shipment, file_id)
         db.commit()
+        http_cache.bump(http_cache.SHIPMENTS)
+        events.publish("file_deleted", kind="shipments", file_id=file_id)
         
         return {"message": f"Deleted file {filename} and its shipments", "file_id": file_id}
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to delete file: {str(e)}")
@@ -386,117 +637,152 @@ def delete_uploaded_file(file_id: int):
         db.close()
 
 @app.get("/shipments/file/{file_id}")
-def get_shipments_by_file(
+async def get_shipments_by_file(
+    request: Request,
     file_id: int,
     limit: int = 50,
     offset: int = 0,
-    search: str = None
+    search: str = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get shipments belonging to a specific file"""
-    from database import SessionLocal, Shipment, UploadedFile
-    from sqlalchemy import or_
+    from database import Shipment, UploadedFile
+    from sqlalchemy import select, or_
+    import schema
     
-    db = SessionLocal()
-    try:
-        # Check if file exists
-        file = db.query(UploadedFile).filter(UploadedFile.id == file_id).first()
-        if not file:
-            raise HTTPException(status_code=404, detail="File not found")
-            
-        query = db.query(Shipment).filter(Shipment.file_id == file_id)
+    cached = http_cache.lookup(request, http_cache.SHIPMENTS)
+    if cached.response:
+        return cached.response
+
+    # Check if file exists
+    file = await db.get(UploadedFile, file_id)
+    if not file or file.is_deleting:
+        raise HTTPException(status_code=404, detail="File not found")
         
-        if search:
-            search_term = f"%{search}%"
-            query = query.filter(
-                or_(
-                    Shipment.shipment_code.ilike(search_term),
-                    Shipment.client_name.ilike(search_term),
-                    Shipment.recipient_name.ilike(search_term)
-                )
+    query = select(Shipment).filter(Shipment.file_id == file_id)
+    
+    if search:
+        search_term = f"%{search}%"
+        query = query.filter(
+            or_(
+                Shipment.shipment_code.ilike(search_term),
+                Shipment.client_name.ilike(search_term),
+                Shipment.recipient_name.ilike(search_term)
             )
-            
-        total_count = query.count()
-        shipments = query.order_by(Shipment.id.asc()).offset(offset).limit(limit).all()
+        )
         
-        result = []
-        for s in shipments:
-            result.append({
-                "الكود": s.shipment_code,
-                "التاريخ": str(s.date) if s.date else None,
-                "العميل": s.client_name,
-                "الوصف": s.description,
-                "الحالة": s.status,
-                "المستلم": s.recipient_name,
-                "مدينة المستلم": s.recipient_city,
-                "قيمة الطرد": s.amount,
-                "نوع السعر": s.price_type,
-                "الوزن": s.weight
-            })
-            
-        return {
-            "file_id": file_id,
-            "filename": file.filename,
-            "data": result,
-            "total": total_count,
-            "limit": limit,
-            "offset": offset
-        }
-    finally:
-        db.close()
+    total_count = await count_rows(db, query)
+    shipments = (await db.execute(
+        query.order_by(Shipment.id.asc()).offset(offset).limit(limit)
+    )).scalars().all()
+    
+    result = [schema.shipment_row(s) for s in shipments]
+        
+    return cached.store({
+        "file_id": file_id,
+        "filename": file.filename,
+        "data": result,
+        "total": total_count,
+        "limit": limit,
+        "offset": offset
+    })
 
 
 # ========== PAYMENT PROCESSING ENDPOINTS ==========
 
 @app.get("/payments/files")
-def get_payment_files():
+async def get_payment_files(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Returns list of all uploaded payment files for grid display"""
-    from database import SessionLocal, PaymentFile
+    from database import PaymentFile
+    from sqlalchemy import select
     
-    db = SessionLocal()
-    try:
-        files = db.query(PaymentFile).order_by(PaymentFile.upload_date.desc()).all()
-        return {
-            "files": [
-                {
-                    "id": f.id,
-                    "filename": f.filename,
-                    "upload_date": str(f.upload_date) if f.upload_date else None,
-                    "record_count": f.record_count
-                }
-                for f in files
-            ]
-        }
-    finally:
-        db.close()
+    cached = http_cache.lookup(request, http_cache.PAYMENTS)
+    if cached.response:
+        return cached.response
+
+    files = (await db.execute(
+        select(PaymentFile)
+        .filter(PaymentFile.is_deleting.isnot(True))
+        .order_by(PaymentFile.upload_date.desc())
+    )).scalars().all()
+    return cached.store({
+        "files": [
+            {
+                "id": f.id,
+                "filename": f.filename,
+                "upload_date": str(f.upload_date) if f.upload_date else None,
+                "record_count": f.record_count
+            }
+            for f in files
+        ]
+    })
 
 
 @app.delete("/payments/files/{file_id}")
-def delete_payment_file(file_id: int):
-    """Delete a payment file and all its records"""
-    from database import SessionLocal, PaymentFile, PaymentRecord
-    
+def delete_payment_file(file_id: int, background_tasks: BackgroundTasks, response: Response):
+    """Delete a payment file and all its records (large files are purged in the background)"""
+    from database import SessionLocal, PaymentFile, PaymentRecord, ReconciliationResult
+    import rollups
+    import settlements
+    import purge
+    import partitions
+    import analytics
+
     db = SessionLocal()
     try:
         # Check if file exists
         file = db.query(PaymentFile).filter(PaymentFile.id == file_id).first()
-        if not file:
+        if not file or file.is_deleting:
             raise HTTPException(status_code=404, detail="Payment file not found")
         
         filename = file.filename
+        # Only runs once the delete has succeeded
+        background_tasks.add_task(
+            analytics.remove_payment_file, file_id,
+            on_done=lambda: http_cache.bump(http_cache.PAYMENTS)
+        )
         
-        # Delete all records for this file first
-        deleted_records = db.query(PaymentRecord).filter(PaymentRecord.file_id == file_id).delete()
-        
-        # Delete the file record
-        db.delete(file)
+        # Subtract this file from the dashboard rollups before its records go away
+        rollups.apply_payment_file(db, file_id, sign=-1)
+        settlements.remove_payment_file(db, file_id)
+
+        # Drop stored reconciliation results for this file
+        db.query(ReconciliationResult)\
+            .filter(ReconciliationResult.payment_file_id == file_id)\
+            .delete(synchronize_session=False)
+
+        # A file with its own partition is purged in the background too: dropping the
+        # partition locks payment_records, so it gets its own short transaction there
+        if partitions.has_file_partition(db, file_id) or (file.record_count or 0) > purge.BACKGROUND_PURGE_THRESHOLD:
+            # Hide the file now, delete its records after responding
+            file.is_deleting = True
+            db.commit()
+            http_cache.bump(http_cache.PAYMENTS)
+            events.publish("file_deleted", kind="payments", file_id=file_id)
+            background_tasks.add_task(
+                purge.purge_file, PaymentFile, PaymentRecord, file_id,
+                on_done=lambda: http_cache.bump(http_cache.PAYMENTS)
+            )
+            response.status_code = 202
+            return {
+                "status": "deleting",
+                "message": f"Deleting {filename} and its {file.record_count} records in the background"
+            }
+
+        # Delete all records and the file record with two set-based statements
+        deleted_records = purge.delete_file_rows(db, PaymentFile, PaymentRecord, file_id)
         db.commit()
+        http_cache.bump(http_cache.PAYMENTS)
+        events.publish("file_deleted", kind="payments", file_id=file_id)
         
-        print(f"🗑️ Deleted payment file: {filename} ({deleted_records} records)")
+        logger.info("deleted payment file", extra={"file_id": file_id, "source": filename, "rows": deleted_records})
         
         return {
             "status": "success",
             "message": f"Deleted {filename} and {deleted_records} records"
         }
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to delete: {str(e)}")
@@ -505,311 +791,281 @@ def delete_payment_file(file_id: int):
 
 
 @app.get("/payments/files/{file_id}/data")
-def get_payment_file_data(
+async def get_payment_file_data(
+    request: Request,
     file_id: int,
     limit: int = 20,
     offset: int = 0,
-    search: str = None
+    search: str = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Returns records from a specific payment file with pagination, search, and stats"""
-    from database import SessionLocal, PaymentFile, PaymentRecord
-    from sqlalchemy import or_, func
+    from database import PaymentFile, PaymentRecord
+    from sqlalchemy import select, or_, func
+    import lookups
+    import schema
     
-    db = SessionLocal()
-    try:
-        # Check if file exists
-        file = db.query(PaymentFile).filter(PaymentFile.id == file_id).first()
-        if not file:
-            raise HTTPException(status_code=404, detail="Payment file not found")
-        
-        # Base query
-        query = db.query(PaymentRecord).filter(PaymentRecord.file_id == file_id)
-        
-        # Apply search filter
-        if search:
-            search_term = f"%{search}%"
-            query = query.filter(
-                or_(
-                    PaymentRecord.code.ilike(search_term),
-                    PaymentRecord.recipient_name.ilike(search_term),
-                    PaymentRecord.sender_name.ilike(search_term),
-                    PaymentRecord.client_name.ilike(search_term),
-                    PaymentRecord.reference_number.ilike(search_term),
-                    PaymentRecord.description.ilike(search_term)
-                )
+    cached = http_cache.lookup(request, http_cache.PAYMENTS)
+    if cached.response:
+        return cached.response
+
+    # Check if file exists
+    file = await db.get(PaymentFile, file_id)
+    if not file or file.is_deleting:
+        raise HTTPException(status_code=404, detail="Payment file not found")
+    
+    # Base query
+    query = select(PaymentRecord).filter(PaymentRecord.file_id == file_id)
+    
+    # Apply search filter
+    if search:
+        search_term = f"%{search}%"
+        query = query.filter(
+            or_(
+                PaymentRecord.code.ilike(search_term),
+                PaymentRecord.recipient_name.ilike(search_term),
+                PaymentRecord.sender_name.ilike(search_term),
+                PaymentRecord.client_name.ilike(search_term),
+                PaymentRecord.reference_number.ilike(search_term),
+                PaymentRecord.description.ilike(search_term)
             )
-        
-        # Get total count before pagination
-        total_count = query.count()
-        
-        # Calculate totals for all matching records (before pagination)
-        totals = db.query(
-            func.sum(PaymentRecord.delivery_value).label('total_delivery_value'),
-            func.sum(PaymentRecord.due_fees).label('total_due_fees'),
-            func.sum(PaymentRecord.net_package_price).label('total_net_package_price'),
-            func.sum(PaymentRecord.amount_due).label('total_amount_due')
-        ).filter(PaymentRecord.file_id == file_id)
-        
-        if search:
-            search_term = f"%{search}%"
-            totals = totals.filter(
-                or_(
-                    PaymentRecord.code.ilike(search_term),
-                    PaymentRecord.recipient_name.ilike(search_term),
-                    PaymentRecord.sender_name.ilike(search_term),
-                    PaymentRecord.client_name.ilike(search_term),
-                    PaymentRecord.reference_number.ilike(search_term),
-                    PaymentRecord.description.ilike(search_term)
-                )
+        )
+    
+    # Get total count before pagination
+    total_count = await count_rows(db, query)
+    
+    # Calculate totals for all matching records (before pagination)
+    totals = select(
+        func.sum(PaymentRecord.delivery_value).label('total_delivery_value'),
+        func.sum(PaymentRecord.due_fees).label('total_due_fees'),
+        func.sum(PaymentRecord.net_package_price).label('total_net_package_price'),
+        func.sum(PaymentRecord.amount_due).label('total_amount_due')
+    ).filter(PaymentRecord.file_id == file_id)
+    
+    if search:
+        search_term = f"%{search}%"
+        totals = totals.filter(
+            or_(
+                PaymentRecord.code.ilike(search_term),
+                PaymentRecord.recipient_name.ilike(search_term),
+                PaymentRecord.sender_name.ilike(search_term),
+                PaymentRecord.client_name.ilike(search_term),
+                PaymentRecord.reference_number.ilike(search_term),
+                PaymentRecord.description.ilike(search_term)
             )
-        
-        totals_result = totals.first()
-        
-        # Apply pagination
-        records = query.order_by(PaymentRecord.id.desc()).offset(offset).limit(limit).all()
-        
-        result = []
-        for r in records:
-            result.append({
-                "المستحق": r.amount_due,
-                "الكود": r.code,
-                "التاريخ": str(r.date) if r.date else None,
-                "الحالة": r.status,
-                "الفرع": r.branch,
-                "فرع المنشأ": r.origin_branch,
-                "الخدمة": r.service,
-                "اسم الراسل": r.sender_name,
-                "مدينة الراسل": r.sender_city,
-                "منطقة الراسل": r.sender_area,
-                "الرمز البريدي للراسل": r.sender_postal_code,
-                "الرقم المرجعي": r.reference_number,
-                "المستلم": r.recipient_name,
-                "مدينة المستلم": r.recipient_city,
-                "منطقة المستلم": r.recipient_area,
-                "عنوان المستلم": r.recipient_address,
-                "الرمز البريدي للمستلم": r.recipient_postal_code,
-                "هاتف المستلم": r.recipient_phone,
-                "موبايل المستلم": r.recipient_mobile,
-                "الوصف": r.description,
-                "الوزن": r.weight,
-                "عدد القطع": r.pieces_count,
-                "قيمة الطرد": r.package_value,
-                "الرسوم": r.fees,
-                "صافي سعر الطرد": r.net_package_price,
-                "القيمة الإجمالية": r.total_value,
-                "قيمة التسليم": r.delivery_value,
-                "الرسوم المحصلة": r.collected_fees,
-                "الرسوم المستحقة": r.due_fees,
-                "نوع الدفع": r.payment_type,
-                "نوع السعر": r.price_type,
-                "نوع التسليم": r.delivery_type,
-                "نوع المرتجع للراسل": r.return_type,
-                "مندوب الشحن": r.shipping_agent,
-                "تم التحصيل": r.is_collected,
-                "تم السداد للعميل": r.paid_to_client,
-                "ملاحظات": r.notes,
-                "امكانية فتح الطرد": r.can_open_package,
-                "العميل": r.client_name,
-                "سبب الإرجاع": r.return_reason,
-                "نوع الطلب": r.order_type,
-                "تاريخ التسليم/الإلغاء": str(r.delivery_cancel_date) if r.delivery_cancel_date else None,
-                "قيمة المرتجع": r.return_value,
-                "عدد المحاولات": r.attempts_count,
-                "تاريخ التوصيل": str(r.delivery_date) if r.delivery_date else None,
-                "تم الإلغاء": r.is_cancelled,
-                "تاريخ أخر حركة": str(r.last_movement_date) if r.last_movement_date else None,
-                "سداد مستحقات العملاء": r.client_dues_payment
-            })
-        
+        )
+    
+    totals_result = (await db.execute(totals)).first()
+    
+    # Apply pagination
+    records = (await db.execute(
+        query.order_by(PaymentRecord.id.desc()).offset(offset).limit(limit)
+    )).scalars().all()
+
+    # Decoding the lookup columns is a dict lookup once this worker knows the values
+    lookup_ids = [getattr(r, f"{field}_id") for r in records for field in lookups.FIELDS]
+    if not lookups.known(lookup_ids):
+        await db.run_sync(lookups.refresh)
+    
+    result = [schema.payment_row(r) for r in records]
+    
+    return cached.store({
+        "file_id": file_id,
+        "filename": file.filename,
+        "total": total_count,
+        "count": len(result),
+        "limit": limit,
+        "offset": offset,
+        "totals": {
+            "delivery_value": float(totals_result.total_delivery_value or 0),
+            "due_fees": float(totals_result.total_due_fees or 0),
+            "net_package_price": float(totals_result.total_net_package_price or 0),
+            "amount_due": float(totals_result.total_amount_due or 0),
+            "net_due": float(totals_result.total_delivery_value or 0) - float(totals_result.total_due_fees or 0)
+        },
+        "data": result
+    })
+
+
+@app.get("/payments/summary/month-to-date")
+def get_payment_month_to_date(
+    month: str = None,
+    branch: str = None,
+    client_name: str = None,
+    status: str = None
+):
+    """Month-to-date payment totals (YYYY-MM, defaults to current month), served from rollups"""
+    from database import SessionLocal
+    from datetime import date, datetime, timedelta
+    import rollups
+
+    today = date.today()
+    try:
+        month_start = datetime.strptime(month, "%Y-%m").date() if month else today.replace(day=1)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid month format. Use YYYY-MM")
+
+    # End of the month, capped at today for the current month
+    next_month = (month_start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    month_end = min(next_month - timedelta(days=1), today)
+
+    db = SessionLocal()
+    try:
+        totals = rollups.summarize(db, month_start, month_end, branch, client_name, status)
         return {
-            "file_id": file_id,
-            "filename": file.filename,
-            "total": total_count,
-            "count": len(result),
-            "limit": limit,
-            "offset": offset,
-            "totals": {
-                "delivery_value": float(totals_result.total_delivery_value or 0),
-                "due_fees": float(totals_result.total_due_fees or 0),
-                "net_package_price": float(totals_result.total_net_package_price or 0),
-                "amount_due": float(totals_result.total_amount_due or 0),
-                "net_due": float(totals_result.total_delivery_value or 0) - float(totals_result.total_due_fees or 0)
-            },
-            "data": result
+            "month": month_start.strftime("%Y-%m"),
+            "start": str(month_start),
+            "end": str(month_end),
+            "totals": totals
+        }
+    finally:
+        db.close()
+
+
+@app.get("/payments/summary/trend")
+def get_payment_trend(
+    start: str = None,
+    end: str = None,
+    group_by: str = "day",
+    branch: str = None,
+    client_name: str = None,
+    status: str = None
+):
+    """Payment totals per day or month between start and end (YYYY-MM-DD, default last 30 days)"""
+    from database import SessionLocal
+    from datetime import date, datetime, timedelta
+    import rollups
+
+    if group_by not in ("day", "month"):
+        raise HTTPException(status_code=400, detail="group_by must be 'day' or 'month'")
+    try:
+        end_date = datetime.strptime(end, "%Y-%m-%d").date() if end else date.today()
+        start_date = datetime.strptime(start, "%Y-%m-%d").date() if start else end_date - timedelta(days=29)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+
+    db = SessionLocal()
+    try:
+        series = rollups.summarize(
+            db, start_date, end_date, branch, client_name, status, group_by_day=True
+        )
+
+        if group_by == "month":
+            # Rollups are daily; fold days into months in memory (at most a few hundred rows)
+            months = {}
+            for point in series:
+                bucket = months.setdefault(point["day"][:7], {"month": point["day"][:7]})
+                for name, value in point.items():
+                    if name != "day":
+                        bucket[name] = bucket.get(name, 0) + value
+            series = list(months.values())
+
+        return {
+            "start": str(start_date),
+            "end": str(end_date),
+            "group_by": group_by,
+            "series": series
         }
     finally:
         db.close()
 
 
 @app.post("/payments/upload")
-async def upload_payment_file(file: UploadFile = File(...)):
+async def upload_payment_file(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     """Upload and parse a payment Excel file"""
-    import pandas as pd
-    from database import SessionLocal, PaymentFile, PaymentRecord
-    from datetime import datetime
-    import traceback
-    
-    print(f"\n{'='*50}")
-    print(f"📤 PAYMENT UPLOAD STARTED: {file.filename}")
-    print(f"{'='*50}")
+    log_fields = {"kind": "payments", "source": file.filename}
+    logger.info("payment upload started", extra=log_fields)
     
     # 1. Validate file extension
-    print("Step 1: Validating file extension...")
     file_ext = os.path.splitext(file.filename)[1].lower()
     if file_ext not in ALLOWED_EXTENSIONS:
-        print(f"❌ Invalid file type: {file_ext}")
+        logger.warning("rejected upload: invalid file type", extra={**log_fields, "extension": file_ext})
         raise HTTPException(status_code=400, detail=f"Invalid file type. Only {', '.join(ALLOWED_EXTENSIONS)} files are allowed.")
-    print(f"✅ File extension OK: {file_ext}")
     
     # 2. Check file size
-    print("Step 2: Checking file size...")
     contents = await file.read()
     file_size_mb = len(contents) / (1024 * 1024)
-    print(f"   File size: {file_size_mb:.2f} MB")
     if file_size_mb > MAX_FILE_SIZE_MB:
-        print(f"❌ File too large")
+        logger.warning("rejected upload: file too large", extra={**log_fields, "size_mb": round(file_size_mb, 2)})
         raise HTTPException(status_code=400, detail=f"File too large. Maximum size is {MAX_FILE_SIZE_MB}MB.")
-    print("✅ File size OK")
-    
-    # 3. Save file to disk
-    print("Step 3: Saving file to disk...")
-    unique_id = str(uuid.uuid4())[:8]
-    safe_filename = f"payment_{unique_id}_{file.filename}"
-    file_path = os.path.join(UPLOAD_DIR, safe_filename)
-    
-    try:
-        with open(file_path, "wb") as buffer:
-            buffer.write(contents)
-        print(f"✅ File saved: {file_path}")
-    except Exception as e:
-        print(f"❌ Failed to save file: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to save file: {str(e)}")
     
-    # 4. Parse Excel
-    print("Step 4: Parsing Excel file...")
+    # Parse and load off the event loop, in the bounded ingest pool
+    return await ingest.run(
+        "payments", _ingest_payment_file, file.filename, contents, file_size_mb, background_tasks
+    )
+
+def _ingest_payment_file(filename: str, contents: bytes, file_size_mb: float, background_tasks: BackgroundTasks):
+    """Parses a payment workbook and saves it (runs in the ingest pool)."""
+    from parser import read_workbook
+    import analytics
+    import lookups
+    import schema
+    from database import SessionLocal, PaymentFile, PaymentRecord
+    import rollups
+    import settlements
+    import partitions
+    from dialects import get_ops
+
+    log_fields = {"kind": "payments", "source": filename}
+
+    # 3. Parse Excel
+    timer = metrics.PhaseTimer("payments", source=filename)
     try:
-        df = pd.read_excel(file_path)
-        print(f"✅ Excel parsed: {len(df)} rows, {len(df.columns)} columns")
-        print(f"   Columns: {list(df.columns)[:5]}... (showing first 5)")
+        df = read_workbook(io.BytesIO(contents))
+        timer.done("parse", rows=len(df), columns=len(df.columns), size_mb=round(file_size_mb, 2))
     except Exception as e:
-        print(f"❌ Failed to parse Excel: {e}")
+        logger.exception("failed to parse upload", extra=log_fields)
         raise HTTPException(status_code=500, detail=f"Failed to parse Excel: {str(e)}")
     
-    # 5. Save to database
-    print("Step 5: Saving to database...")
+    # 4. Save to database
     db = SessionLocal()
+    partitioned_id = None
     try:
-        # Create payment file record
-        print("   Creating PaymentFile record...")
+        # The file's own partition, committed before the load so its DDL locks aren't held through it
+        partitioned_id = partitions.reserve_file_partition(db.get_bind())
+
+        # Create payment file record, keeping the workbook (once per content)
         payment_file = PaymentFile(
-            filename=file.filename,
-            record_count=len(df)
+            id=partitioned_id,
+            filename=filename,
+            record_count=len(df),
+            blob_hash=storage.store(db, contents)
         )
         db.add(payment_file)
         db.flush()
-        print(f"✅ PaymentFile created with ID: {payment_file.id}")
+        timer.context["file_id"] = payment_file.id
         
-        # Column mapping (Arabic to model attribute) - ALL 48 columns
-        column_map = {
-            "المستحق": "amount_due",
-            "الكود": "code",
-            "التاريخ": "date",
-            "الحالة": "status",
-            "الفرع": "branch",
-            "فرع المنشأ": "origin_branch",
-            "الخدمة": "service",
-            "اسم الراسل": "sender_name",
-            "مدينة الراسل": "sender_city",
-            "منطقة الراسل": "sender_area",
-            "الرمز البريدي للراسل": "sender_postal_code",
-            "الرقم المرجعي": "reference_number",
-            "المستلم": "recipient_name",
-            "مدينة المستلم": "recipient_city",
-            "منطقة المستلم": "recipient_area",
-            "عنوان المستلم": "recipient_address",
-            "الرمز البريدي للمستلم": "recipient_postal_code",
-            "هاتف المستلم": "recipient_phone",
-            "موبايل المستلم": "recipient_mobile",
-            "الوصف": "description",
-            "الوزن": "weight",
-            "عدد القطع": "pieces_count",
-            "قيمة الطرد": "package_value",
-            "الرسوم": "fees",
-            "صافي سعر الطرد": "net_package_price",
-            "القيمة الإجمالية": "total_value",
-            "قيمة التسليم": "delivery_value",
-            "الرسوم المحصلة": "collected_fees",
-            "الرسوم المستحقة": "due_fees",
-            "نوع الدفع": "payment_type",
-            "نوع السعر": "price_type",
-            "نوع التسليم": "delivery_type",
-            "نوع المرتجع للراسل": "return_type",
-            "مندوب الشحن": "shipping_agent",
-            "تم التحصيل": "is_collected",
-            "تم السداد للعميل": "paid_to_client",
-            "ملاحظات": "notes",
-            "امكانية فتح الطرد": "can_open_package",
-            "العميل": "client_name",
-            "سبب الإرجاع": "return_reason",
-            "نوع الطلب": "order_type",
-            "تاريخ التسليم/الإلغاء": "delivery_cancel_date",
-            "قيمة المرتجع": "return_value",
-            "عدد المحاولات": "attempts_count",
-            "تاريخ التوصيل": "delivery_date",
-            "تم الإلغاء": "is_cancelled",
-            "تاريخ أخر حركة": "last_movement_date",
-            "سداد مستحقات العملاء": "client_dues_payment"
-        }
+        # Workbook columns to PaymentRecord attributes, converted column by column
+        records = schema.PAYMENTS.ingest(df, file_id=payment_file.id)
         
-        # Date columns that need special handling
-        date_columns = {"date", "delivery_cancel_date", "delivery_date", "last_movement_date"}
+        timer.done("clean", rows=len(records))
+        lookups.encode_records(db, records)
+        # One bulk insert, split into PROGRESS_LOG_EVERY-row batches only when progress is logged
+        batch_size = PROGRESS_LOG_EVERY if logger.isEnabledFor(logging.DEBUG) else max(len(records), 1)
+        for start in range(0, len(records), batch_size):
+            inserted = get_ops(db).bulk_insert(db, PaymentRecord, records[start:start + batch_size])
+            logger.debug("payment rows inserted", extra={**log_fields, "file_id": payment_file.id,
+                                                         "rows": start + inserted, "total": len(records)})
         
-        # Insert records
-        print(f"   Inserting {len(df)} records...")
-        for idx, row in df.iterrows():
-            record_data = {"file_id": payment_file.id}
-            
-            for arabic_col, attr_name in column_map.items():
-                if arabic_col in df.columns:
-                    value = row[arabic_col]
-                    
-                    # Handle NaN values
-                    if pd.isna(value):
-                        value = None
-                    # Handle date columns - convert to None if not a valid date
-                    elif attr_name in date_columns and value is not None:
-                        try:
-                            if isinstance(value, str):
-                                # Try to parse string date
-                                value = pd.to_datetime(value)
-                            elif not isinstance(value, (datetime, pd.Timestamp)):
-                                value = None
-                        except:
-                            value = None
-                    # Convert numpy types to Python types
-                    elif hasattr(value, 'item'):
-                        value = value.item()
-                    
-                    record_data[attr_name] = value
-            
-            try:
-                record = PaymentRecord(**record_data)
-                db.add(record)
-            except Exception as e:
-                print(f"❌ Error on row {idx}: {e}")
-                print(f"   Data: {record_data}")
-                raise
-            
-            # Progress every 100 rows
-            if (idx + 1) % 100 == 0:
-                print(f"   Processed {idx + 1}/{len(df)} rows...")
-        
-        print("   Committing to database...")
+        # Update dashboard rollups and the client ledger in the same transaction
+        rollups.apply_payment_file(db, payment_file.id)
+        settlements.apply_payment_file(db, payment_file.id)
+        timer.done("insert", rows=len(records))
+
         db.commit()
-        print(f"✅ SUCCESS! Inserted {len(df)} records")
+        timer.done("commit", rows=len(records))
+        metrics.INGEST_ROWS.inc(len(records), kind="payments")
+        http_cache.bump(http_cache.PAYMENTS)
+        events.publish("upload_completed", kind="payments", file_id=payment_file.id, rows=len(records))
+
+        # Columnar copy for /analytics, written after responding
+        background_tasks.add_task(
+            analytics.archive_payment_file, payment_file.id, payment_file.upload_date, records,
+            on_done=lambda: http_cache.bump(http_cache.PAYMENTS)
+        )
         
         return {
-            "filename": file.filename,
+            "filename": filename,
             "status": "success",
             "message": "Payment file uploaded successfully!",
             "file_id": payment_file.id,
@@ -818,10 +1074,247 @@ async def upload_payment_file(file: UploadFile = File(...)):
         
     except Exception as e:
         db.rollback()
-        print(f"❌ DATABASE ERROR: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception("payment upload failed", extra={**log_fields, **timer.context})
+        if partitioned_id is not None:
+            partitions.discard_file_partition(db.get_bind(), partitioned_id)
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
     finally:
         db.close()
 
 
+# ========== CLIENT SETTLEMENT ENDPOINTS ==========
+
+@app.get("/clients/settlements")
+def get_client_settlements(request: Request, search: str = None, limit: int = 100, offset: int = 0):
+    """Settlement statements for all clients across every payment file"""
+    from database import SessionLocal
+    import settlements
+
+    cached = http_cache.lookup(request, http_cache.PAYMENTS)
+    if cached.response:
+        return cached.response
+
+    db = SessionLocal()
+    try:
+        total_count, statements = settlements.client_statements(db, search, limit, offset)
+        return cached.store({
+            "data": statements,
+            "count": len(statements),
+            "total": total_count,
+            "limit": limit,
+            "offset": offset
+        })
+    finally:
+        db.close()
+
+
+@app.get("/clients/settlements/{client_name}")
+def get_client_settlement(request: Request, client_name: str):
+    """Settlement statement of one client with a per-payment-file breakdown"""
+    from database import SessionLocal
+    import settlements
+
+    cached = http_cache.lookup(request, http_cache.PAYMENTS)
+    if cached.response:
+        return cached.response
+
+    db = SessionLocal()
+    try:
+        statement = settlements.client_statement(db, client_name)
+        if statement is None:
+            raise HTTPException(status_code=404, detail="Client not found")
+        return cached.store(statement)
+    finally:
+        db.close()
+
+
+# ========== RECONCILIATION ENDPOINTS ==========
+
+@app.post("/payments/files/{file_id}/reconcile")
+def reconcile_payment_file(file_id: int):
+    """Reconcile a payment file against shipments and store the per-code results"""
+    from database import SessionLocal, PaymentFile
+    import reconciliation
+
+    db = SessionLocal()
+    try:
+        file = db.query(PaymentFile).filter(PaymentFile.id == file_id).first()
+        if not file or file.is_deleting:
+            raise HTTPException(status_code=404, detail="Payment file not found")
+
+        summary = reconciliation.reconcile_payment_file(db, file_id)
+        db.commit()
+        return dict(summary, filename=file.filename)
+    except HTTPException:
+        raise
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(status_code=500, detail=f"Failed to reconcile: {str(e)}")
+    finally:
+        db.close()
+
+
+@app.get("/payments/files/{file_id}/reconciliation")
+def get_reconciliation_results(
+    file_id: int,
+    category: str = None,
+    limit: int = 50,
+    offset: int = 0
+):
+    """Returns the stored reconciliation results of a payment file"""
+    from database import SessionLocal, PaymentFile, ReconciliationResult
+    from sqlalchemy import func
+
+    # Missing payments aren't stored per payment file, they are computed globally
+    if category == RECONCILIATION_MISSING_PAYMENT:
+        raise HTTPException(
+            status_code=400,
+            detail=f"'{RECONCILIATION_MISSING_PAYMENT}' is not a per-file category, use /reconciliation/missing-payments"
+        )
+    if category and category not in RECONCILIATION_CATEGORIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid category. Allowed: {', '.join(c for c in RECONCILIATION_CATEGORIES if c != RECONCILIATION_MISSING_PAYMENT)}"
+        )
+
+    db = SessionLocal()
+    try:
+        file = db.query(PaymentFile).filter(PaymentFile.id == file_id).first()
+        if not file or file.is_deleting:
+            raise HTTPException(status_code=404, detail="Payment file not found")
+
+        counts = dict(
+            db.query(ReconciliationResult.category, func.count(ReconciliationResult.id))
+            .filter(ReconciliationResult.payment_file_id == file_id)
+            .group_by(ReconciliationResult.category)
+            .all()
+        )
+
+        query = db.query(ReconciliationResult).filter(ReconciliationResult.payment_file_id == file_id)
+        if category:
+            query = query.filter(ReconciliationResult.category == category)
+        results = query.order_by(ReconciliationResult.id.asc()).offset(offset).limit(limit).all()
+
+        return {
+            "file_id": file_id,
+            "filename": file.filename,
+            "counts": counts,
+            "limit": limit,
+            "offset": offset,
+            "data": [
+                {
+                    "code": r.code,
+                    "category": r.category,
+                    "payment_amount": r.payment_amount,
+                    "shipment_amount": r.shipment_amount,
+                    "checked_at": str(r.checked_at) if r.checked_at else None
+                }
+                for r in results
+            ]
+        }
+    finally:
+        db.close()
+
+
+@app.get("/reconciliation/missing-payments")
+def get_missing_payments(limit: int = 50, offset: int = 0):
+    """Shipments that do not appear in any payment file"""
+    from database import SessionLocal, Shipment
+    import reconciliation
+    import schema
+
+    db = SessionLocal()
+    try:
+        query = reconciliation.missing_payments_query(db)
+        total_count = query.count()
+        shipments = query.order_by(Shipment.id.desc()).offset(offset).limit(limit).all()
+
+        result = [schema.shipment_brief(s) for s in shipments]
+
+        return {
+            "category": RECONCILIATION_MISSING_PAYMENT,
+            "data": result,
+            "total": total_count,
+            "limit": limit,
+            "offset": offset
+        }
+    finally:
+        db.close()
+
+
+# ========== ANALYTICS ENDPOINTS ==========
+
+@app.get("/analytics/payments")
+def get_payment_analytics_queries():
+    """Available analytics queries over the Parquet archive of payment records"""
+    import analytics
+    return {
+        "queries": [
+            {"name": name, "description": description}
+            for name, (description, _) in analytics.QUERIES.items()
+        ],
+        "filters": list(analytics.FILTERS),
+    }
+
+@app.get("/analytics/payments/{query_name}")
+def run_payment_analytics_query(
+    request: Request,
+    query_name: str,
+    from_month: str = None,
+    to_month: str = None,
+    branch: str = None,
+    client: str = None
+):
+    """Runs a whitelisted aggregate query over the payment archive (months are upload months, YYYY-MM)"""
+    import analytics
+    from datetime import datetime
+
+    if query_name not in analytics.QUERIES:
+        raise HTTPException(status_code=404, detail=f"Unknown query. Available: {', '.join(analytics.QUERIES)}")
+    for month in (from_month, to_month):
+        if month is not None:
+            try:
+                datetime.strptime(month, "%Y-%m")
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid month format. Use YYYY-MM")
+
+    cached = http_cache.lookup(request, http_cache.PAYMENTS)
+    if cached.response:
+        return cached.response
+
+    return cached.store(analytics.run_query(
+        query_name, from_month=from_month, to_month=to_month, branch=branch, client=client
+    ))
+
+
+# ========== EVENT STREAM ENDPOINTS ==========
+
+@app.get("/events")
+async def stream_events(request: Request):
+    """Server-sent change notifications (see events.py); refetch a list when one concerns it"""
+    return StreamingResponse(
+        events.stream(request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        # X-Accel-Buffering: nginx would otherwise hold events back
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ========== PROFILING ENDPOINTS ==========
+
+@app.get("/admin/profiles")
+def get_profiles(_: None = Depends(profiling.require_admin)):
+    """Stored request profiles, newest first"""
+    return {"profiles": profiling.list_profiles()}
+
+@app.get("/admin/profiles/{profile_id}")
+def get_profile(profile_id: str, format: str = "json", _: None = Depends(profiling.require_admin)):
+    """One profile: SQL statements with timings and sampled stacks, or folded stacks (format=folded)"""
+    if format not in ("json", "folded"):
+        raise HTTPException(status_code=400, detail="format must be 'json' or 'folded'")
+    profile = profiling.load(profile_id, format)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    if format == "folded":
+        return PlainTextResponse(profile)
+    return profile
@@ -0,0 +1,326 @@
+"""
+In-process metrics served on /metrics in the Prometheus text format.
+
+- MetricsMiddleware: request latency per method, route template and status
+- instrument_engine(): SQLAlchemy cursor events counting queries, rows and DB time
+  per request (via a contextvar), plus connection pool checkout wait and gauges
+- PhaseTimer: durations of the upload phases (parse, clean, insert, commit)
+
+Everything is a few dict updates under a lock, cheap enough to leave on.
+Values are per worker process; Prometheus should scrape each worker or sum them.
+"""
+import bisect
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 1000)
+PHASE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REGISTRY = []
+
+
+def _label_key(names, labels):
+    return tuple(str(labels[name]) for name in names)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labels, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in values]
+
+
+class Gauge(Counter):
+    """A value that goes up and down, or is read at scrape time through `collect`."""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labels=(), collect=None):
+        super().__init__(name, documentation, labels)
+        self.collect = collect
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self.collect is None:
+            return super().samples()
+        return [
+            f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+            for key, value in self.collect().items()
+        ]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label key -> [count per bucket (last is +Inf), sum]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labels, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[index] += 1
+            entry[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = [(key, list(entry)) for key, entry in self._values.items()]
+        lines = []
+        for key, entry in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), entry[:-1]):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(entry[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+# ========== HTTP ==========
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Request latency by route template",
+    labels=("method", "route", "status")
+)
+REQUESTS_IN_PROGRESS = Gauge("http_requests_in_progress", "Requests being handled")
+
+
+class RequestStats:
+    """Database work done while handling one request."""
+    __slots__ = ("queries", "rows", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+        self.db_seconds = 0.0
+
+
+_request_stats = ContextVar("request_stats", default=None)
+
+
+def _route_template(scope):
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware (no response buffering) recording latency and DB work per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        REQUESTS_IN_PROGRESS.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_PROGRESS.dec()
+            _request_stats.reset(token)
+
+            route = _route_template(scope)
+            REQUEST_SECONDS.observe(elapsed, method=scope["method"], route=route, status=status[0])
+            DB_QUERIES_PER_REQUEST.observe(stats.queries, route=route)
+            DB_SECONDS_PER_REQUEST.observe(stats.db_seconds, route=route)
+            DB_QUERIES.inc(stats.queries, route=route)
+            DB_ROWS.inc(stats.rows, route=route)
+            DB_SECONDS.inc(stats.db_seconds, route=route)
+
+
+# ========== DATABASE ==========
+
+DB_QUERIES = Counter("db_queries_total", "SQL statements executed", labels=("route",))
+DB_ROWS = Counter("db_rows_total", "Rows returned or affected, as reported by the driver", labels=("route",))
+DB_SECONDS = Counter("db_query_seconds_total", "Time spent executing SQL", labels=("route",))
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "SQL statements per request", labels=("route",), buckets=QUERY_COUNT_BUCKETS
+)
+DB_SECONDS_PER_REQUEST = Histogram(
+    "db_seconds_per_request", "Time spent in SQL per request", labels=("route",)
+)
+
+POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_seconds", "Time waiting for a pooled connection", labels=("engine",)
+)
+POOL_WAITING = Gauge("db_pool_checkout_waiting", "Callers currently waiting for a connection", labels=("engine",))
+
+_engines = {}
+
+
+def _pool_stat(method):
+    def collect():
+        values = {}
+        for name, engine in _engines.items():
+            read = getattr(engine.pool, method, None)
+            if read is not None:  # StaticPool (in-memory SQLite) has no counters
+                values[(name,)] = read()
+        return values
+    return collect
+
+
+POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "Connections in use", labels=("engine",), collect=_pool_stat("checkedout")
+)
+POOL_OVERFLOW = Gauge(
+    "db_pool_overflow", "Connections above the pool size (negative while the pool fills)",
+    labels=("engine",), collect=_pool_stat("overflow")
+)
+POOL_SIZE = Gauge("db_pool_size", "Configured pool size", labels=("engine",), collect=_pool_stat("size"))
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["metrics_query_start"].pop()
+    rows = max(cursor.rowcount, 0)
+    stats = _request_stats.get()
+    if stats is None:
+        # Startup, background tasks and scripts
+        DB_QUERIES.inc(route="background")
+        DB_ROWS.inc(rows, route="background")
+        DB_SECONDS.inc(elapsed, route="background")
+        return
+    stats.queries += 1
+    stats.rows += rows
+    stats.db_seconds += elapsed
+
+
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("metrics_query_start"):
+        connection.info["metrics_query_start"].pop()
+
+
+def instrument_engine(engine, name: str):
+    """Query counters and pool metrics for a (sync) Engine; pass async_engine.sync_engine for async."""
+    if name in _engines:
+        return
+    _engines[name] = engine
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+    # Engine.connect() checks connections out through raw_connection()
+    raw_connection = engine.raw_connection
+
+    def timed_raw_connection():
+        POOL_WAITING.inc(engine=name)
+        start = time.perf_counter()
+        try:
+            return raw_connection()
+        finally:
+            POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - start, engine=name)
+            POOL_WAITING.dec(engine=name)
+
+    engine.raw_connection = timed_raw_connection
+
+
+# ========== INGEST ==========
+
+INGEST_PHASE_SECONDS = Histogram(
+    "ingest_phase_seconds", "Duration of each upload phase", labels=("kind", "phase"), buckets=PHASE_BUCKETS
+)
+INGEST_ROWS = Counter("ingest_rows_total", "Rows inserted by uploads", labels=("kind",))
+
+
+ingest_logger = logging.getLogger("ingest")
+
+
+class PhaseTimer:
+    """
+    Times consecutive phases of one upload: `timer.done("parse", rows=n)` records the
+    time since the timer was created or the previous phase ended, and logs one
+    "ingest" record with the duration, the given fields and the timer's context
+    (e.g. file_id, set once known).
+    """
+
+    def __init__(self, kind: str, **context):
+        self.kind = kind
+        self.context = context
+        self._mark = time.perf_counter()
+
+    def done(self, phase: str, **fields):
+        now = time.perf_counter()
+        elapsed = now - self._mark
+        INGEST_PHASE_SECONDS.observe(elapsed, kind=self.kind, phase=phase)
+        self._mark = now
+        ingest_logger.info(
+            f"{self.kind} {phase} done",
+            extra={"kind": self.kind, "phase": phase, "duration_ms": round(elapsed * 1000, 1),
+                   **self.context, **fields}
+        )
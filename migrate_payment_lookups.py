@@ -0,0 +1,74 @@
+"""
+Dictionary-encode the low-cardinality payment columns (see lookups.py).
+Run this script once to update existing databases:
+
+1. Creates payment_lookups and adds the <field>_id columns to payment_records.
+2. Collects the distinct values of each column into payment_lookups.
+3. Fills all <field>_id columns in one UPDATE (one pass over the table).
+4. Drops the old text columns.
+
+On PostgreSQL run VACUUM FULL payment_records afterwards to give the space back.
+"""
+import logging
+from sqlalchemy import inspect, text
+import app_logging
+from database import engine, PaymentLookup
+import lookups
+import schema
+
+logger = logging.getLogger(__name__)
+
+# lookups.FIELDS attribute -> old text column (named after the workbook header)
+OLD_COLUMNS = {attribute: header for header, attribute in schema.PAYMENTS.fields if attribute in lookups.FIELDS}
+
+
+def migrate_payment_lookups():
+    logger.info("⏳ Connecting to database...")
+    try:
+        PaymentLookup.__table__.create(bind=engine, checkfirst=True)
+        with engine.begin() as conn:
+            columns = {column["name"] for column in inspect(conn).get_columns("payment_records")}
+            pending = {field: old for field, old in OLD_COLUMNS.items() if old in columns}
+            if not pending:
+                logger.info("ℹ️ payment_records is already encoded")
+                return
+
+            for field in pending:
+                if f"{field}_id" not in columns:
+                    conn.execute(text(
+                        f"ALTER TABLE payment_records ADD COLUMN {field}_id INTEGER REFERENCES payment_lookups (id)"
+                    ))
+            logger.info(f"✅ Added {len(pending)} id columns")
+
+            for field, old in pending.items():
+                conn.execute(text(f"""
+                    INSERT INTO payment_lookups (field, value)
+                    SELECT DISTINCT '{field}', CAST("{old}" AS VARCHAR) FROM payment_records
+                    WHERE "{old}" IS NOT NULL
+                    ON CONFLICT (field, value) DO NOTHING
+                """))
+            count = conn.execute(text("SELECT count(*) FROM payment_lookups")).scalar()
+            logger.info(f"✅ {count} distinct values in payment_lookups")
+
+            assignments = ",\n".join(
+                f"""{field}_id = (SELECT id FROM payment_lookups l
+                    WHERE l.field = '{field}' AND l.value = CAST(payment_records."{old}" AS VARCHAR))"""
+                for field, old in pending.items()
+            )
+            updated = conn.execute(text(f"UPDATE payment_records SET {assignments}")).rowcount
+            logger.info(f"✅ Encoded {updated} payment records")
+
+            conn.execute(text('DROP INDEX IF EXISTS "ix_payment_records_الحالة"'))
+            for old in pending.values():
+                conn.execute(text(f'ALTER TABLE payment_records DROP COLUMN "{old}"'))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_payment_records_status_id ON payment_records (status_id)"))
+            logger.info(f"✅ Dropped {len(pending)} text columns")
+
+        logger.info(f"🎉 SUCCESS: {', '.join(lookups.FIELDS)} are now encoded")
+    except Exception as e:
+        logger.exception(f"❌ FATAL ERROR: {str(e)}")
+
+
+if __name__ == "__main__":
+    app_logging.configure(default_format="text")
+    migrate_payment_lookups()
@@ -0,0 +1,88 @@
+"""
+Move the uploads directory to content-addressed storage (storage.py).
+Run this script once to update existing databases:
+
+1. Creates the stored_blobs table and adds blob_hash to uploaded_files and payment_files.
+2. Stores every legacy upload (`uploads/<id>_<name>.xlsx`, `uploads/payment_<id>_<name>.xlsx`)
+   and links it to the file row with the same name uploaded closest in time.
+3. Removes the legacy files. Files no row matches are kept unless --delete-unmatched
+   is given (their rows were deleted before this, so nothing references them).
+"""
+import os
+import re
+import sys
+import logging
+from datetime import datetime
+from sqlalchemy import inspect, text
+import app_logging
+from database import engine, SessionLocal, StoredBlob, UploadedFile, PaymentFile
+import storage
+
+logger = logging.getLogger(__name__)
+
+# "<8 hex chars>_<original name>", payment files with a "payment_" prefix
+LEGACY_NAME = re.compile(r"^(payment_)?[0-9a-f]{8}_(.+)$")
+
+
+def add_columns():
+    StoredBlob.__table__.create(bind=engine, checkfirst=True)
+    with engine.begin() as conn:
+        for table in ("uploaded_files", "payment_files"):
+            columns = {column["name"] for column in inspect(conn).get_columns(table)}
+            if "blob_hash" not in columns:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN blob_hash VARCHAR(64) REFERENCES stored_blobs (hash)"))
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_blob_hash ON {table} (blob_hash)"))
+                logger.info(f"✅ Column blob_hash added to {table}")
+
+
+def _closest_row(db, model, filename, modified):
+    candidates = db.query(model).filter(model.filename == filename, model.blob_hash.is_(None)).all()
+    if not candidates:
+        return None
+    return min(candidates, key=lambda row: abs(((row.upload_date or modified) - modified).total_seconds()))
+
+
+def migrate_files(delete_unmatched=False):
+    if not os.path.isdir(storage.STORAGE_DIR):
+        logger.info("ℹ️ No uploads directory, nothing to migrate")
+        return
+
+    legacy = sorted(name for name in os.listdir(storage.STORAGE_DIR) if LEGACY_NAME.match(name))
+    logger.info(f"⏳ Migrating {len(legacy)} legacy uploads...")
+    matched = unmatched = 0
+    db = SessionLocal()
+    try:
+        for name in legacy:
+            path = os.path.join(storage.STORAGE_DIR, name)
+            payment_prefix, filename = LEGACY_NAME.match(name).groups()
+            model = PaymentFile if payment_prefix else UploadedFile
+            modified = datetime.utcfromtimestamp(os.path.getmtime(path))
+
+            row = _closest_row(db, model, filename, modified)
+            if row is None:
+                unmatched += 1
+                if delete_unmatched:
+                    os.remove(path)
+                else:
+                    logger.info(f"ℹ️ No {model.__tablename__} row for {name}, kept")
+                continue
+
+            with open(path, "rb") as f:
+                row.blob_hash = storage.store(db, f.read())
+            db.commit()
+            os.remove(path)
+            matched += 1
+
+        logger.info(f"🎉 SUCCESS: {matched} uploads moved to storage, {unmatched} unmatched"
+                    + (" (deleted)" if delete_unmatched else ""))
+    except Exception as e:
+        db.rollback()
+        logger.exception(f"❌ FATAL ERROR: {str(e)}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    app_logging.configure(default_format="text")
+    add_columns()
+    migrate_files(delete_unmatched="--delete-unmatched" in sys.argv)
@@ -1,11 +1,15 @@
 import pandas as pd
 
+def read_workbook(file):
+    """Reads the first sheet of an Excel file (path or file object) into a DataFrame."""
+    # engine='openpyxl' is required for .xlsx files
+    return pd.read_excel(file, engine='openpyxl')
+
 def parse_excel(file_path: str):
     """
     Reads an Excel file and returns its columns and a preview of data.
     """
-    # engine='openpyxl' is required for .xlsx files
-    df = pd.read_excel(file_path, engine='openpyxl')
+    df = read_workbook(file_path)
     
     # Get the list of column names
     columns = list(df.columns)
@@ -19,8 +23,8 @@ def parse_excel(file_path: str):
     for row in raw_data:
         clean_row = {}
         for key, value in row.items():
-            # Check if value is float and is NaN
-            if isinstance(value, float) and (value != value):
+            # Check if value is float and is NaN, or a blank date (NaT)
+            if (isinstance(value, float) and (value != value)) or value is pd.NaT:
                 clean_row[key] = None
             else:
                 clean_row[key] = value
@@ -0,0 +1,93 @@
+"""
+Migrate payment_records to a table list-partitioned by payment file (PostgreSQL only).
+Existing rows are copied into one partition per payment file; rows without a
+file are dropped. Runs in a single transaction and locks payment_records
+while it copies, so run it during a quiet period.
+
+The new table gets the indexes of the current PaymentRecord model, so the
+table has to have its columns already: run migrate_payment_lookups.py first.
+The script checks this and stops otherwise.
+"""
+import logging
+import app_logging
+from database import engine, PaymentRecord
+from partitions import PARENT_TABLE, DEFAULT_PARTITION, partition_name, is_partitioned, bound_default_partition
+from dialects import get_ops
+from sqlalchemy import inspect, text
+
+logger = logging.getLogger(__name__)
+
+NEW_TABLE = f"{PARENT_TABLE}_partitioned"
+
+def partition_payment_records():
+    if not get_ops(engine).supports_partitioning:
+        logger.error("❌ Partitioning is only supported on PostgreSQL")
+        return
+
+    logger.info("⏳ Connecting to database...")
+    try:
+        with engine.begin() as conn:
+            if is_partitioned(conn):
+                logger.info("✅ payment_records is already partitioned, nothing to do")
+                return
+
+            # The indexes below come from the model: its columns have to exist already
+            columns = {column["name"] for column in inspect(conn).get_columns(PARENT_TABLE)}
+            missing = [column.name for column in PaymentRecord.__table__.columns if column.name not in columns]
+            if missing:
+                logger.error(f"❌ payment_records has no {', '.join(missing)} column(s) yet, run migrate_payment_lookups.py first")
+                return
+
+            conn.execute(text(f"LOCK TABLE {PARENT_TABLE} IN ACCESS EXCLUSIVE MODE"))
+
+            # 1. Same columns and id sequence default, partitioned by file
+            logger.info("⏳ Creating partitioned table...")
+            conn.execute(text(
+                f"CREATE TABLE {NEW_TABLE} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS) "
+                f"PARTITION BY LIST (file_id)"
+            ))
+            conn.execute(text(f"ALTER TABLE {NEW_TABLE} ALTER COLUMN file_id SET NOT NULL"))
+
+            # 2. One partition per existing payment file, plus the catch-all
+            file_ids = [row[0] for row in conn.execute(text("SELECT id FROM payment_files ORDER BY id"))]
+            for file_id in file_ids:
+                conn.execute(text(
+                    f"CREATE TABLE {partition_name(file_id)} "
+                    f"PARTITION OF {NEW_TABLE} FOR VALUES IN ({file_id})"
+                ))
+            conn.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {NEW_TABLE} DEFAULT"))
+            logger.info(f"✅ Created {len(file_ids)} file partitions")
+
+            # 3. Copy the data
+            logger.info("⏳ Copying records...")
+            copied = conn.execute(text(
+                f"INSERT INTO {NEW_TABLE} SELECT * FROM {PARENT_TABLE} WHERE file_id IS NOT NULL"
+            )).rowcount
+            logger.info(f"✅ Copied {copied} records")
+
+            # 4. Swap tables, keeping the id sequence
+            conn.execute(text(f"ALTER SEQUENCE {PARENT_TABLE}_id_seq OWNED BY NONE"))
+            conn.execute(text(f"DROP TABLE {PARENT_TABLE}"))
+            conn.execute(text(f"ALTER TABLE {NEW_TABLE} RENAME TO {PARENT_TABLE}"))
+            conn.execute(text(f"ALTER SEQUENCE {PARENT_TABLE}_id_seq OWNED BY {PARENT_TABLE}.id"))
+
+            # 5. Constraints and indexes (propagated to every partition)
+            logger.info("⏳ Creating constraints and indexes...")
+            conn.execute(text(f"ALTER TABLE {PARENT_TABLE} ADD PRIMARY KEY (id, file_id)"))
+            conn.execute(text(
+                f"ALTER TABLE {PARENT_TABLE} ADD CONSTRAINT {PARENT_TABLE}_file_id_fkey "
+                f"FOREIGN KEY (file_id) REFERENCES payment_files (id) ON DELETE CASCADE"
+            ))
+            for index in PaymentRecord.__table__.indexes:
+                index.create(bind=conn)
+            # New uploads attach partitions without scanning the default one
+            bound_default_partition(conn)
+
+        logger.info("🎉 SUCCESS: payment_records is now partitioned by payment file!")
+
+    except Exception as e:
+        logger.exception(f"❌ FATAL ERROR: {str(e)}")
+
+if __name__ == "__main__":
+    app_logging.configure(default_format="text")
+    partition_payment_records()
@@ -0,0 +1,153 @@
+"""
+PostgreSQL list partitioning of payment_records by payment file.
+
+Every payment file gets its own partition (payment_records_f<id>), created when
+the file is uploaded. Deleting the file detaches and drops that partition instead
+of deleting rows one by one, and per-file reads only scan that partition.
+Rows of files without their own partition land in payment_records_default,
+which only takes files that existed before partitioning (bound_default_partition).
+
+Partition DDL never runs inside an upload or delete transaction: it locks
+payment_records, so it gets a short transaction of its own, bounded by
+PARTITION_LOCK_TIMEOUT. The partition is created before the upload's load, and
+dropped by the background purge after the delete has hidden the file.
+
+On other databases, or on a PostgreSQL table that hasn't been migrated yet
+(partition_payment_records.py), every function here is a no-op.
+"""
+import logging
+import os
+from sqlalchemy import text
+from dialects import get_ops
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = "payment_records"
+DEFAULT_PARTITION = "payment_records_default"
+DEFAULT_BOUND_CONSTRAINT = f"{DEFAULT_PARTITION}_file_id_bound"
+# Give up on DDL that waits this long for the table lock, rather than queue every
+# read of payment_records behind it
+PARTITION_LOCK_TIMEOUT = os.getenv("PARTITION_LOCK_TIMEOUT", "5s")
+
+_partitioned = {}
+
+
+def partition_name(file_id: int):
+    return f"{PARENT_TABLE}_f{int(file_id)}"
+
+
+def is_partitioned(bind):
+    """True if payment_records is a partitioned table. Cached per database once true."""
+    if not get_ops(bind).supports_partitioning:
+        return False
+    key = str(bind.engine.url)
+    if not _partitioned.get(key):
+        _partitioned[key] = bind.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table pt "
+            "JOIN pg_class c ON c.oid = pt.partrelid WHERE c.relname = :table)"
+        ), {"table": PARENT_TABLE}).scalar()
+    return _partitioned[key]
+
+
+def ensure_default_partition(engine):
+    """Creates the catch-all partition next to a freshly created partitioned table."""
+    with engine.connect() as conn:
+        if is_partitioned(conn):
+            conn.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT_TABLE} DEFAULT"
+            ))
+            bound_default_partition(conn)
+            conn.commit()
+
+
+def bound_default_partition(conn):
+    """
+    Limits the catch-all partition to the payment files that exist now. Every
+    later file gets its own partition with a larger id, and attaching it has to
+    prove the default partition holds none of its rows: with this CHECK that
+    follows from the constraint, instead of a scan of the default partition
+    under ACCESS EXCLUSIVE on every upload. Runs in the caller's transaction.
+    """
+    exists = conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = :name)"
+    ), {"name": DEFAULT_BOUND_CONSTRAINT}).scalar()
+    if not exists:
+        last_file_id = conn.execute(text("SELECT coalesce(max(id), 0) FROM payment_files")).scalar()
+        conn.execute(text(
+            f"ALTER TABLE {DEFAULT_PARTITION} ADD CONSTRAINT {DEFAULT_BOUND_CONSTRAINT} "
+            f"CHECK (file_id <= {int(last_file_id)})"
+        ))
+
+
+def _set_lock_timeout(conn):
+    conn.execute(text("SELECT set_config('lock_timeout', :timeout, true)"), {"timeout": PARTITION_LOCK_TIMEOUT})
+
+
+def _partition_exists(conn, name: str):
+    return conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar()
+
+
+def reserve_file_partition(engine):
+    """
+    Takes the id for a new payment file and creates its partition, committed in a
+    transaction of its own before the upload's load starts. Returns the id to insert
+    the file with, or None when payment_records isn't partitioned.
+
+    The empty table is created first and then attached, which only takes SHARE
+    UPDATE EXCLUSIVE on payment_records (CREATE TABLE ... PARTITION OF would take
+    ACCESS EXCLUSIVE). Every attempt gets a fresh id, so a retried upload never
+    meets the partition of a failed one (see discard_file_partition).
+    """
+    if not get_ops(engine).supports_partitioning:
+        return None
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            return None
+        file_id = conn.execute(text("SELECT nextval(pg_get_serial_sequence('payment_files', 'id'))")).scalar()
+        name = partition_name(file_id)
+        conn.execute(text(
+            f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        ))
+        _set_lock_timeout(conn)
+        conn.execute(text(
+            f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES IN ({int(file_id)})"
+        ))
+    return file_id
+
+
+def has_file_partition(db, file_id: int):
+    """True if the payment file's records live in a partition of their own."""
+    connection = db.connection()
+    return is_partitioned(connection) and _partition_exists(connection, partition_name(file_id))
+
+
+def drop_file_partition(engine, file_id: int):
+    """
+    Detaches and drops a payment file's partition, committed in a transaction of
+    its own (background purge, or cleanup after a failed upload). Returns False
+    (nothing done) if the file has no partition of its own.
+
+    DETACH ... CONCURRENTLY would avoid the ACCESS EXCLUSIVE lock, but PostgreSQL
+    refuses it while a default partition exists; the lock timeout keeps it short instead.
+    """
+    if not get_ops(engine).supports_partitioning:
+        return False
+    with engine.begin() as conn:
+        if not is_partitioned(conn):
+            return False
+        name = partition_name(file_id)
+        if not _partition_exists(conn, name):
+            return False
+        _set_lock_timeout(conn)
+        conn.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+        conn.execute(text(f"DROP TABLE {name}"))
+    return True
+
+
+def discard_file_partition(engine, file_id: int):
+    """drop_file_partition() for an upload that failed after reserving its partition; never raises."""
+    try:
+        drop_file_partition(engine, file_id)
+    except Exception:
+        # Harmless: an empty partition for an id that is never used again
+        logger.warning("could not drop the partition of a failed upload", extra={"file_id": file_id}, exc_info=True)
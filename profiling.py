@@ -0,0 +1,259 @@
+"""
+On-demand profiling of single requests, for admins.
+
+Set PROFILING_TOKEN to enable it. A request carrying the header
+`X-Profile-Token: <token>` is then run under a sampling profiler, and the SQL it
+executes is captured with timings. The profile is stored under PROFILE_DIR and
+its id returned in the `X-Profile-Id` response header; fetch it from
+/admin/profiles/{id} (JSON) or /admin/profiles/{id}?format=folded (folded stacks
+for flamegraph.pl / speedscope).
+
+The sampler walks every thread's stack each PROFILE_SAMPLE_INTERVAL seconds, so
+both async handlers (event loop) and sync handlers (threadpool) are covered;
+other requests running in the same worker at that moment show up too.
+
+Without PROFILING_TOKEN nothing is installed. With it, unprofiled requests only
+pay a header check and a contextvar lookup per SQL statement.
+"""
+import hmac
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+from fastapi import Header, HTTPException
+from sqlalchemy import event
+
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+ENABLED = bool(PROFILING_TOKEN)
+PROFILE_DIR = os.getenv("PROFILE_DIR", ".profiles")
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))
+MAX_PROFILES = int(os.getenv("MAX_PROFILES", "50"))
+
+TOKEN_HEADER = b"x-profile-token"
+PROFILE_ID_PATTERN = re.compile(r"^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$")
+
+# Leaf frames of threads that are just waiting: idle event loop, idle threadpool
+# workers, the log queue listener and aiosqlite's worker (its SQL time is in "sql")
+IDLE_FRAMES = {
+    ("select", "selectors.py"), ("poll", "selectors.py"), ("wait", "threading.py"),
+    ("dequeue", "handlers.py"), ("_connection_worker_thread", "core.py"),
+}
+# Reading profiles isn't worth a profile of its own
+UNPROFILED_PATH_PREFIX = "/admin/profiles"
+
+_statements = ContextVar("profiled_statements", default=None)
+
+
+def _token_matches(value: bytes):
+    return hmac.compare_digest(value, PROFILING_TOKEN.encode())
+
+
+def require_admin(x_profile_token: str = Header(None)):
+    """Dependency for the profile endpoints."""
+    if not ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    if not x_profile_token or not _token_matches(x_profile_token.encode()):
+        raise HTTPException(status_code=403, detail="Invalid profile token")
+
+
+# ========== SAMPLER ==========
+
+def _folded_stack(frame):
+    """'outer;...;inner' for one thread, or None when the thread is idle."""
+    code = frame.f_code
+    if (code.co_name, os.path.basename(code.co_filename)) in IDLE_FRAMES:
+        return None
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class Sampler(threading.Thread):
+    def __init__(self, interval: float = PROFILE_SAMPLE_INTERVAL):
+        super().__init__(name="request-profiler", daemon=True)
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = _folded_stack(frame)
+                if stack:
+                    self.stacks[stack] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def folded(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+# ========== SQL CAPTURE ==========
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _statements.get() is not None:
+        conn.info.setdefault("profile_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    statements = _statements.get()
+    if statements is None or not conn.info.get("profile_query_start"):
+        return
+    started = conn.info["profile_query_start"].pop()
+    statements.append({
+        "statement": statement,
+        "started_ms": round((started - statements.started) * 1000, 2),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+        "rows": cursor.rowcount,
+        "executemany": executemany,
+    })
+
+
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("profile_query_start"):
+        connection.info["profile_query_start"].pop()
+
+
+def capture_sql(*engines):
+    """Installs the SQL capture on (sync) engines; pass async_engine.sync_engine for async."""
+    for engine in engines:
+        if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+            event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+            event.listen(engine, "handle_error", _handle_error)
+
+
+class _Statements(list):
+    """Captured statements of one profiled request, with its start time."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = time.perf_counter()
+
+
+# ========== STORAGE ==========
+
+def _path(profile_id: str, extension: str):
+    return os.path.join(PROFILE_DIR, f"{profile_id}.{extension}")
+
+
+def _prune():
+    profiles = sorted(name for name in os.listdir(PROFILE_DIR) if name.endswith(".json"))
+    for name in profiles[:-MAX_PROFILES]:
+        profile_id = name[:-len(".json")]
+        for extension in ("json", "folded"):
+            if os.path.exists(_path(profile_id, extension)):
+                os.remove(_path(profile_id, extension))
+
+
+def save(profile: dict, folded: str):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(_path(profile["id"], "folded"), "w", encoding="utf-8") as f:
+        f.write(folded)
+    with open(_path(profile["id"], "json"), "w", encoding="utf-8") as f:
+        json.dump(profile, f, ensure_ascii=False)
+    _prune()
+
+
+def list_profiles():
+    """Summaries of the stored profiles, newest first."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    summaries = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        if name.endswith(".json"):
+            with open(os.path.join(PROFILE_DIR, name), encoding="utf-8") as f:
+                profile = json.load(f)
+            summaries.append({key: profile[key] for key in (
+                "id", "recorded_at", "method", "path", "status", "duration_ms", "sql_ms", "sql_count"
+            )})
+    return summaries
+
+
+def load(profile_id: str, extension: str = "json"):
+    """Stored profile (dict) or folded stacks (str); None if unknown."""
+    if not PROFILE_ID_PATTERN.match(profile_id) or not os.path.exists(_path(profile_id, extension)):
+        return None
+    with open(_path(profile_id, extension), encoding="utf-8") as f:
+        return json.load(f) if extension == "json" else f.read()
+
+
+# ========== MIDDLEWARE ==========
+
+def _profile_requested(scope):
+    if scope["path"].startswith(UNPROFILED_PATH_PREFIX):
+        return False
+    for name, value in scope["headers"]:
+        if name == TOKEN_HEADER:
+            return _token_matches(value)
+    return False
+
+
+class ProfilingMiddleware:
+    """Profiles requests that carry a valid X-Profile-Token header; passes others straight through."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not _profile_requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        status = [500]
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        statements = _Statements()
+        token = _statements.set(statements)
+        sampler = Sampler()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            sampler.stop()
+            duration = time.perf_counter() - statements.started
+            _statements.reset(token)
+
+            sql_ms = sum(s["duration_ms"] for s in statements)
+            save({
+                "id": profile_id,
+                "recorded_at": datetime.utcnow().isoformat(),
+                "method": scope["method"],
+                "path": scope["path"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "status": status[0],
+                "duration_ms": round(duration * 1000, 2),
+                "sql_ms": round(sql_ms, 2),
+                "sql_count": len(statements),
+                # Wall time outside SQL: ORM hydration, serialization, Python code
+                "non_sql_ms": round(duration * 1000 - sql_ms, 2),
+                "sample_interval_ms": PROFILE_SAMPLE_INTERVAL * 1000,
+                "samples": sampler.samples,
+                "sql": list(statements),
+                "top_stacks": [
+                    {"stack": stack, "samples": count} for stack, count in sampler.stacks.most_common(20)
+                ],
+            }, sampler.folded())
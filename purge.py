@@ -0,0 +1,94 @@
+"""
+Set-based deletes of uploaded files and their rows.
+
+Child rows are removed with `DELETE ... WHERE file_id = ?` instead of loading them
+into the session. Files above BACKGROUND_PURGE_THRESHOLD rows are only flagged
+`is_deleting` by the request, and purged afterwards in batches of
+PURGE_BATCH_SIZE rows, committing between batches to keep transactions short.
+Payment files with their own partition (partitions.py) drop it here instead.
+Deleted shipments leave tombstones for delta sync clients (changes.py).
+"""
+import os
+import logging
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+from database import SessionLocal, Shipment, ShipmentStatusEvent
+import changes
+import partitions
+import storage
+
+logger = logging.getLogger(__name__)
+
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "5000"))
+BACKGROUND_PURGE_THRESHOLD = int(os.getenv("BACKGROUND_PURGE_THRESHOLD", "20000"))
+
+# Rows hanging off child rows: child table -> foreign key columns pointing at child.id.
+# Deleted explicitly, set-based, rather than through per-row FK cascades.
+DEPENDENTS = {
+    "shipments": [ShipmentStatusEvent.shipment_id],
+}
+
+
+def _delete_dependents(db: Session, child_model, child_ids):
+    if child_model is Shipment:
+        # Once per transaction: each purge batch commits on its own
+        changes.record_deletes(db, child_ids, changes.version(db))
+    for foreign_key in DEPENDENTS.get(child_model.__tablename__, []):
+        db.execute(delete(foreign_key.table).where(foreign_key.in_(child_ids)))
+
+
+def _delete_file(db: Session, file_model, file_id: int):
+    """Deletes the file row and drops its reference to the stored upload."""
+    blob_hashes = db.execute(
+        delete(file_model).where(file_model.id == file_id).returning(file_model.blob_hash)
+    ).scalars().all()
+    storage.release(db, *blob_hashes)
+
+
+def delete_file_rows(db: Session, file_model, child_model, file_id: int):
+    """Deletes a file and all its child rows with a few set-based statements. Caller commits."""
+    _delete_dependents(
+        db, child_model, select(child_model.id).where(child_model.file_id == file_id)
+    )
+    deleted = db.execute(
+        delete(child_model).where(child_model.file_id == file_id)
+    ).rowcount
+    _delete_file(db, file_model, file_id)
+    return deleted
+
+
+def purge_file(file_model, child_model, file_id: int, on_done=None):
+    """
+    Deletes a file's child rows in batches, then the file itself.
+    Runs outside the request (BackgroundTasks / purge_pending.py) with its own session.
+    """
+    db = SessionLocal()
+    try:
+        deleted = 0
+        if child_model.__tablename__ == partitions.PARENT_TABLE and partitions.drop_file_partition(db.get_bind(), file_id):
+            logger.info("dropped payment file partition", extra={"file_id": file_id})
+        while True:
+            batch = db.execute(
+                select(child_model.id).where(child_model.file_id == file_id).limit(PURGE_BATCH_SIZE)
+            ).scalars().all()
+            if batch:
+                _delete_dependents(db, child_model, batch)
+                db.execute(delete(child_model).where(child_model.id.in_(batch)))
+                db.commit()
+            deleted += len(batch)
+            logger.debug("purge batch deleted", extra={"table": child_model.__tablename__, "file_id": file_id, "rows": deleted})
+            if len(batch) < PURGE_BATCH_SIZE:
+                break
+
+        _delete_file(db, file_model, file_id)
+        db.commit()
+        logger.info("purged file", extra={"table": file_model.__tablename__, "file_id": file_id, "rows": deleted})
+        if on_done:
+            on_done()
+        return deleted
+    except Exception:
+        db.rollback()
+        logger.exception("purge failed", extra={"table": file_model.__tablename__, "file_id": file_id})
+        raise
+    finally:
+        db.close()
@@ -0,0 +1,34 @@
+"""
+Finish background purges that were interrupted (e.g. by a worker restart).
+Deletes every file still flagged is_deleting, in batches.
+"""
+import logging
+import app_logging
+from database import SessionLocal, UploadedFile, Shipment, PaymentFile, PaymentRecord
+from purge import purge_file
+import http_cache
+
+logger = logging.getLogger(__name__)
+
+def purge_pending():
+    db = SessionLocal()
+    try:
+        pending = [
+            (UploadedFile, Shipment, file_id, http_cache.SHIPMENTS)
+            for (file_id,) in db.query(UploadedFile.id).filter(UploadedFile.is_deleting.is_(True)).all()
+        ] + [
+            (PaymentFile, PaymentRecord, file_id, http_cache.PAYMENTS)
+            for (file_id,) in db.query(PaymentFile.id).filter(PaymentFile.is_deleting.is_(True)).all()
+        ]
+    finally:
+        db.close()
+
+    logger.info(f"⏳ {len(pending)} files waiting to be purged...")
+    for file_model, child_model, file_id, family in pending:
+        purge_file(file_model, child_model, file_id)
+        http_cache.bump(family)
+    logger.info("✅ Done!")
+
+if __name__ == "__main__":
+    app_logging.configure(default_format="text")
+    purge_pending()
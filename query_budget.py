@@ -0,0 +1,118 @@
+"""
+Query budgets for tests: fail when an API call runs more SQL statements, or
+fetches more rows, than it is allowed to.
+
+    with QueryBudget(max_queries=2, max_rows=50) as budget:
+        client.get("/upload/files")
+
+Statements are counted with `before_cursor_execute` on the engines. Fetched rows
+are counted by the DBAPI cursor on SQLite (install_row_counting(), applied to the
+engines before they open connections) and from cursor.rowcount elsewhere.
+"""
+import sqlite3
+import threading
+from sqlalchemy import event
+
+_active = []
+_lock = threading.Lock()
+
+
+def _add_rows(count):
+    with _lock:
+        for budget in _active:
+            budget.rows += count
+
+
+class _CountingCursor(sqlite3.Cursor):
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            _add_rows(1)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = super().fetchmany(*args, **kwargs)
+        _add_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        _add_rows(len(rows))
+        return rows
+
+
+class _CountingConnection(sqlite3.Connection):
+    def cursor(self, factory=_CountingCursor):
+        return super().cursor(factory)
+
+
+def _use_counting_connection(dialect, conn_rec, cargs, cparams):
+    cparams["factory"] = _CountingConnection
+
+
+def install_row_counting(*engines):
+    """Makes new SQLite connections of these (sync) engines count fetched rows."""
+    for engine in engines:
+        if engine.dialect.name == "sqlite" and not event.contains(engine, "do_connect", _use_counting_connection):
+            event.listen(engine, "do_connect", _use_counting_connection)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryBudget:
+    """Counts statements and fetched rows on the app's engines while active."""
+
+    def __init__(self, max_queries: int = None, max_rows: int = None, engines=None):
+        self.max_queries = max_queries
+        self.max_rows = max_rows
+        self.engines = engines if engines is not None else default_engines()
+        self.statements = []
+        self.rows = 0
+
+    @property
+    def queries(self):
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if conn.dialect.name != "sqlite" and cursor.description is not None:
+            self.rows += max(cursor.rowcount, 0)
+
+    def __enter__(self):
+        for engine in self.engines:
+            event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        with _lock:
+            _active.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        for engine in self.engines:
+            event.remove(engine, "before_cursor_execute", self._before_cursor_execute)
+            event.remove(engine, "after_cursor_execute", self._after_cursor_execute)
+        with _lock:
+            _active.remove(self)
+        if exc_type is None:
+            self.check()
+        return False
+
+    def check(self):
+        problems = []
+        if self.max_queries is not None and self.queries > self.max_queries:
+            problems.append(f"{self.queries} queries (budget {self.max_queries})")
+        if self.max_rows is not None and self.rows > self.max_rows:
+            problems.append(f"{self.rows} rows fetched (budget {self.max_rows})")
+        if problems:
+            listing = "\n".join(f"  {i + 1}. {statement}" for i, statement in enumerate(self.statements))
+            raise QueryBudgetExceeded(f"Query budget exceeded: {', '.join(problems)}\n{listing}")
+
+
+def default_engines():
+    """The sync engine and the async engine's sync core."""
+    from database import engine
+    from async_database import async_engine
+    return [engine, async_engine.sync_engine]
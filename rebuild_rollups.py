@@ -0,0 +1,36 @@
+"""
+Rebuild the payment dashboard rollups and the client ledger from payment_records.
+Run this once after deploying the rollup tables, or whenever they drift.
+"""
+import logging
+import app_logging
+from database import SessionLocal, create_tables
+from rollups import rebuild_rollups
+from settlements import rebuild_ledger
+
+logger = logging.getLogger(__name__)
+
+
+def rebuild():
+    create_tables()
+    db = SessionLocal()
+    try:
+        logger.info("⏳ Rebuilding payment rollups...")
+        groups = rebuild_rollups(db)
+        db.commit()
+        logger.info(f"✅ Rebuilt {groups} rollup rows")
+
+        logger.info("⏳ Rebuilding client ledger...")
+        entries = rebuild_ledger(db)
+        db.commit()
+        logger.info(f"✅ Rebuilt {entries} client ledger rows")
+    except Exception as e:
+        db.rollback()
+        logger.exception(f"❌ FATAL ERROR: {str(e)}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    app_logging.configure(default_format="text")
+    rebuild()
@@ -0,0 +1,39 @@
+"""
+Batch job: reconcile every payment file against shipments.
+Safe to run repeatedly - unchanged codes are not rewritten.
+"""
+import logging
+import app_logging
+from database import SessionLocal, PaymentFile, create_tables
+from reconciliation import reconcile_payment_file, missing_payments_query
+
+logger = logging.getLogger(__name__)
+
+
+def reconcile_all():
+    create_tables()
+    db = SessionLocal()
+    try:
+        file_ids = [row[0] for row in db.query(PaymentFile.id).order_by(PaymentFile.id).all()]
+        logger.info(f"⏳ Reconciling {len(file_ids)} payment files...")
+        for file_id in file_ids:
+            summary = reconcile_payment_file(db, file_id)
+            db.commit()
+            logger.info(
+                f"✅ File {file_id}: {summary['counts']} "
+                f"(inserted {summary['inserted']}, updated {summary['updated']}, "
+                f"removed {summary['removed']}, unchanged {summary['unchanged']})"
+            )
+
+        missing = missing_payments_query(db).count()
+        logger.info(f"📊 Shipments with no payment: {missing}")
+    except Exception as e:
+        db.rollback()
+        logger.exception(f"❌ FATAL ERROR: {str(e)}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    app_logging.configure(default_format="text")
+    reconcile_all()
@@ -0,0 +1,139 @@
+"""
+Shipment-to-payment reconciliation.
+
+Joins a payment file's records to shipments on the indexed code columns in a
+single set-based query (the database plans it as a hash join), classifies each
+code and stores the outcome in `reconciliation_results`. Re-checking a file only
+rewrites rows whose inputs changed.
+"""
+import hashlib
+from datetime import datetime
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from database import Shipment, PaymentRecord, ReconciliationResult
+from constants import (
+    RECONCILIATION_MATCHED,
+    RECONCILIATION_AMOUNT_MISMATCH,
+    RECONCILIATION_ORPHAN_PAYMENT
+)
+
+# Amounts closer than this are considered equal (floating point noise from Excel)
+AMOUNT_TOLERANCE = 0.01
+
+
+def _joined_codes(db: Session, payment_file_id: int):
+    """
+    Returns (code, payment_amount, shipment_amount, shipment_count) for every code
+    in the payment file, left-joined to shipments with the same code.
+    """
+    payments = select(
+        PaymentRecord.code.label("code"),
+        func.sum(PaymentRecord.package_value).label("payment_amount")
+    ).where(
+        PaymentRecord.file_id == payment_file_id,
+        PaymentRecord.code.isnot(None)
+    ).group_by(PaymentRecord.code).subquery()
+
+    # A code may have been uploaded in several shipment files; they carry the same parcel value
+    shipments = select(
+        Shipment.shipment_code.label("code"),
+        func.max(Shipment.amount).label("shipment_amount"),
+        func.count(Shipment.id).label("shipment_count")
+    ).where(
+        Shipment.shipment_code.in_(select(payments.c.code))
+    ).group_by(Shipment.shipment_code).subquery()
+
+    query = select(
+        payments.c.code,
+        payments.c.payment_amount,
+        shipments.c.shipment_amount,
+        shipments.c.shipment_count
+    ).select_from(
+        payments.outerjoin(shipments, shipments.c.code == payments.c.code)
+    )
+    return db.execute(query).all()
+
+
+def classify(payment_amount, shipment_amount, shipment_count):
+    if not shipment_count:
+        return RECONCILIATION_ORPHAN_PAYMENT
+    if abs((payment_amount or 0.0) - (shipment_amount or 0.0)) > AMOUNT_TOLERANCE:
+        return RECONCILIATION_AMOUNT_MISMATCH
+    return RECONCILIATION_MATCHED
+
+
+def _input_hash(payment_amount, shipment_amount, shipment_count):
+    raw = f"{payment_amount!r}|{shipment_amount!r}|{bool(shipment_count)}"
+    return hashlib.md5(raw.encode("utf-8")).hexdigest()
+
+
+def reconcile_payment_file(db: Session, payment_file_id: int):
+    """
+    Reconciles one payment file and persists the per-code results.
+    Only new, changed and vanished codes are written. Caller commits.
+    """
+    existing = {
+        row.code: (row.id, row.input_hash)
+        for row in db.query(
+            ReconciliationResult.id, ReconciliationResult.code, ReconciliationResult.input_hash
+        ).filter(ReconciliationResult.payment_file_id == payment_file_id)
+    }
+
+    now = datetime.utcnow()
+    inserts, updates = [], []
+    counts = {}
+    unchanged = 0
+
+    for code, payment_amount, shipment_amount, shipment_count in _joined_codes(db, payment_file_id):
+        category = classify(payment_amount, shipment_amount, shipment_count)
+        counts[category] = counts.get(category, 0) + 1
+
+        input_hash = _input_hash(payment_amount, shipment_amount, shipment_count)
+        previous = existing.pop(code, None)
+        if previous and previous[1] == input_hash:
+            unchanged += 1
+            continue
+
+        values = {
+            "payment_file_id": payment_file_id,
+            "code": code,
+            "category": category,
+            "payment_amount": payment_amount,
+            "shipment_amount": shipment_amount,
+            "input_hash": input_hash,
+            "checked_at": now
+        }
+        if previous:
+            updates.append(dict(values, id=previous[0]))
+        else:
+            inserts.append(values)
+
+    if inserts:
+        db.bulk_insert_mappings(ReconciliationResult, inserts)
+    if updates:
+        db.bulk_update_mappings(ReconciliationResult, updates)
+
+    # Codes that are no longer in the payment file
+    stale_ids = [row_id for row_id, _ in existing.values()]
+    if stale_ids:
+        db.query(ReconciliationResult)\
+            .filter(ReconciliationResult.id.in_(stale_ids))\
+            .delete(synchronize_session=False)
+
+    return {
+        "payment_file_id": payment_file_id,
+        "counts": counts,
+        "inserted": len(inserts),
+        "updated": len(updates),
+        "removed": len(stale_ids),
+        "unchanged": unchanged
+    }
+
+
+def missing_payments_query(db: Session):
+    """Shipments whose code does not appear in any payment file (anti-join on the code indexes)."""
+    has_payment = select(PaymentRecord.id).where(PaymentRecord.code == Shipment.shipment_code).exists()
+    return db.query(Shipment).filter(
+        Shipment.shipment_code.isnot(None),
+        ~has_payment
+    )
@@ -1,39 +1,46 @@
+import logging
+import app_logging
 from database import engine, Base, UploadedFile, Shipment
+from dialects import get_ops
+from partitions import ensure_default_partition
 from sqlalchemy import text
 
+logger = logging.getLogger(__name__)
+
 def reset_database():
-    print("⏳ Connecting to database...")
+    logger.info("⏳ Connecting to database...")
     try:
         # 1. Test Connection
         with engine.connect() as conn:
             conn.execute(text("SELECT 1"))
-        print("✅ Connected!")
+        logger.info("✅ Connected!")
 
         # 2. Drop Tables
-        print("⏳ Dropping all tables...")
+        logger.info("⏳ Dropping all tables...")
         Base.metadata.drop_all(bind=engine)
-        print("✅ Tables dropped!")
+        logger.info("✅ Tables dropped!")
 
         # 3. Create Tables
-        print("⏳ Creating tables...")
+        logger.info("⏳ Creating tables...")
         Base.metadata.create_all(bind=engine)
-        print("✅ Tables created!")
+        ensure_default_partition(engine)
+        logger.info("✅ Tables created!")
         
         # 4. Verify
-        print("⏳ Verifying...")
+        logger.info("⏳ Verifying...")
         with engine.connect() as conn:
-            # Check if tables exist in information_schema
-            result = conn.execute(text("SELECT table_name FROM information_schema.tables WHERE table_schema='public'"))
-            tables = [row[0] for row in result]
-            print(f"📊 Current Tables in DB: {tables}")
+            # Works on PostgreSQL and the SQLite stand-in
+            tables = get_ops(conn).list_tables(conn)
+            logger.info(f"📊 Current Tables in DB: {tables}")
             
             if "uploaded_files" in tables and "shipments" in tables:
-                print("🎉 SUCCESS: Both tables exist!")
+                logger.info("🎉 SUCCESS: Both tables exist!")
             else:
-                print("❌ ERROR: Tables are missing!")
+                logger.error("❌ ERROR: Tables are missing!")
 
     except Exception as e:
-        print(f"❌ FATAL ERROR: {str(e)}")
+        logger.exception(f"❌ FATAL ERROR: {str(e)}")
 
 if __name__ == "__main__":
+    app_logging.configure(default_format="text")
     reset_database()
@@ -0,0 +1,168 @@
+"""
+Incrementally maintained payment rollups.
+
+Every payment upload adds its records to `payment_daily_rollups` (one row per
+day/branch/client/status), and every payment file delete subtracts them again.
+Dashboard endpoints read the small rollup table instead of scanning the wide
+payment_records table.
+"""
+import json
+import logging
+from datetime import date, datetime
+from sqlalchemy import func, select, update, bindparam
+from sqlalchemy.orm import Session
+from database import PaymentRecord, PaymentDailyRollup
+from dialects import get_ops
+import lookups
+
+logger = logging.getLogger(__name__)
+
+# Rollup measure -> source column on PaymentRecord
+MEASURES = {
+    "package_value": PaymentRecord.package_value,
+    "net_package_price": PaymentRecord.net_package_price,
+    "delivery_value": PaymentRecord.delivery_value,
+    "due_fees": PaymentRecord.due_fees,
+    "collected_fees": PaymentRecord.collected_fees,
+    "return_value": PaymentRecord.return_value,
+    "amount_due": PaymentRecord.amount_due,
+}
+
+KEY_FIELDS = ("day", "branch", "client_name", "status")
+
+
+def rollup_key(day, branch, client_name, status):
+    """PaymentDailyRollup.rollup_key: the key fields as JSON, so missing (NULL) fields still compare equal."""
+    return json.dumps([day.isoformat() if day else None, branch, client_name, status], ensure_ascii=False)
+
+
+def _as_date(value):
+    """func.date() returns a date on PostgreSQL but a string on SQLite."""
+    if value is None or isinstance(value, date) and not isinstance(value, datetime):
+        return value
+    if isinstance(value, datetime):
+        return value.date()
+    return date.fromisoformat(str(value)[:10])
+
+
+def _aggregate(db: Session, file_id: int = None):
+    """Groups payment records (optionally of a single file) by the rollup key."""
+    day = func.date(PaymentRecord.date)
+    query = db.query(
+        day.label("day"),
+        PaymentRecord.branch_id,
+        PaymentRecord.client_name,
+        PaymentRecord.status_id,
+        func.count(PaymentRecord.id).label("record_count"),
+        *[func.coalesce(func.sum(col), 0).label(name) for name, col in MEASURES.items()]
+    )
+    if file_id is not None:
+        query = query.filter(PaymentRecord.file_id == file_id)
+
+    groups = []
+    for row in query.group_by(day, PaymentRecord.branch_id, PaymentRecord.client_name, PaymentRecord.status_id).all():
+        group = row._asdict()
+        group["day"] = _as_date(group["day"])
+        # Grouped by the lookup ids (narrow integers), decoded for the rollup key
+        group["branch"] = lookups.decode(group.pop("branch_id"))
+        group["status"] = lookups.decode(group.pop("status_id"))
+        group["rollup_key"] = rollup_key(*(group[f] for f in KEY_FIELDS))
+        groups.append(group)
+    return groups
+
+
+def apply_payment_file(db: Session, file_id: int, sign: int = 1):
+    """
+    Adds (sign=1) or subtracts (sign=-1) a payment file's records to the rollups.
+    Must run inside the caller's transaction, after the records are flushed
+    (upload) or before they are deleted (delete). Returns the number of groups touched.
+    """
+    groups = _aggregate(db, file_id)
+    if not groups:
+        return 0
+    measures = ("record_count", *MEASURES)
+    keys = [group["rollup_key"] for group in groups]
+
+    if sign > 0:
+        # One upsert: new keys are inserted, existing ones incremented in SQL, so
+        # concurrent uploads that hit the same (even new) key end up in one row
+        statement = get_ops(db).insert(PaymentDailyRollup)
+        db.execute(
+            statement.on_conflict_do_update(
+                index_elements=[PaymentDailyRollup.rollup_key],
+                set_={name: getattr(PaymentDailyRollup, name) + getattr(statement.excluded, name) for name in measures}
+            ),
+            groups
+        )
+        return len(groups)
+
+    existing = set(db.scalars(select(PaymentDailyRollup.rollup_key).where(PaymentDailyRollup.rollup_key.in_(keys))))
+    missing = len(groups) - len(existing)
+    if missing:
+        logger.warning(
+            "payment rollups are missing groups of a deleted file, run rebuild_rollups.py",
+            extra={"file_id": file_id, "groups": missing}
+        )
+    if existing:
+        # Decrement in SQL (executemany on the table, keyed by rollup_key)
+        table = PaymentDailyRollup.__table__
+        db.execute(
+            update(table)
+            .where(table.c.rollup_key == bindparam("key"))
+            .values({name: table.c[name] - bindparam(f"sub_{name}") for name in measures}),
+            [
+                {"key": group["rollup_key"], **{f"sub_{name}": group[name] for name in measures}}
+                for group in groups if group["rollup_key"] in existing
+            ]
+        )
+    # Only this file's keys: never drops another key's row
+    db.query(PaymentDailyRollup)\
+        .filter(PaymentDailyRollup.rollup_key.in_(keys), PaymentDailyRollup.record_count <= 0)\
+        .delete(synchronize_session=False)
+    return len(groups)
+
+
+def rebuild_rollups(db: Session):
+    """Recomputes all rollups from payment_records. Caller commits."""
+    db.query(PaymentDailyRollup).delete(synchronize_session=False)
+    groups = _aggregate(db)
+    db.bulk_insert_mappings(PaymentDailyRollup, groups)
+    return len(groups)
+
+
+def summarize(db: Session, start: date, end: date, branch: str = None,
+              client_name: str = None, status: str = None, group_by_day: bool = False):
+    """
+    Sums rollup measures for days in [start, end]. With group_by_day=True returns
+    one entry per day, otherwise a single totals dict.
+    """
+    columns = [
+        func.coalesce(func.sum(PaymentDailyRollup.record_count), 0).label("record_count"),
+        *[func.coalesce(func.sum(getattr(PaymentDailyRollup, name)), 0).label(name) for name in MEASURES]
+    ]
+    if group_by_day:
+        columns.insert(0, PaymentDailyRollup.day)
+
+    query = db.query(*columns).filter(
+        PaymentDailyRollup.day >= start,
+        PaymentDailyRollup.day <= end
+    )
+    if branch:
+        query = query.filter(PaymentDailyRollup.branch == branch)
+    if client_name:
+        query = query.filter(PaymentDailyRollup.client_name == client_name)
+    if status:
+        query = query.filter(PaymentDailyRollup.status == status)
+
+    if not group_by_day:
+        return _measures(query.first()._asdict())
+
+    rows = query.group_by(PaymentDailyRollup.day).order_by(PaymentDailyRollup.day.asc()).all()
+    return [dict(_measures(row._asdict()), day=str(_as_date(row.day))) for row in rows]
+
+
+def _measures(row: dict):
+    result = {name: float(row.get(name) or 0) for name in MEASURES}
+    result["record_count"] = int(row.get("record_count") or 0)
+    result["net_due"] = result["delivery_value"] - result["due_fees"]
+    return result
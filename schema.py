@@ -0,0 +1,236 @@
+"""
+Workbook/API header <-> model attribute registry for shipments and payments.
+
+Each Schema lists (Arabic header, attribute) pairs once. From them it builds,
+at import time:
+
+- `ingest(df)`: the model rows of an uploaded workbook as dicts keyed by
+  attribute. Columns are looked up by position once and converted whole
+  (to_numeric / datetime64), not cell by cell; the converter for each column
+  follows the model column type (DateTime, Float, Integer, else text).
+- `serializer(*headers)`: a generated function turning a model instance into
+  the API dict for those headers (all of them by default).
+
+Mapped columns must be named after their header (database.py); that is
+checked here, so the registry and the tables can't drift apart.
+"""
+from datetime import datetime
+from sqlalchemy import DateTime, Float, Integer
+from database import Shipment, PaymentRecord
+
+DATE_FORMATS = (
+    "%Y-%m-%d %H:%M:%S",  # 2025-12-28 18:42:52
+    "%Y-%m-%d",           # 2025-12-28
+    "%d-%m-%Y %H:%M:%S",  # 28-12-2025 18:42:52
+    "%d-%m-%Y",           # 28-12-2025
+    "%d/%m/%Y %H:%M:%S",  # 28/12/2025 18:42:52
+    "%d/%m/%Y",           # 28/12/2025
+)
+
+
+def parse_date(value):
+    """datetime for a date cell (datetime, Timestamp or text), None otherwise."""
+    import pandas as pd
+
+    if isinstance(value, pd.Timestamp):
+        return None if value is pd.NaT else value.to_pydatetime()
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        for fmt in DATE_FORMATS:
+            try:
+                return datetime.strptime(value, fmt)
+            except ValueError:
+                continue
+        try:
+            parsed = pd.to_datetime(value)
+        except (ValueError, TypeError, OverflowError):
+            return None
+        return None if parsed is pd.NaT else parsed.to_pydatetime()
+    return None
+
+
+def _dates(column):
+    import pandas as pd
+
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return column.dt.to_pydatetime().to_numpy(dtype=object)
+    # Mixed cells: parse each distinct value once
+    parsed = {value: parse_date(value) for value in column.dropna().unique()}
+    return column.map(parsed).to_numpy(dtype=object)
+
+
+def _floats(column):
+    import pandas as pd
+
+    return pd.to_numeric(column, errors="coerce").to_numpy(dtype=object)
+
+
+def _ints(column):
+    import numpy as np
+    import pandas as pd
+
+    return np.trunc(pd.to_numeric(column, errors="coerce")).astype("Int64").to_numpy(dtype=object)
+
+
+def _texts(column):
+    # Excel hands over numbers for codes and phone numbers; the columns are text
+    return column.astype(str).to_numpy(dtype=object)
+
+
+def _kind(model, attribute):
+    column = model.__mapper__.columns.get(attribute)
+    column_type = column.type if column is not None else None
+    if isinstance(column_type, DateTime):
+        return "date"
+    if isinstance(column_type, Float):
+        return "float"
+    if isinstance(column_type, Integer):
+        return "int"
+    return "text"
+
+
+_CONVERTERS = {"date": _dates, "float": _floats, "int": _ints, "text": _texts}
+
+
+def _api_date(value):
+    return str(value) if value else None
+
+
+class Schema:
+    def __init__(self, model, fields, missing_number=None):
+        """
+        `fields` are (header, attribute) pairs in API order; attributes that aren't
+        mapped columns (e.g. decoded lookups) are text. Empty or invalid numeric
+        cells become `missing_number`.
+        """
+        self.model = model
+        self.fields = tuple(fields)
+        self.headers = {header: attribute for header, attribute in self.fields}
+        self.kinds = {attribute: _kind(model, attribute) for _, attribute in self.fields}
+        self.missing_number = missing_number
+        for header, attribute in self.fields:
+            column = model.__mapper__.columns.get(attribute)
+            if column is not None and column.name != header:
+                raise ValueError(f"{model.__name__}.{attribute} is stored as {column.name!r}, not {header!r}")
+
+    def ingest(self, df, **constants):
+        """
+        Model rows for every row of `df` (a workbook read with pandas): dicts with
+        all attributes of the schema plus `constants`; missing cells and columns are None.
+        """
+        import pandas as pd
+
+        positions = df.columns.get_indexer([header for header, _ in self.fields])
+        columns = []
+        for (_, attribute), position in zip(self.fields, positions):
+            kind = self.kinds[attribute]
+            if position < 0:
+                missing = self.missing_number if kind in ("float", "int") else None
+                columns.append([missing] * len(df))
+                continue
+            column = df.iloc[:, position]
+            values = _CONVERTERS[kind](column).copy()  # pandas may hand out read-only arrays
+            empty = pd.isna(column).to_numpy() | pd.isna(values)
+            values[empty] = self.missing_number if kind in ("float", "int") else None
+            columns.append(values.tolist())
+
+        attributes = [attribute for _, attribute in self.fields] + list(constants)
+        fixed = tuple(constants.values())
+        return [dict(zip(attributes, row + fixed)) for row in zip(*columns)]
+
+    def serializer(self, *headers):
+        """Compiled `instance -> {header: value}` for `headers` (default: all fields)."""
+        fields = [(header, self.headers[header]) for header in headers] if headers else self.fields
+        items = ", ".join(
+            f"{header!r}: _api_date(row.{attribute})" if self.kinds[attribute] == "date"
+            else f"{header!r}: row.{attribute}"
+            for header, attribute in fields
+        )
+        namespace = {"_api_date": _api_date}
+        exec(f"def serialize(row):\n    return {{{items}}}\n", namespace)
+        return namespace["serialize"]
+
+
+SHIPMENTS = Schema(Shipment, [
+    ("الكود", "shipment_code"),
+    ("التاريخ", "date"),
+    ("العميل", "client_name"),
+    ("الفرع", "branch_name"),
+    ("الحالة", "status"),
+    ("اسم الراسل", "sender_name"),
+    ("مدينة الراسل", "sender_city"),
+    ("المستلم", "recipient_name"),
+    ("مدينة المستلم", "recipient_city"),
+    ("منطقة المستلم", "recipient_area"),
+    ("عنوان المستلم", "recipient_address"),
+    ("هاتف المستلم", "recipient_phone"),
+    ("موبايل المستلم", "recipient_mobile"),
+    ("قيمة الطرد", "amount"),
+    ("الرسوم", "shipping_fee"),
+    ("صافي سعر الطرد", "net_price"),
+    ("القيمة الإجمالية", "total_value"),
+    ("نوع السعر", "price_type"),
+    ("الوزن", "weight"),
+    ("عدد القطع", "pieces_count"),
+    ("الوصف", "description"),
+    ("ملاحظات", "notes"),
+], missing_number=0)
+
+PAYMENTS = Schema(PaymentRecord, [
+    ("المستحق", "amount_due"),
+    ("الكود", "code"),
+    ("التاريخ", "date"),
+    ("الحالة", "status"),
+    ("الفرع", "branch"),
+    ("فرع المنشأ", "origin_branch"),
+    ("الخدمة", "service"),
+    ("اسم الراسل", "sender_name"),
+    ("مدينة الراسل", "sender_city"),
+    ("منطقة الراسل", "sender_area"),
+    ("الرمز البريدي للراسل", "sender_postal_code"),
+    ("الرقم المرجعي", "reference_number"),
+    ("المستلم", "recipient_name"),
+    ("مدينة المستلم", "recipient_city"),
+    ("منطقة المستلم", "recipient_area"),
+    ("عنوان المستلم", "recipient_address"),
+    ("الرمز البريدي للمستلم", "recipient_postal_code"),
+    ("هاتف المستلم", "recipient_phone"),
+    ("موبايل المستلم", "recipient_mobile"),
+    ("الوصف", "description"),
+    ("الوزن", "weight"),
+    ("عدد القطع", "pieces_count"),
+    ("قيمة الطرد", "package_value"),
+    ("الرسوم", "fees"),
+    ("صافي سعر الطرد", "net_package_price"),
+    ("القيمة الإجمالية", "total_value"),
+    ("قيمة التسليم", "delivery_value"),
+    ("الرسوم المحصلة", "collected_fees"),
+    ("الرسوم المستحقة", "due_fees"),
+    ("نوع الدفع", "payment_type"),
+    ("نوع السعر", "price_type"),
+    ("نوع التسليم", "delivery_type"),
+    ("نوع المرتجع للراسل", "return_type"),
+    ("مندوب الشحن", "shipping_agent"),
+    ("تم التحصيل", "is_collected"),
+    ("تم السداد للعميل", "paid_to_client"),
+    ("ملاحظات", "notes"),
+    ("امكانية فتح الطرد", "can_open_package"),
+    ("العميل", "client_name"),
+    ("سبب الإرجاع", "return_reason"),
+    ("نوع الطلب", "order_type"),
+    ("تاريخ التسليم/الإلغاء", "delivery_cancel_date"),
+    ("قيمة المرتجع", "return_value"),
+    ("عدد المحاولات", "attempts_count"),
+    ("تاريخ التوصيل", "delivery_date"),
+    ("تم الإلغاء", "is_cancelled"),
+    ("تاريخ أخر حركة", "last_movement_date"),
+    ("سداد مستحقات العملاء", "client_dues_payment"),
+])
+
+# API row shapes
+shipment_row = SHIPMENTS.serializer(
+    "الكود", "التاريخ", "العميل", "الوصف", "الحالة", "المستلم", "مدينة المستلم", "قيمة الطرد", "نوع السعر", "الوزن"
+)
+shipment_brief = SHIPMENTS.serializer("الكود", "التاريخ", "العميل", "الحالة", "المستلم", "قيمة الطرد")
+payment_row = PAYMENTS.serializer()
@@ -0,0 +1,128 @@
+"""
+Per-client settlement statements.
+
+`client_ledger` caches one row of settlement totals per (client, payment file).
+Rows are added when a payment file is uploaded and removed when it is deleted,
+so a statement only sums a handful of ledger rows per client instead of
+scanning payment_records.
+"""
+from sqlalchemy import func, case
+from sqlalchemy.orm import Session
+from database import PaymentFile, PaymentRecord, ClientLedger
+from constants import YES_VALUES
+
+MEASURES = (
+    "record_count",
+    "amount_due",
+    "due_fees",
+    "collected_amount",
+    "uncollected_amount",
+    "paid_amount",
+    "unpaid_amount"
+)
+
+
+def _amount_where(condition):
+    return func.coalesce(func.sum(case((condition, PaymentRecord.amount_due), else_=0)), 0)
+
+
+def _aggregate(db: Session, file_id: int = None):
+    """Settlement totals grouped by (client, file), optionally for a single file."""
+    collected = PaymentRecord.is_collected.in_(YES_VALUES)
+    paid = PaymentRecord.paid_to_client.in_(YES_VALUES)
+
+    query = db.query(
+        PaymentRecord.client_name.label("client_name"),
+        PaymentRecord.file_id.label("file_id"),
+        func.count(PaymentRecord.id).label("record_count"),
+        func.coalesce(func.sum(PaymentRecord.amount_due), 0).label("amount_due"),
+        func.coalesce(func.sum(PaymentRecord.due_fees), 0).label("due_fees"),
+        _amount_where(collected).label("collected_amount"),
+        _amount_where(~collected | PaymentRecord.is_collected.is_(None)).label("uncollected_amount"),
+        _amount_where(paid).label("paid_amount"),
+        _amount_where(~paid | PaymentRecord.paid_to_client.is_(None)).label("unpaid_amount")
+    ).filter(PaymentRecord.client_name.isnot(None))
+
+    if file_id is not None:
+        query = query.filter(PaymentRecord.file_id == file_id)
+
+    return [row._asdict() for row in query.group_by(PaymentRecord.client_name, PaymentRecord.file_id).all()]
+
+
+def apply_payment_file(db: Session, file_id: int):
+    """Adds a freshly flushed payment file to the ledger. Caller commits."""
+    groups = _aggregate(db, file_id)
+    db.bulk_insert_mappings(ClientLedger, groups)
+    return len(groups)
+
+
+def remove_payment_file(db: Session, file_id: int):
+    """Drops a payment file from the ledger. Caller commits."""
+    return db.query(ClientLedger)\
+        .filter(ClientLedger.file_id == file_id)\
+        .delete(synchronize_session=False)
+
+
+def rebuild_ledger(db: Session):
+    """Recomputes the whole ledger from payment_records. Caller commits."""
+    db.query(ClientLedger).delete(synchronize_session=False)
+    groups = _aggregate(db)
+    db.bulk_insert_mappings(ClientLedger, groups)
+    return len(groups)
+
+
+def _statement(row: dict):
+    result = {name: float(row.get(name) or 0) for name in MEASURES}
+    result["record_count"] = int(result["record_count"])
+    # "المستحق" is already net of fees; what is still owed is the part not yet paid out
+    result["net_dues"] = result["amount_due"]
+    result["outstanding"] = result["unpaid_amount"]
+    return result
+
+
+def _sums():
+    return [func.coalesce(func.sum(getattr(ClientLedger, name)), 0).label(name) for name in MEASURES]
+
+
+def client_statements(db: Session, search: str = None, limit: int = 100, offset: int = 0):
+    """One statement per client, largest outstanding balance first."""
+    query = db.query(ClientLedger.client_name, *_sums())
+    if search:
+        query = query.filter(ClientLedger.client_name.ilike(f"%{search}%"))
+
+    grouped = query.group_by(ClientLedger.client_name)
+    total = grouped.count()
+    rows = grouped.order_by(func.sum(ClientLedger.unpaid_amount).desc(), ClientLedger.client_name)\
+        .offset(offset).limit(limit).all()
+
+    return total, [dict(_statement(row._asdict()), client_name=row.client_name) for row in rows]
+
+
+def client_statement(db: Session, client_name: str):
+    """Totals and per-file breakdown for one client, or None if unknown."""
+    rows = db.query(ClientLedger, PaymentFile.filename, PaymentFile.upload_date)\
+        .join(PaymentFile, PaymentFile.id == ClientLedger.file_id)\
+        .filter(ClientLedger.client_name == client_name)\
+        .order_by(PaymentFile.upload_date.desc())\
+        .all()
+    if not rows:
+        return None
+
+    files = []
+    totals = dict.fromkeys(MEASURES, 0)
+    for ledger, filename, upload_date in rows:
+        values = {name: getattr(ledger, name) or 0 for name in MEASURES}
+        for name in MEASURES:
+            totals[name] += values[name]
+        files.append(dict(
+            _statement(values),
+            file_id=ledger.file_id,
+            filename=filename,
+            upload_date=str(upload_date) if upload_date else None
+        ))
+
+    return {
+        "client_name": client_name,
+        "totals": _statement(totals),
+        "files": files
+    }
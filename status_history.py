@@ -0,0 +1,111 @@
+"""
+Append-only shipment status history.
+
+Uploads and status updates append one small row per shipment to
+`shipment_status_events` (status stored as a constants.STATUS_CODES integer).
+Dwell times - how long shipments stay in each status - are computed from that
+history with a LEAD() window over each shipment's events.
+"""
+from datetime import datetime
+from sqlalchemy import select, func, case, insert, literal
+from sqlalchemy.orm import Session
+from database import ShipmentStatusEvent
+from dialects import get_ops
+from constants import STATUS_CODES, STATUS_NAMES, UNKNOWN_STATUS_CODE
+
+# Upper bounds (in days) of the aging buckets reported per status
+AGING_BUCKETS = [1, 3, 7, 14, 30]
+
+
+def status_code(status: str):
+    return STATUS_CODES.get(status, UNKNOWN_STATUS_CODE)
+
+
+def status_name(code: int):
+    return STATUS_NAMES.get(code, "other")
+
+
+def record(db: Session, changes, changed_at: datetime = None):
+    """
+    Appends events for [(shipment_id, status), ...] with one multi-row INSERT.
+    Runs inside the caller's transaction.
+    """
+    changed_at = changed_at or datetime.utcnow()
+    rows = [
+        {"shipment_id": shipment_id, "status_code": status_code(status), "changed_at": changed_at}
+        for shipment_id, status in changes
+    ]
+    if rows:
+        db.execute(insert(ShipmentStatusEvent), rows)
+    return len(rows)
+
+
+def history(db: Session, shipment_id: int):
+    """All events of one shipment, oldest first."""
+    events = db.query(ShipmentStatusEvent)\
+        .filter(ShipmentStatusEvent.shipment_id == shipment_id)\
+        .order_by(ShipmentStatusEvent.changed_at.asc(), ShipmentStatusEvent.id.asc())\
+        .all()
+    return [
+        {"status": status_name(e.status_code), "changed_at": str(e.changed_at)}
+        for e in events
+    ]
+
+
+def dwell_times(db: Session, status: str = None, since: datetime = None):
+    """
+    Per status: how many times shipments entered it, how many are still in it,
+    average/maximum dwell in hours, and an aging histogram in days.
+    Open stints (no later event yet) are measured up to now.
+    """
+    now = datetime.utcnow()
+    left_at = func.lead(ShipmentStatusEvent.changed_at).over(
+        partition_by=ShipmentStatusEvent.shipment_id,
+        order_by=(ShipmentStatusEvent.changed_at, ShipmentStatusEvent.id)
+    )
+    stints = select(
+        ShipmentStatusEvent.status_code.label("status_code"),
+        ShipmentStatusEvent.changed_at.label("entered_at"),
+        left_at.label("left_at")
+    )
+    if since:
+        stints = stints.where(ShipmentStatusEvent.changed_at >= since)
+    stints = stints.subquery()
+
+    dwell = get_ops(db).seconds_between(
+        stints.c.entered_at, func.coalesce(stints.c.left_at, literal(now))
+    )
+    buckets = [
+        func.sum(case((dwell < days * 86400, 1), else_=0)).label(f"under_{days}d")
+        for days in AGING_BUCKETS
+    ]
+
+    query = select(
+        stints.c.status_code,
+        func.count().label("stints"),
+        func.sum(case((stints.c.left_at.is_(None), 1), else_=0)).label("current"),
+        func.avg(dwell).label("avg_seconds"),
+        func.max(dwell).label("max_seconds"),
+        *buckets
+    ).group_by(stints.c.status_code)
+    if status:
+        query = query.where(stints.c.status_code == status_code(status))
+
+    result = []
+    for row in db.execute(query).all():
+        aging, previous = {}, 0
+        for days in AGING_BUCKETS:
+            cumulative = int(getattr(row, f"under_{days}d") or 0)
+            aging[f"<{days}d"] = cumulative - previous
+            previous = cumulative
+        aging[f">={AGING_BUCKETS[-1]}d"] = int(row.stints) - previous
+
+        result.append({
+            "status": status_name(row.status_code),
+            "stints": int(row.stints),
+            "current": int(row.current or 0),
+            "avg_hours": round(float(row.avg_seconds or 0) / 3600, 2),
+            "max_hours": round(float(row.max_seconds or 0) / 3600, 2),
+            "aging": aging
+        })
+    return result
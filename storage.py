@@ -0,0 +1,266 @@
+"""
+Content-addressed storage for uploaded workbooks.
+
+Each distinct upload is stored once, under STORAGE_DIR/<aa>/<bb>/<sha256> (two
+levels of shards keep directories small), and has a StoredBlob row whose
+ref_count counts the UploadedFile / PaymentFile rows pointing at it through
+their blob_hash. References are added and dropped in the same transaction as
+those rows (`store` / `release`).
+
+`collect_garbage()` runs every STORAGE_GC_INTERVAL seconds in each API worker
+(and from `python storage.py gc`):
+- blobs unreferenced for STORAGE_RETENTION_DAYS are deleted
+- blobs older than STORAGE_COMPRESS_AFTER_DAYS are gzipped when that makes them
+  smaller (.xlsx is already zip-compressed, so gains are usually small)
+- files without a StoredBlob row (uploads that rolled back) are removed
+
+`python storage.py recount` rebuilds ref_count from the file tables, e.g. after
+rows were deleted by hand.
+"""
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import re
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import case, delete, func, select, union_all, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from database import SessionLocal, StoredBlob, UploadedFile, PaymentFile
+from dialects import get_ops
+
+logger = logging.getLogger(__name__)
+
+STORAGE_DIR = os.getenv("STORAGE_DIR", "uploads")
+STORAGE_RETENTION_DAYS = float(os.getenv("STORAGE_RETENTION_DAYS", "7"))
+STORAGE_COMPRESS_AFTER_DAYS = float(os.getenv("STORAGE_COMPRESS_AFTER_DAYS", "30"))
+STORAGE_GC_INTERVAL = float(os.getenv("STORAGE_GC_INTERVAL", "3600"))  # seconds, 0 disables
+
+BLOB_NAME = re.compile(r"^[0-9a-f]{64}(\.gz)?$")
+# Tables whose rows reference blobs
+REFERENCING_MODELS = (UploadedFile, PaymentFile)
+
+_collector = None
+
+
+def content_hash(contents: bytes):
+    return hashlib.sha256(contents).hexdigest()
+
+
+def blob_path(blob_hash: str, compressed: bool = False):
+    return os.path.join(STORAGE_DIR, blob_hash[:2], blob_hash[2:4], blob_hash + (".gz" if compressed else ""))
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)  # readers never see a partial blob
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+# ========== REFERENCES ==========
+
+def store(db: Session, contents: bytes):
+    """
+    Stores an upload (once per content) and adds a reference to it in the
+    caller's transaction. Returns the hash for the file row's blob_hash.
+    """
+    blob_hash = content_hash(contents)
+    insert = get_ops(db).insert(StoredBlob).values(
+        hash=blob_hash, size=len(contents), stored_size=len(contents),
+        ref_count=1, created_at=datetime.utcnow(),
+    )
+    # Row first: its lock keeps collect_garbage() from deleting the file until we commit
+    db.execute(insert.on_conflict_do_update(
+        index_elements=[StoredBlob.hash],
+        set_={"ref_count": StoredBlob.ref_count + 1, "released_at": None},
+    ))
+    if not os.path.exists(blob_path(blob_hash)) and not os.path.exists(blob_path(blob_hash, compressed=True)):
+        _write_atomic(blob_path(blob_hash), contents)
+    return blob_hash
+
+
+def release(db: Session, *blob_hashes: str):
+    """Drops one reference per hash (None is ignored) in the caller's transaction."""
+    for blob_hash in blob_hashes:
+        if blob_hash is None:
+            continue
+        db.execute(
+            update(StoredBlob)
+            .where(StoredBlob.hash == blob_hash)
+            .values(
+                ref_count=StoredBlob.ref_count - 1,
+                released_at=case((StoredBlob.ref_count <= 1, datetime.utcnow()), else_=StoredBlob.released_at),
+            )
+        )
+
+
+def read(blob_hash: str):
+    """Content of a stored blob, decompressed."""
+    try:
+        with open(blob_path(blob_hash), "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        with gzip.open(blob_path(blob_hash, compressed=True), "rb") as f:
+            return f.read()
+
+
+def recount(db: Session):
+    """Sets every ref_count from the file tables. Caller commits; run while no uploads are in flight."""
+    references = union_all(*(
+        select(model.blob_hash.label("hash")).where(model.blob_hash.isnot(None)) for model in REFERENCING_MODELS
+    )).subquery()
+    counts = dict(db.execute(select(references.c.hash, func.count()).group_by(references.c.hash)).all())
+    changed = 0
+    now = datetime.utcnow()
+    for blob in db.query(StoredBlob).all():
+        actual = counts.get(blob.hash, 0)
+        if blob.ref_count != actual:
+            if actual == 0:
+                blob.released_at = now
+            blob.ref_count = actual
+            changed += 1
+    return changed
+
+
+# ========== GARBAGE COLLECTION ==========
+
+def _delete_expired(db: Session, now: datetime):
+    cutoff = now - timedelta(days=STORAGE_RETENTION_DAYS)
+    expired = db.execute(
+        select(StoredBlob.hash).where(StoredBlob.ref_count <= 0, StoredBlob.released_at < cutoff)
+    ).scalars().all()
+    deleted = 0
+    for blob_hash in expired:
+        try:
+            # Re-checked under the row lock, an upload may have referenced it again
+            if db.execute(
+                delete(StoredBlob).where(StoredBlob.hash == blob_hash, StoredBlob.ref_count <= 0)
+            ).rowcount:
+                _remove(blob_path(blob_hash))
+                _remove(blob_path(blob_hash, compressed=True))
+                deleted += 1
+            db.commit()
+        except IntegrityError:
+            # Still referenced by a file row: ref_count drifted, see recount()
+            db.rollback()
+            logger.warning("blob still referenced, not deleted", extra={"blob_hash": blob_hash})
+    return deleted
+
+
+def _compress_cold(db: Session, now: datetime):
+    cutoff = now - timedelta(days=STORAGE_COMPRESS_AFTER_DAYS)
+    cold = db.query(StoredBlob).filter(
+        StoredBlob.compression.is_(None), StoredBlob.ref_count > 0, StoredBlob.created_at < cutoff
+    ).all()
+    saved = 0
+    for blob in cold:
+        try:
+            with open(blob_path(blob.hash), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            continue
+        packed = gzip.compress(data, compresslevel=9)
+        if len(packed) < len(data):
+            _write_atomic(blob_path(blob.hash, compressed=True), packed)
+            blob.compression, blob.stored_size = "gzip", len(packed)
+            db.commit()
+            _remove(blob_path(blob.hash))
+            saved += len(data) - len(packed)
+        else:
+            blob.compression = "none"
+            db.commit()
+    return saved
+
+
+def _sweep_orphans(db: Session, now: datetime):
+    """Removes blob files (and stale temp files) without a StoredBlob row."""
+    known = set(db.execute(select(StoredBlob.hash)).scalars())
+    cutoff = (now - timedelta(days=STORAGE_RETENTION_DAYS)).timestamp()
+    removed = 0
+    for directory, _, names in os.walk(STORAGE_DIR):
+        if directory == STORAGE_DIR:
+            continue  # files from before content addressing, see migrate_upload_storage.py
+        for name in names:
+            path = os.path.join(directory, name)
+            orphan = name.endswith(".tmp") or (BLOB_NAME.match(name) and name[:64] not in known)
+            if orphan and os.path.getmtime(path) < cutoff:
+                _remove(path)
+                removed += 1
+    return removed
+
+
+def collect_garbage(now: datetime = None):
+    """One pass of deleting expired blobs, compressing cold ones and sweeping orphans."""
+    now = now or datetime.utcnow()
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        summary = {
+            "deleted": _delete_expired(db, now),
+            "compressed_bytes_saved": _compress_cold(db, now),
+            "orphans_removed": _sweep_orphans(db, now),
+        }
+        logger.info("storage gc done", extra={**summary, "seconds": round(time.perf_counter() - started, 3)})
+        return summary
+    except Exception:
+        db.rollback()
+        logger.exception("storage gc failed")
+        raise
+    finally:
+        db.close()
+
+
+async def _collect_periodically():
+    while True:
+        await asyncio.sleep(STORAGE_GC_INTERVAL)
+        try:
+            await asyncio.to_thread(collect_garbage)
+        except Exception:
+            pass  # logged by collect_garbage, try again next interval
+
+
+def start_collector():
+    """Starts the periodic collection on the running event loop (API startup)."""
+    global _collector
+    if STORAGE_GC_INTERVAL > 0 and _collector is None:
+        _collector = asyncio.get_running_loop().create_task(_collect_periodically())
+
+
+def stop_collector():
+    global _collector
+    if _collector is not None:
+        _collector.cancel()
+        _collector = None
+
+
+if __name__ == "__main__":
+    import app_logging
+
+    app_logging.configure(default_format="text")
+    command = sys.argv[1] if len(sys.argv) > 1 else "gc"
+    if command == "recount":
+        session = SessionLocal()
+        try:
+            changed = recount(session)
+            session.commit()
+            logger.info(f"✅ Recounted references, {changed} blobs changed")
+        finally:
+            session.close()
+    elif command == "gc":
+        collect_garbage()
+    else:
+        print("Usage: python storage.py [gc | recount]")
+        sys.exit(1)
@@ -0,0 +1,204 @@
+"""
+Reproducible synthetic shipment / payment workbooks for tests and benchmarks.
+
+Both exports share the same 48 Arabic columns (columns_list.txt). Rows are built
+column by column with numpy, so a million rows take seconds to generate (writing
+the .xlsx takes longer). The same seed always gives the same workbook.
+
+Usage:
+    python synthetic_data.py payments 100000 --duplicates 0.01 --nan 0.05 -o payments.xlsx
+"""
+import argparse
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from constants import CHANGEABLE_STATUSES
+
+# Export column order (columns_list.txt)
+COLUMNS = [
+    "المستحق", "الكود", "التاريخ", "الحالة", "الفرع", "فرع المنشأ", "الخدمة",
+    "اسم الراسل", "مدينة الراسل", "منطقة الراسل", "الرمز البريدي للراسل", "الرقم المرجعي",
+    "المستلم", "مدينة المستلم", "منطقة المستلم", "عنوان المستلم", "الرمز البريدي للمستلم",
+    "هاتف المستلم", "موبايل المستلم", "الوصف", "الوزن", "عدد القطع", "قيمة الطرد", "الرسوم",
+    "صافي سعر الطرد", "القيمة الإجمالية", "قيمة التسليم", "الرسوم المحصلة", "الرسوم المستحقة",
+    "نوع الدفع", "نوع السعر", "نوع التسليم", "نوع المرتجع للراسل", "مندوب الشحن", "تم التحصيل",
+    "تم السداد للعميل", "ملاحظات", "امكانية فتح الطرد", "العميل", "سبب الإرجاع", "نوع الطلب",
+    "تاريخ التسليم/الإلغاء", "قيمة المرتجع", "عدد المحاولات", "تاريخ التوصيل", "تم الإلغاء",
+    "تاريخ أخر حركة", "سداد مستحقات العملاء",
+]
+
+# Never blanked by the NaN rate: rows without them are dropped or meaningless
+KEY_COLUMNS = {"الكود", "الحالة", "العميل"}
+
+START_DATE = datetime(2026, 1, 1)
+DATE_RANGE_DAYS = 90
+CLIENT_COUNT = 200
+
+# Status mix per export: shipments are mostly open, payments mostly settled
+STATUS_WEIGHTS = {
+    "shipments": {CHANGEABLE_STATUSES[0]: 0.45, CHANGEABLE_STATUSES[2]: 0.2, "قيد التوصيل": 0.2,
+                  "تم التسليم": 0.1, "مرتجع": 0.05},
+    "payments": {"تم التسليم": 0.8, "مرتجع": 0.12, "ملغى": 0.08},
+}
+
+BRANCHES = ["القاهرة", "الجيزة", "الإسكندرية", "المنصورة", "طنطا", "أسيوط"]
+CITIES = ["القاهرة", "الجيزة", "الإسكندرية", "المنصورة", "طنطا", "الزقازيق", "أسيوط", "سوهاج", "بورسعيد", "الإسماعيلية"]
+AREAS = ["مدينة نصر", "المعادي", "الدقي", "سموحة", "المهندسين", "حلوان", "شبرا", "العجمي", "الهرم", "التجمع الخامس"]
+CLIENT_PREFIXES = ["متجر", "مؤسسة", "شركة", "معرض", "بيت"]
+NAMES = ["أحمد", "محمد", "محمود", "مصطفى", "علي", "عمر", "يوسف", "خالد", "سارة", "منى", "نور", "فاطمة", "مريم", "هدى"]
+FAMILY_NAMES = ["حسن", "إبراهيم", "عبد الله", "السيد", "منصور", "فؤاد", "سالم", "رشاد", "عثمان", "شاكر"]
+DESCRIPTIONS = ["ملابس", "إلكترونيات", "أحذية", "مستحضرات تجميل", "كتب", "إكسسوارات", "أدوات منزلية"]
+AGENTS = [f"مندوب {name}" for name in NAMES[:8]]
+RETURN_REASONS = ["رفض الاستلام", "العنوان غير صحيح", "لا يرد", "طلب التأجيل"]
+
+
+def _choice(rng, values, size, weights=None):
+    return np.asarray(values, dtype=object)[rng.choice(len(values), size=size, p=weights)]
+
+
+def _yes_no(rng, size, yes_rate):
+    return np.where(rng.random(size) < yes_rate, "نعم", "لا").astype(object)
+
+
+def _digits(rng, size, count):
+    return pd.Series(rng.integers(0, 10 ** count, size)).astype(str).str.zfill(count)
+
+
+def generate(kind: str, rows: int, seed: int = 42, duplicate_rate: float = 0.0, nan_rate: float = 0.0):
+    """
+    DataFrame of `rows` export rows for kind "shipments" or "payments".
+    `duplicate_rate` of the rows reuse the code of an earlier row; `nan_rate` of the
+    cells outside KEY_COLUMNS are blank.
+    """
+    if kind not in STATUS_WEIGHTS:
+        raise ValueError(f"kind must be one of {', '.join(STATUS_WEIGHTS)}")
+    rng = np.random.default_rng(seed)
+    n = rows
+
+    # Codes: unique, then a share of rows copy an earlier row's code
+    codes = "GR" + pd.Series(np.arange(1, n + 1)).astype(str).str.zfill(8)
+    if duplicate_rate and n > 1:
+        duplicate = rng.random(n) < duplicate_rate
+        duplicate[0] = False
+        earlier = (rng.random(n) * np.arange(n)).astype(np.int64)
+        codes = codes.to_numpy(dtype=object)
+        codes[duplicate] = codes[earlier[duplicate]]
+
+    weights = STATUS_WEIGHTS[kind]
+    status = _choice(rng, list(weights), n, list(weights.values()))
+    delivered = status == "تم التسليم"
+    returned = status == "مرتجع"
+    cancelled = status == "ملغى"
+
+    created = pd.Timestamp(START_DATE) + pd.to_timedelta(rng.integers(0, DATE_RANGE_DAYS * 86400, n), unit="s")
+    moved = created + pd.to_timedelta(rng.integers(3600, 5 * 86400, n), unit="s")
+    closed = np.where(delivered | returned | cancelled, moved, pd.NaT)
+
+    client_names = [
+        f"{CLIENT_PREFIXES[i % len(CLIENT_PREFIXES)]} {NAMES[i % len(NAMES)]} {FAMILY_NAMES[i % len(FAMILY_NAMES)]} {i}"
+        for i in range(CLIENT_COUNT)
+    ]
+    # A few big clients, a long tail of small ones
+    client_weights = 1 / np.arange(1, CLIENT_COUNT + 1)
+    client = _choice(rng, client_names, n, client_weights / client_weights.sum())
+
+    package_value = rng.integers(10, 500, n) * 10.0
+    fees = _choice(rng, [50.0, 60.0, 70.0, 85.0], n)
+    collected = delivered & (rng.random(n) < 0.9)
+    delivery_value = np.where(delivered, package_value, 0.0)
+    collected_fees = np.where(collected, fees, 0.0)
+    return_value = np.where(returned, package_value, 0.0)
+    recipient_area = _choice(rng, AREAS, n)
+
+    data = {
+        "المستحق": delivery_value - fees,
+        "الكود": codes,
+        "التاريخ": created,
+        "الحالة": status,
+        "الفرع": _choice(rng, BRANCHES, n),
+        "فرع المنشأ": _choice(rng, BRANCHES, n),
+        "الخدمة": _choice(rng, ["توصيل", "توصيل سريع"], n, [0.85, 0.15]),
+        "اسم الراسل": client,
+        "مدينة الراسل": _choice(rng, CITIES, n),
+        "منطقة الراسل": _choice(rng, AREAS, n),
+        "الرمز البريدي للراسل": _digits(rng, n, 5),
+        "الرقم المرجعي": "REF" + _digits(rng, n, 7),
+        "المستلم": _choice(rng, NAMES, n) + " " + _choice(rng, FAMILY_NAMES, n),
+        "مدينة المستلم": _choice(rng, CITIES, n),
+        "منطقة المستلم": recipient_area,
+        "عنوان المستلم": "شارع " + pd.Series(rng.integers(1, 300, n)).astype(str) + " - " + recipient_area,
+        "الرمز البريدي للمستلم": _digits(rng, n, 5),
+        "هاتف المستلم": "01" + _digits(rng, n, 9),
+        "موبايل المستلم": "01" + _digits(rng, n, 9),
+        "الوصف": _choice(rng, DESCRIPTIONS, n),
+        "الوزن": np.round(rng.uniform(0.2, 15, n), 1),
+        "عدد القطع": rng.integers(1, 6, n),
+        "قيمة الطرد": package_value,
+        "الرسوم": fees,
+        "صافي سعر الطرد": package_value - fees,
+        "القيمة الإجمالية": package_value,
+        "قيمة التسليم": delivery_value,
+        "الرسوم المحصلة": collected_fees,
+        "الرسوم المستحقة": fees,
+        "نوع الدفع": _choice(rng, ["يوجد تحصيل", "لا يوجد تحصيل"], n, [0.9, 0.1]),
+        "نوع السعر": _choice(rng, ["الشحن علي الراسل", "الشحن علي المستلم"], n, [0.7, 0.3]),
+        "نوع التسليم": _choice(rng, ["توصيل للمنزل", "استلام من الفرع"], n, [0.9, 0.1]),
+        "نوع المرتجع للراسل": _choice(rng, ["إرجاع للراسل", "لا يوجد"], n),
+        "مندوب الشحن": _choice(rng, AGENTS, n),
+        "تم التحصيل": np.where(collected, "نعم", "لا").astype(object),
+        "تم السداد للعميل": np.where(collected, _yes_no(rng, n, 0.6), "لا").astype(object),
+        "ملاحظات": np.where(rng.random(n) < 0.1, "اتصال قبل التوصيل", None),
+        "امكانية فتح الطرد": _yes_no(rng, n, 0.5),
+        "العميل": client,
+        "سبب الإرجاع": np.where(returned, _choice(rng, RETURN_REASONS, n), None),
+        "نوع الطلب": _choice(rng, ["شحن", "استبدال"], n, [0.95, 0.05]),
+        "تاريخ التسليم/الإلغاء": closed,
+        "قيمة المرتجع": return_value,
+        "عدد المحاولات": rng.integers(1, 4, n),
+        "تاريخ التوصيل": np.where(delivered, moved, pd.NaT),
+        "تم الإلغاء": np.where(cancelled, "نعم", "لا").astype(object),
+        "تاريخ أخر حركة": moved,
+        "سداد مستحقات العملاء": _yes_no(rng, n, 0.5),
+    }
+    df = pd.DataFrame({column: data[column] for column in COLUMNS})
+
+    if nan_rate:
+        for column in COLUMNS:
+            if column not in KEY_COLUMNS:
+                df[column] = df[column].mask(rng.random(n) < nan_rate)
+    return df
+
+
+def write_workbook(df: pd.DataFrame, path: str):
+    df.to_excel(path, index=False, engine="openpyxl")
+    return path
+
+
+def cached_workbook(directory: str, kind: str, rows: int, seed: int = 42,
+                    duplicate_rate: float = 0.0, nan_rate: float = 0.0):
+    """Path of the workbook for these parameters under `directory`, generated on first use."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{kind}_{rows}_s{seed}_d{duplicate_rate}_n{nan_rate}.xlsx")
+    if not os.path.exists(path):
+        print(f"⏳ Generating {path}...")
+        write_workbook(generate(kind, rows, seed, duplicate_rate, nan_rate), path)
+    return path
+
+
+if __name__ == "__main__":
+    arguments = argparse.ArgumentParser(description="Write a synthetic shipment or payment workbook")
+    arguments.add_argument("kind", choices=sorted(STATUS_WEIGHTS))
+    arguments.add_argument("rows", type=int)
+    arguments.add_argument("--seed", type=int, default=42)
+    arguments.add_argument("--duplicates", type=float, default=0.0, help="share of rows reusing an earlier code")
+    arguments.add_argument("--nan", type=float, default=0.0, help="share of blank cells outside key columns")
+    arguments.add_argument("-o", "--output", help="defaults to <kind>_<rows>.xlsx")
+    options = arguments.parse_args()
+
+    output = options.output or f"{options.kind}_{options.rows}.xlsx"
+    print(f"⏳ Generating {options.rows} {options.kind} rows...")
+    frame = generate(options.kind, options.rows, options.seed, options.duplicates, options.nan)
+    print(f"⏳ Writing {output}...")
+    write_workbook(frame, output)
+    print(f"✅ Wrote {len(frame)} rows to {output}")
@@ -0,0 +1,53 @@
+import io
+import pandas as pd
+from fastapi.testclient import TestClient
+from main import app
+import analytics
+
+client = TestClient(app)
+
+
+def _workbook():
+    buffer = io.BytesIO()
+    pd.DataFrame([
+        {"الكود": f"AN-{i}", "العميل": "Analytics Client", "الحالة": "مرتجع" if i == 0 else "تم التسليم",
+         "الفرع": "AN", "مندوب الشحن": "AN Agent", "قيمة الطرد": 100.0, "الرسوم": 10.0 + i,
+         "الرمز البريدي للراسل": 12345, "التاريخ": "2026-02-0" + str(i + 1)}
+        for i in range(3)
+    ]).to_excel(buffer, index=False)
+    return {"file": ("analytics.xlsx", buffer.getvalue(), "application/octet-stream")}
+
+
+def _query(name, **params):
+    response = client.get(f"/analytics/payments/{name}", params=params)
+    assert response.status_code == 200, response.text
+    return response.json()["rows"]
+
+
+def test_payment_uploads_are_queryable_until_deleted(monkeypatch):
+    file_id = client.post("/payments/upload", files=_workbook()).json()["file_id"]
+
+    assert _query("fees_by_branch_month", branch="AN") == [{
+        "branch": "AN", "month": "2026-02", "records": 3, "package_value": 300.0,
+        "fees": 33.0, "due_fees": None, "collected_fees": None,
+    }]
+    agents = _query("return_rate_by_agent", branch="AN")
+    assert agents[0]["shipping_agent"] == "AN Agent"
+    assert (agents[0]["returned"], agents[0]["return_rate"]) == (1, round(1 / 3, 4))
+    assert _query("status_by_month", branch="AN", from_month="2999-01") == []
+
+    # A read between the delete committing and the parquet file going away
+    remove_payment_file = analytics.remove_payment_file
+
+    def read_then_remove(*args, **kwargs):
+        _query("fees_by_branch_month", branch="AN")
+        remove_payment_file(*args, **kwargs)
+
+    monkeypatch.setattr(analytics, "remove_payment_file", read_then_remove)
+    client.delete(f"/payments/files/{file_id}")
+    assert _query("fees_by_branch_month", branch="AN") == []
+
+
+def test_unknown_query_and_bad_month_are_rejected():
+    assert client.get("/analytics/payments/drop_everything").status_code == 404
+    assert client.get("/analytics/payments/status_by_month", params={"from_month": "March"}).status_code == 400
@@ -0,0 +1,68 @@
+import io
+import pandas as pd
+from fastapi.testclient import TestClient
+from main import app
+from database import SessionLocal, Shipment
+import main
+
+client = TestClient(app)
+
+
+def _upload(rows):
+    buffer = io.BytesIO()
+    pd.DataFrame([{"الكود": code, "العميل": "Bulk Client", "الحالة": status} for code, status in rows]).to_excel(buffer, index=False)
+    return client.post("/upload", files={"file": ("bulk.xlsx", buffer.getvalue(), "x")}).json()["file_id"]
+
+
+def _change_versions(*codes):
+    db = SessionLocal()
+    try:
+        return dict(db.query(Shipment.shipment_code, Shipment.change_version).filter(Shipment.shipment_code.in_(codes)))
+    finally:
+        db.close()
+
+
+def _statuses(code):
+    return [event["status"] for event in client.get(f"/shipments/{code}/history").json()["history"]]
+
+
+def test_bulk_update_reports_an_outcome_per_distinct_code():
+    file_id = _upload([("BULK-1", "طلب الشحن"), ("BULK-2", "قيد التوصيل"), ("BULK-3", "تم الاستلام بالمخزن")])
+    before = _change_versions("BULK-1", "BULK-2", "BULK-3")
+
+    body = client.patch("/shipments/status", json={
+        "codes": ["BULK-1", "BULK-MISSING", "BULK-2", "BULK-1", "", "BULK-3"], "new_status": "مرتجع"
+    }).json()
+    assert (body["updated"], body["not_found"], body["not_changeable"]) == (2, 1, 1)
+    assert [(r["shipment_code"], r["outcome"], r["old_status"]) for r in body["results"]] == [
+        ("BULK-1", "updated", "طلب الشحن"),
+        ("BULK-MISSING", "not_found", None),
+        ("BULK-2", "not_changeable", "قيد التوصيل"),
+        ("BULK-3", "updated", "تم الاستلام بالمخزن"),
+    ]
+
+    # Updated shipments get a history row and a newer change version; the others are untouched
+    assert _statuses("BULK-1") == ["طلب الشحن", "مرتجع"]
+    assert _statuses("BULK-3") == ["تم الاستلام بالمخزن", "مرتجع"]
+    assert _statuses("BULK-2") == ["قيد التوصيل"]
+    after = _change_versions("BULK-1", "BULK-2", "BULK-3")
+    assert after["BULK-1"] == after["BULK-3"] > before["BULK-1"]
+    assert after["BULK-2"] == before["BULK-2"]
+
+    client.delete(f"/upload/files/{file_id}")
+
+
+def test_bulk_update_limits_distinct_codes(monkeypatch):
+    monkeypatch.setattr(main, "MAX_BULK_STATUS_CODES", 2)
+
+    # Repeats count once
+    response = client.patch("/shipments/status", json={"codes": ["LIMIT-1", "LIMIT-2", "LIMIT-1"], "new_status": "مرتجع"})
+    assert response.status_code == 200
+    assert response.json()["not_found"] == 2
+
+    response = client.patch("/shipments/status", json={"codes": ["LIMIT-1", "LIMIT-2", "LIMIT-3"], "new_status": "مرتجع"})
+    assert response.status_code == 400
+    assert "Maximum is 2" in response.json()["detail"]
+
+    assert client.patch("/shipments/status", json={"codes": ["LIMIT-1"], "new_status": "طلب الشحن"}).status_code == 400
+    assert client.patch("/shipments/status", json={"codes": ["", ""], "new_status": "مرتجع"}).status_code == 400
@@ -0,0 +1,66 @@
+import io
+import pandas as pd
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from main import app
+from dialects import SQLiteOps
+
+client = TestClient(app)
+
+
+def _upload(prefix, count):
+    buffer = io.BytesIO()
+    pd.DataFrame([
+        {"الكود": f"{prefix}-{i}", "العميل": "Sync Client", "الحالة": "طلب الشحن"} for i in range(count)
+    ]).to_excel(buffer, index=False)
+    return client.post("/upload", files={"file": (f"{prefix}.xlsx", buffer.getvalue(), "x")}).json()
+
+
+def _sync(since="0", limit=1000):
+    """Every change after `since`, following has_more; returns (changes, next cursor)."""
+    changes = []
+    while True:
+        body = client.get("/shipments/changes", params={"since": since, "limit": limit}).json()
+        changes += body["changes"]
+        since = body["next_since"]
+        if not body["has_more"]:
+            return changes, since
+
+
+def test_changes_since_a_cursor_are_only_the_delta():
+    _, since = _sync()
+
+    upload = _upload("SYNC", 5)
+
+    # One upload is one version; small pages still split it without losing rows
+    changes, since = _sync(since, limit=2)
+    assert [(c["op"], c["shipment"]["الكود"]) for c in changes] == [("upsert", f"SYNC-{i}") for i in range(5)]
+
+    client.patch("/shipments/SYNC-2/status", params={"new_status": "مرتجع"})
+    client.delete("/shipments/SYNC-3")
+    changes, since = _sync(since)
+    assert [(c["op"], c["shipment"]["الكود"]) for c in changes] == [("upsert", "SYNC-2"), ("delete", "SYNC-3")]
+    assert changes[0]["shipment"]["الحالة"] == "مرتجع"
+
+    client.delete(f"/upload/files/{upload['file_id']}")
+    changes, since = _sync(since)
+    assert sorted(c["shipment"]["الكود"] for c in changes if c["op"] == "delete") == ["SYNC-0", "SYNC-1", "SYNC-2", "SYNC-4"]
+    assert _sync(since)[0] == []
+
+    assert client.get("/shipments/changes", params={"since": "latest"}).status_code == 400
+
+
+def test_changes_held_back_by_the_horizon_show_up_once_it_moves(monkeypatch):
+    _, since = _sync()
+    held_at = int(since.split(".")[0])
+
+    # An unrelated transaction still running: the upload's version isn't final yet
+    monkeypatch.setattr(SQLiteOps, "change_horizon", lambda self: text(f"SELECT {held_at}"))
+    upload = _upload("HELD", 2)
+    assert _sync(since) == ([], since)
+
+    # It finishes without touching shipments; the same cursor now gets the upload
+    monkeypatch.undo()
+    changes, _ = _sync(since)
+    assert [c["shipment"]["الكود"] for c in changes] == ["HELD-0", "HELD-1"]
+    client.delete(f"/upload/files/{upload['file_id']}")
@@ -0,0 +1,97 @@
+import io
+import os
+import threading
+import time
+import pandas as pd
+from fastapi.testclient import TestClient
+from main import app
+import events
+
+client = TestClient(app)
+
+
+def _parse(body):
+    """SSE messages as dicts of their fields, comments and id-only messages skipped."""
+    messages = []
+    for block in body.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if line and not line.startswith(":"))
+        if "event" in fields:
+            messages.append(fields)
+    return messages
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def _listening():
+    """Starts this worker's listener and waits until it sees new events."""
+    events._ensure_listener()
+
+    def marker_seen():
+        events.publish("ready")
+        time.sleep(0.05)
+        return any(event.type == "ready" for event in list(events._recent))
+    _wait_for(marker_seen)
+
+
+def _stream_while(action, last_event_type, monkeypatch):
+    """Body of an /events stream open while `action` runs, ended once `last_event_type` arrives."""
+    _listening()
+    subscribed = set(events._subscribers)
+    result = {}
+    reader = threading.Thread(target=lambda: result.update(response=client.get("/events")))
+    with monkeypatch.context() as patch:
+        patch.setattr(events, "EVENTS_STREAM_SECONDS", 10)  # upper bound, the stream is ended below
+        reader.start()
+        _wait_for(lambda: events._subscribers - subscribed)
+    stream = next(iter(events._subscribers - subscribed))
+
+    action()
+    _wait_for(lambda: any(event.type == last_event_type for event in list(events._recent)))
+    stream.offer(None)  # queued behind the events already handed to it
+    reader.join()
+    return result["response"]
+
+
+def test_status_change_is_streamed_to_open_clients(monkeypatch):
+    upload = {}
+
+    def change_status():
+        buffer = io.BytesIO()
+        pd.DataFrame([{"الكود": "EVENTS-1", "العميل": "Events Client", "الحالة": "طلب الشحن"}]).to_excel(buffer, index=False)
+        upload.update(client.post("/upload", files={"file": ("events.xlsx", buffer.getvalue(), "x")}).json())
+        client.patch("/shipments/EVENTS-1/status", params={"new_status": "مرتجع"})
+        client.delete(f"/upload/files/{upload['file_id']}")
+
+    response = _stream_while(change_status, "file_deleted", monkeypatch)
+    assert response.headers["content-type"].startswith("text/event-stream")
+    messages = _parse(response.text)
+    assert [m["event"] for m in messages] == ["upload_completed", "status_changed", "file_deleted"]
+    assert '"codes": ["EVENTS-1"]' in messages[1]["data"]
+
+    # Reconnecting after the first event replays the rest; an unknown id asks for a resync
+    replayed = _parse(client.get("/events", headers={"Last-Event-ID": messages[0]["id"]}).text)
+    assert [m["event"] for m in replayed] == ["status_changed", "file_deleted"]
+    assert [m["event"] for m in _parse(client.get("/events", headers={"Last-Event-ID": "gone"}).text)] == ["resync"]
+
+
+def test_listener_reads_every_event_across_a_log_rotation(monkeypatch):
+    _listening()
+    line_size = len(events.json.dumps({"id": "0" * 16, "type": "rotation", "data": {"n": 10}})) + 1
+    monkeypatch.setattr(events, "EVENTS_LOG_MAX_BYTES", os.path.getsize(events.EVENT_LOG_PATH) + 25 * line_size)
+
+    publishers = [
+        threading.Thread(target=lambda start=start: [events.publish("rotation", n=n) for n in range(start, start + 10)])
+        for start in range(10, 50, 10)
+    ]
+    for publisher in publishers:
+        publisher.start()
+    for publisher in publishers:
+        publisher.join()
+
+    _wait_for(lambda: len({event.data["n"] for event in list(events._recent) if event.type == "rotation"}) == 40)
+    assert os.path.exists(events.EVENT_LOG_PATH + ".1")
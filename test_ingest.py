@@ -0,0 +1,71 @@
+import io
+import logging
+import threading
+import pandas as pd
+from fastapi.testclient import TestClient
+from main import app
+import ingest
+import main
+
+client = TestClient(app)
+
+
+def _workbook():
+    buffer = io.BytesIO()
+    pd.DataFrame([{"الكود": "INGEST-1", "العميل": "Ingest Client", "الحالة": "جديد"}]).to_excel(buffer, index=False)
+    return {"file": ("ingest.xlsx", buffer.getvalue(), "application/octet-stream")}
+
+
+def test_full_ingest_queue_is_refused_with_retry_after(monkeypatch):
+    full = threading.BoundedSemaphore(1)
+    full.acquire()
+    monkeypatch.setattr(ingest, "_admitted", full)
+
+    for path in ("/upload", "/payments/upload"):
+        response = client.post(path, files=_workbook())
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == str(ingest.INGEST_RETRY_AFTER)
+
+    # Reads aren't affected
+    assert client.get("/health").status_code == 200
+
+
+def test_upload_runs_in_the_ingest_pool(monkeypatch):
+    threads = []
+    original = ingest.run
+
+    async def run(kind, func, *args):
+        def wrapped(*args):
+            threads.append(threading.current_thread().name)
+            return func(*args)
+        return await original(kind, wrapped, *args)
+
+    monkeypatch.setattr(ingest, "run", run)
+    response = client.post("/upload", files=_workbook())
+    assert response.json()["status"] == "success", response.text
+    client.delete(f"/upload/files/{response.json()['file_id']}")
+    assert threads and threads[0].startswith("ingest")
+    assert ingest._pending == 0
+
+
+def test_uploaded_shipments_keep_the_sheet_order():
+    codes = ["ORDER-C", "ORDER-A", "ORDER-B"]
+    buffer = io.BytesIO()
+    pd.DataFrame([{"الكود": code, "العميل": "Order Client", "الحالة": "جديد"} for code in codes]).to_excel(buffer, index=False)
+    file_id = client.post("/upload", files={"file": ("order.xlsx", buffer.getvalue(), "x")}).json()["file_id"]
+
+    rows = client.get(f"/shipments/file/{file_id}").json()["data"]
+    assert [row["الكود"] for row in rows] == codes
+    client.delete(f"/upload/files/{file_id}")
+
+
+def test_payment_upload_logs_insert_progress_at_debug(monkeypatch, caplog):
+    monkeypatch.setattr(main, "PROGRESS_LOG_EVERY", 2)
+    caplog.set_level(logging.DEBUG, logger="main")
+    buffer = io.BytesIO()
+    pd.DataFrame([{"الكود": f"PROGRESS-{i}", "العميل": "Progress Client", "المستحق": 1.0} for i in range(3)]).to_excel(buffer, index=False)
+    file_id = client.post("/payments/upload", files={"file": ("progress.xlsx", buffer.getvalue(), "x")}).json()["file_id"]
+
+    progress = [(r.rows, r.total) for r in caplog.records if r.getMessage() == "payment rows inserted"]
+    assert progress == [(2, 3), (3, 3)]
+    client.delete(f"/payments/files/{file_id}")
@@ -0,0 +1,143 @@
+"""
+Query budgets for every route in main.py, on a small seeded database.
+
+A budget is the most SQL statements and fetched rows one call may use. The seed has
+several files per kind, so a per-file or per-row query loop (N+1) blows the budget.
+New routes must be added to ROUTE_BUDGETS.
+"""
+import io
+import pandas as pd
+import pytest
+from fastapi.routing import APIRoute
+from fastapi.testclient import TestClient
+from main import app
+import http_cache
+import profiling
+
+FILES = 3           # files seeded per kind
+ROWS_PER_FILE = 4
+DAY = "2026-01-15"
+
+# (method, route template): (path, request kwargs, max queries, max rows fetched)
+ROUTE_BUDGETS = {
+    ("GET", "/health"): ("/health", {}, 0, 0),
+    ("GET", "/metrics"): ("/metrics", {}, 0, 0),
+    ("GET", "/statuses"): ("/statuses", {}, 0, 0),
+    ("GET", "/shipments"): ("/shipments", {"params": {"limit": 50}}, 2, 17),
+    ("GET", "/shipments/days"): ("/shipments/days", {}, 1, 1),
+    ("GET", "/shipments/by-day"): ("/shipments/by-day", {"params": {"date": DAY}}, 1, 16),
+    ("GET", "/shipments/search"): ("/shipments/search", {"params": {"query": "QB"}}, 1, 16),
+    ("GET", "/shipments/changes"): ("/shipments/changes", {"params": {"limit": 5}}, 3, 13),
+    ("GET", "/shipments/status-aging"): ("/shipments/status-aging", {}, 1, 1),
+    ("GET", "/shipments/{shipment_code}/history"): ("/shipments/QB0-0/history", {}, 2, 2),
+    ("GET", "/upload/files"): ("/upload/files", {}, 1, 4),
+    ("GET", "/shipments/file/{file_id}"): ("/shipments/file/{shipment_file}", {}, 3, 6),
+    ("GET", "/payments/files"): ("/payments/files", {}, 1, 4),
+    ("GET", "/payments/files/{file_id}/data"): ("/payments/files/{payment_file}/data", {}, 4, 7),
+    ("GET", "/payments/summary/month-to-date"): ("/payments/summary/month-to-date", {"params": {"month": DAY[:7]}}, 1, 1),
+    ("GET", "/payments/summary/trend"): ("/payments/summary/trend", {"params": {"start": DAY[:8] + "01", "end": DAY}}, 1, 1),
+    ("GET", "/clients/settlements"): ("/clients/settlements", {}, 2, 2),
+    ("GET", "/clients/settlements/{client_name}"): ("/clients/settlements/QB Client", {}, 1, 4),
+    ("POST", "/payments/files/{file_id}/reconcile"): ("/payments/files/{payment_file}/reconcile", {}, 5, 6),
+    ("GET", "/payments/files/{file_id}/reconciliation"): ("/payments/files/{payment_file}/reconciliation", {}, 3, 6),
+    ("GET", "/reconciliation/missing-payments"): ("/reconciliation/missing-payments", {}, 2, 1),
+    ("PATCH", "/shipments/{shipment_code}/status"): ("/shipments/QB0-1/status", {"params": {"new_status": "مرتجع"}}, 4, 2),
+    ("PATCH", "/shipments/status"): ("/shipments/status", {"json": {"codes": ["QB1-0", "QB1-1", "QB1-2"], "new_status": "تم التسليم"}}, 4, 7),
+    ("DELETE", "/shipments/{shipment_code}"): ("/shipments/QB2-0", {}, 5, 2),
+    ("POST", "/upload"): ("/upload", {"files": "shipments"}, 6, 6),
+    ("POST", "/payments/upload"): ("/payments/upload", {"files": "payments"}, 9, 4),
+    ("DELETE", "/upload/files/{file_id}"): ("/upload/files/{spare_shipment_file}", {}, 8, 4),
+    ("GET", "/analytics/payments"): ("/analytics/payments", {}, 0, 0),
+    ("GET", "/analytics/payments/{query_name}"): ("/analytics/payments/fees_by_branch_month", {}, 0, 0),
+    ("GET", "/events"): ("/events", {}, 0, 0),
+    ("GET", "/admin/profiles"): ("/admin/profiles", {"headers": "admin"}, 0, 0),
+    ("GET", "/admin/profiles/{profile_id}"): ("/admin/profiles/{profile}", {"headers": "admin"}, 0, 0),
+    ("DELETE", "/payments/files/{file_id}"): ("/payments/files/{spare_payment_file}", {}, 10, 4),
+}
+
+ADMIN_HEADERS = {"X-Profile-Token": profiling.PROFILING_TOKEN}
+XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _excel(rows):
+    buffer = io.BytesIO()
+    pd.DataFrame(rows).to_excel(buffer, index=False)
+    return {"file": ("budget.xlsx", buffer.getvalue(), XLSX)}
+
+
+def _shipment_rows(prefix):
+    return [
+        {"الكود": f"{prefix}-{i}", "العميل": "QB Client", "الحالة": "طلب الشحن",
+         "قيمة الطرد": 100 + i, "الرسوم": 10, "التاريخ": DAY}
+        for i in range(ROWS_PER_FILE)
+    ]
+
+
+def _payment_rows(prefix):
+    return [
+        {"الكود": f"{prefix}-{i}", "العميل": "QB Client", "الحالة": "تم التسليم", "الفرع": "QB",
+         "المستحق": 90.0 + i, "قيمة الطرد": 100.0 + i, "الرسوم المستحقة": 10.0, "التاريخ": DAY,
+         "تم التحصيل": "نعم", "تم السداد للعميل": "لا"}
+        for i in range(ROWS_PER_FILE)
+    ]
+
+
+@pytest.fixture(scope="module")
+def seeded():
+    client = TestClient(app)
+    ids = {}
+    for f in range(FILES):
+        ids["shipment_file"] = client.post("/upload", files=_excel(_shipment_rows(f"QB{f}"))).json()["file_id"]
+        ids["payment_file"] = client.post("/payments/upload", files=_excel(_payment_rows(f"QB{f}"))).json()["file_id"]
+    ids["spare_shipment_file"] = client.post("/upload", files=_excel(_shipment_rows("QBX"))).json()["file_id"]
+    ids["spare_payment_file"] = client.post("/payments/upload", files=_excel(_payment_rows("QBX"))).json()["file_id"]
+    # A profiled read: gives /admin/profiles/{id} something to serve, and opens the
+    # async engine's connection now (its first-connect queries would otherwise
+    # count against whichever route runs first)
+    response = client.get("/payments/files", headers=ADMIN_HEADERS)
+    ids["profile"] = response.headers["x-profile-id"]
+    return client, ids
+
+
+def test_every_route_has_a_budget():
+    routes = {
+        (method, route.path)
+        for route in app.routes if isinstance(route, APIRoute)
+        for method in route.methods
+    }
+    assert routes - set(ROUTE_BUDGETS) == set(), "add the new routes to ROUTE_BUDGETS"
+    assert set(ROUTE_BUDGETS) - routes == set(), "remove routes that no longer exist"
+
+
+@pytest.mark.parametrize("route", list(ROUTE_BUDGETS), ids=lambda route: f"{route[0]} {route[1]}")
+def test_route_query_budget(route, seeded, query_budget):
+    client, ids = seeded
+    method, _ = route
+    path, kwargs, max_queries, max_rows = ROUTE_BUDGETS[route]
+    kwargs = dict(kwargs)
+    if kwargs.get("files") == "shipments":
+        kwargs["files"] = _excel(_shipment_rows("QBNEW"))
+    elif kwargs.get("files") == "payments":
+        kwargs["files"] = _excel(_payment_rows("QBNEW"))
+    if kwargs.get("headers") == "admin":
+        kwargs["headers"] = ADMIN_HEADERS
+
+    http_cache.clear()  # measure the handler, not the response cache
+    with query_budget(max_queries=max_queries, max_rows=max_rows):
+        response = client.request(method, path.format(**ids), **kwargs)
+    assert response.status_code < 400, response.text
+
+
+def test_profiled_request_records_sql_and_stacks(seeded):
+    client, ids = seeded
+    response = client.get(f"/payments/files/{ids['payment_file']}/data", headers=ADMIN_HEADERS)
+    assert response.status_code == 200
+    profile = client.get(f"/admin/profiles/{response.headers['x-profile-id']}", headers=ADMIN_HEADERS).json()
+    assert profile["sql_count"] == len(profile["sql"]) > 0
+    assert profile["path"] == f"/payments/files/{ids['payment_file']}/data"
+
+    folded = client.get(f"/admin/profiles/{profile['id']}", params={"format": "folded"}, headers=ADMIN_HEADERS)
+    assert folded.status_code == 200
+
+    assert "x-profile-id" not in client.get("/health").headers
+    assert client.get("/admin/profiles").status_code == 403
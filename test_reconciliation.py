@@ -0,0 +1,85 @@
+import io
+import pandas as pd
+from fastapi.testclient import TestClient
+from main import app
+from database import SessionLocal, Shipment, PaymentRecord, ReconciliationResult
+import reconciliation
+
+client = TestClient(app)
+
+
+def _workbook(rows):
+    buffer = io.BytesIO()
+    pd.DataFrame(rows).to_excel(buffer, index=False)
+    return {"file": ("reconciliation.xlsx", buffer.getvalue(), "x")}
+
+
+def _upload(path, rows):
+    return client.post(path, files=_workbook(rows)).json()["file_id"]
+
+
+def _reconcile(payment_file_id):
+    db = SessionLocal()
+    try:
+        summary = reconciliation.reconcile_payment_file(db, payment_file_id)
+        db.commit()
+        results = dict(
+            db.query(ReconciliationResult.code, ReconciliationResult.category)
+            .filter(ReconciliationResult.payment_file_id == payment_file_id)
+        )
+        return summary, results
+    finally:
+        db.close()
+
+
+def _change(statement):
+    db = SessionLocal()
+    try:
+        statement(db)
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_reconciliation_classifies_codes_and_only_rewrites_changes():
+    shipment_file = _upload("/upload", [
+        {"الكود": "REC-1", "العميل": "Rec Client", "الحالة": "طلب الشحن", "قيمة الطرد": 100.0},
+        {"الكود": "REC-2", "العميل": "Rec Client", "الحالة": "طلب الشحن", "قيمة الطرد": 50.0},
+    ])
+    payment_file = _upload("/payments/upload", [
+        {"الكود": "REC-1", "العميل": "Rec Client", "قيمة الطرد": 100.004},  # within the tolerance
+        {"الكود": "REC-2", "العميل": "Rec Client", "قيمة الطرد": 70.0},
+        {"الكود": "REC-3", "العميل": "Rec Client", "قيمة الطرد": 10.0},
+    ])
+
+    summary, results = _reconcile(payment_file)
+    assert results == {"REC-1": "matched", "REC-2": "amount_mismatch", "REC-3": "orphan_payment"}
+    assert summary["counts"] == {"matched": 1, "amount_mismatch": 1, "orphan_payment": 1}
+    assert (summary["inserted"], summary["updated"], summary["removed"], summary["unchanged"]) == (3, 0, 0, 0)
+
+    # Same inputs: nothing is rewritten
+    summary, _ = _reconcile(payment_file)
+    assert (summary["inserted"], summary["updated"], summary["removed"], summary["unchanged"]) == (0, 0, 0, 3)
+
+    # The shipment's amount is corrected: only that code is rewritten
+    _change(lambda db: db.query(Shipment).filter(Shipment.shipment_code == "REC-2").update({"amount": 70.0}))
+    summary, results = _reconcile(payment_file)
+    assert (summary["updated"], summary["unchanged"]) == (1, 2)
+    assert results["REC-2"] == "matched"
+
+    # A code that left the payment file loses its stored result
+    _change(lambda db: db.query(PaymentRecord).filter(PaymentRecord.code == "REC-3").update({"code": None}))
+    summary, results = _reconcile(payment_file)
+    assert (summary["removed"], summary["unchanged"]) == (1, 2)
+    assert set(results) == {"REC-1", "REC-2"}
+
+    client.delete(f"/payments/files/{payment_file}")
+    client.delete(f"/upload/files/{shipment_file}")
+
+
+def test_per_file_results_reject_missing_payment_category():
+    file_id = _upload("/payments/upload", [{"الكود": "REC-MISSING", "العميل": "Rec Client", "المستحق": 1.0}])
+    response = client.get(f"/payments/files/{file_id}/reconciliation", params={"category": "missing_payment"})
+    assert response.status_code == 400
+    assert "/reconciliation/missing-payments" in response.json()["detail"]
+    client.delete(f"/payments/files/{file_id}")
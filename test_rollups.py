@@ -0,0 +1,35 @@
+import io
+import pandas as pd
+from fastapi.testclient import TestClient
+from main import app
+from database import SessionLocal, PaymentDailyRollup
+
+client = TestClient(app)
+DAY = "2031-03-04"
+
+
+def _upload(amount):
+    buffer = io.BytesIO()
+    # No branch: a NULL field in the rollup key
+    pd.DataFrame([{"الكود": "ROLLUP-1", "العميل": "Rollup Client", "الحالة": "تم التسليم",
+                   "المستحق": amount, "التاريخ": DAY}]).to_excel(buffer, index=False)
+    return client.post("/payments/upload", files={"file": ("rollup.xlsx", buffer.getvalue(), "x")}).json()["file_id"]
+
+
+def _rollups():
+    db = SessionLocal()
+    try:
+        return [(r.record_count, r.amount_due) for r in db.query(PaymentDailyRollup).filter(PaymentDailyRollup.client_name == "Rollup Client")]
+    finally:
+        db.close()
+
+
+def test_uploads_hitting_the_same_new_key_share_one_rollup_row():
+    first, second = _upload(10.0), _upload(5.0)
+    assert _rollups() == [(2, 15.0)]
+
+    client.delete(f"/payments/files/{first}")
+    assert _rollups() == [(1, 5.0)]
+    client.delete(f"/payments/files/{second}")
+    assert _rollups() == []
+
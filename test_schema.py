@@ -0,0 +1,39 @@
+from datetime import datetime
+import pandas as pd
+import pytest
+from database import Shipment
+import schema
+
+
+def test_ingest_converts_whole_columns():
+    df = pd.DataFrame({
+        "الكود": [12345, "AB-1", None],
+        "التاريخ": ["28/12/2025", "not a date", None],
+        "قيمة الطرد": [100, "n/a", None],
+        "عدد القطع": [2.7, None, 3],
+        "عمود إضافي": ["ignored", "ignored", "ignored"],
+    })
+
+    shipments = schema.SHIPMENTS.ingest(df)
+    assert [row["shipment_code"] for row in shipments] == ["12345", "AB-1", None]
+    assert [row["date"] for row in shipments] == [datetime(2025, 12, 28), None, None]
+    assert [row["amount"] for row in shipments] == [100.0, 0, 0]
+    assert [row["pieces_count"] for row in shipments] == [2, 0, 3]
+    assert shipments[0]["client_name"] is None and shipments[0]["weight"] == 0
+
+    payments = schema.PAYMENTS.ingest(df, file_id=7)
+    assert [row["package_value"] for row in payments] == [100.0, None, None]
+    assert {row["file_id"] for row in payments} == {7}
+    assert len(payments[0]) == len(schema.PAYMENTS.fields) + 1
+
+
+def test_serializer_and_model_must_agree():
+    shipment = Shipment(shipment_code="S-1", date=datetime(2026, 1, 2), client_name="C", amount=5.0)
+    assert schema.shipment_brief(shipment) == {
+        "الكود": "S-1", "التاريخ": "2026-01-02 00:00:00", "العميل": "C",
+        "الحالة": None, "المستلم": None, "قيمة الطرد": 5.0,
+    }
+
+    # Shipment.shipment_code is stored as "الكود"
+    with pytest.raises(ValueError):
+        schema.Schema(Shipment, [("رقم الشحنة", "shipment_code")])
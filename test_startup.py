@@ -0,0 +1,27 @@
+import json
+import subprocess
+import sys
+
+# Generous on purpose: the import takes about 1 s here, pandas alone adds ~1 s
+IMPORT_BUDGET_SECONDS = 3.0
+HEAVY_MODULES = ("pandas", "numpy", "openpyxl", "pyarrow", "duckdb")
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter() - start
+print(json.dumps({"seconds": imported, "modules": sorted(m for m in %r if m in sys.modules)}))
+""" % (HEAVY_MODULES,)
+
+
+def test_importing_the_app_is_fast_and_skips_heavy_libraries():
+    # A fresh interpreter: the test session itself has imported everything
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE], capture_output=True, text=True, timeout=60,
+        env={"DATABASE_URL": "sqlite://", "PATH": ""},
+    )
+    assert result.returncode == 0, result.stderr
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+    assert probe["modules"] == [], f"imported at startup: {probe['modules']}"
+    assert probe["seconds"] < IMPORT_BUDGET_SECONDS, probe
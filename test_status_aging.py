@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from main import app
+from database import SessionLocal, Shipment, ShipmentStatusEvent
+import status_history
+
+client = TestClient(app)
+T0 = datetime(2020, 1, 1)
+CANCELLED, IN_WAREHOUSE, OUT_FOR_DELIVERY = "ملغى", "تم الاستلام بالمخزن", "قيد التوصيل"
+
+# shipment -> [(status, hours after T0)]; each stint lasts until the next event
+HISTORIES = {
+    "AGING-1": [(CANCELLED, 0), (IN_WAREHOUSE, 2), (OUT_FOR_DELIVERY, 2 + 5 * 24)],
+    "AGING-2": [(CANCELLED, 0), (IN_WAREHOUSE, 10 * 24), (OUT_FOR_DELIVERY, 30 * 24)],
+}
+
+
+def _seed():
+    db = SessionLocal()
+    try:
+        for code, events in HISTORIES.items():
+            shipment = Shipment(shipment_code=code, status=events[-1][0])
+            db.add(shipment)
+            db.flush()
+            for status, hours in events:
+                status_history.record(db, [(shipment.id, status)], changed_at=T0 + timedelta(hours=hours))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _cleanup():
+    db = SessionLocal()
+    try:
+        ids = [id for (id,) in db.query(Shipment.id).filter(Shipment.shipment_code.in_(HISTORIES))]
+        db.query(ShipmentStatusEvent).filter(ShipmentStatusEvent.shipment_id.in_(ids)).delete(synchronize_session=False)
+        db.query(Shipment).filter(Shipment.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _aging(**params):
+    response = client.get("/shipments/status-aging", params=params)
+    assert response.status_code == 200, response.text
+    return {row["status"]: row for row in response.json()["data"]}
+
+
+def test_dwell_times_and_aging_buckets_follow_the_history():
+    _seed()
+    try:
+        cancelled = _aging(status=CANCELLED)[CANCELLED]
+        assert (cancelled["stints"], cancelled["current"]) == (2, 0)
+        assert (cancelled["avg_hours"], cancelled["max_hours"]) == (121.0, 240.0)
+        assert cancelled["aging"] == {"<1d": 1, "<3d": 0, "<7d": 0, "<14d": 1, "<30d": 0, ">=30d": 0}
+
+        warehouse = _aging(status=IN_WAREHOUSE)[IN_WAREHOUSE]
+        assert (warehouse["stints"], warehouse["avg_hours"], warehouse["max_hours"]) == (2, 300.0, 480.0)
+        assert warehouse["aging"] == {"<1d": 0, "<3d": 0, "<7d": 1, "<14d": 0, "<30d": 1, ">=30d": 0}
+
+        # Still out for delivery since 2020: open stints run until now
+        delivering = _aging(status=OUT_FOR_DELIVERY)[OUT_FOR_DELIVERY]
+        assert (delivering["stints"], delivering["current"], delivering["aging"][">=30d"]) == (2, 2, 2)
+
+        # Only events from `since` on count
+        since = _aging(status=IN_WAREHOUSE, since="2020-01-02")
+        assert since[IN_WAREHOUSE]["stints"] == 1
+        assert since[IN_WAREHOUSE]["max_hours"] == 480.0
+        assert _aging(status=CANCELLED, since="2020-01-02") == {}
+
+        assert client.get("/shipments/status-aging", params={"since": "02/01/2020"}).status_code == 400
+    finally:
+        _cleanup()
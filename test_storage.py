@@ -0,0 +1,69 @@
+import io
+import os
+from datetime import datetime, timedelta
+import pandas as pd
+from fastapi.testclient import TestClient
+from main import app
+from database import SessionLocal, StoredBlob
+import storage
+
+client = TestClient(app)
+
+
+def _workbook():
+    buffer = io.BytesIO()
+    pd.DataFrame([{
+        "الكود": "ST-1", "العميل": "Storage Client", "الحالة": "تم التسليم", "الفرع": "ST",
+        "المستحق": 90.0, "قيمة الطرد": 100.0, "التاريخ": "2026-02-01",
+    }]).to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def _blob(blob_hash):
+    db = SessionLocal()
+    try:
+        return db.get(StoredBlob, blob_hash)
+    finally:
+        db.close()
+
+
+def test_same_upload_is_stored_once_and_collected_when_unreferenced():
+    contents = _workbook()
+    blob_hash = storage.content_hash(contents)
+    files = {"file": ("storage.xlsx", contents, "application/octet-stream")}
+    first = client.post("/payments/upload", files=files).json()["file_id"]
+    second = client.post("/payments/upload", files=files).json()["file_id"]
+    assert _blob(blob_hash).ref_count == 2
+    assert storage.read(blob_hash) == contents
+
+    client.delete(f"/payments/files/{first}")
+    storage.collect_garbage()
+    assert _blob(blob_hash).ref_count == 1
+
+    client.delete(f"/payments/files/{second}")
+    blob = _blob(blob_hash)
+    assert blob.ref_count == 0 and blob.released_at is not None
+
+    # Kept for the retention period, then deleted
+    storage.collect_garbage()
+    assert os.path.exists(storage.blob_path(blob_hash))
+    storage.collect_garbage(now=datetime.utcnow() + timedelta(days=storage.STORAGE_RETENTION_DAYS + 1))
+    assert _blob(blob_hash) is None
+    assert not os.path.exists(storage.blob_path(blob_hash))
+
+
+def test_cold_blobs_are_compressed():
+    contents = b"cold workbook " * 1000
+    db = SessionLocal()
+    try:
+        blob_hash = storage.store(db, contents)
+        db.get(StoredBlob, blob_hash).created_at = datetime.utcnow() - timedelta(days=storage.STORAGE_COMPRESS_AFTER_DAYS + 1)
+        db.commit()
+    finally:
+        db.close()
+
+    storage.collect_garbage()
+    blob = _blob(blob_hash)
+    assert blob.compression == "gzip" and blob.stored_size < blob.size
+    assert not os.path.exists(storage.blob_path(blob_hash))
+    assert storage.read(blob_hash) == contents